@@ -3,18 +3,75 @@ from import_export.admin import ExportMixin, ImportExportMixin
 from import_export.resources import ModelResource
 from import_export import fields
 from import_export.widgets import ManyToManyWidget, ForeignKeyWidget
-from .models import AccountRequest, File, Department, Course, Group, User, Admin, Instructor, Student, StudentCourse
+from import_export.instance_loaders import CachedInstanceLoader
+from .models import AccountRequest, File, Department, Course, Group, User, Admin, Instructor, Student, StudentCourse, ImportExportJob
+from .changelists import EstimatedCountPaginator, GroupListFilter, joined_names
+from .search import refresh_people
+from .stats import adjust_counter
+from .jobs import JOB_CHUNK_ROWS, enqueue_export, enqueue_import
 from django.contrib.auth.hashers import make_password
 from django.utils.html import format_html
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.contrib import messages
 from django import forms
 from django.core.mail import send_mail
+import os
 import random
+from collections import defaultdict
 
 # Register your models here.
 admin.site.site_title = "SSS Admin"
 admin.site.site_header = 'Student Services System'
 
+class BackgroundExportMixin:
+    """Adds an action that exports the selected rows to CSV with a run_jobs worker (admin_app.jobs)."""
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if self.has_export_permission(request):
+            actions['export_in_background'] = self.get_action('export_in_background')
+        return actions
+
+    @admin.action(description='Export selected rows in the background (CSV)')
+    def export_in_background(self, request, queryset):
+        job = enqueue_export(self.get_export_resource_classes(request)[0], queryset, request.user)
+        self.message_user(request, format_html(
+            'Export queued as <a href="{}">job #{}</a>; the CSV is ready to download there when it finishes.',
+            reverse('admin:admin_app_importexportjob_change', args=[job.pk]), job.pk,
+        ))
+
+class BackgroundImportExportMixin(BackgroundExportMixin):
+    """Adds a "Background import" page that queues the uploaded file as a job instead of importing it in the request."""
+    import_export_change_list_template = 'admin/admin_app/change_list_background_import.html'
+
+    def get_urls(self):
+        info = self.get_model_info()
+        return [
+            path('background-import/', self.admin_site.admin_view(self.background_import_view), name='%s_%s_background_import' % info),
+        ] + super().get_urls()
+
+    def background_import_view(self, request):
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+        form = self.create_import_form(request)
+        if request.method == 'POST' and form.is_valid():
+            input_format = self.get_import_formats()[int(form.cleaned_data['format'])]
+            resource_class = self.choose_import_resource_class(form, request)
+            job = enqueue_import(resource_class, input_format, form.cleaned_data['import_file'], request.user)
+            self.message_user(request, f"Import queued as job #{job.pk}.")
+            return redirect('admin:admin_app_importexportjob_change', job.pk)
+        return TemplateResponse(request, 'admin/admin_app/background_import.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'form': form,
+            'chunk_rows': JOB_CHUNK_ROWS,
+            'title': f"Background import: {self.opts.verbose_name_plural}",
+        })
+
 class FileAdminForm(forms.ModelForm):
     class Meta:
         model = File
@@ -34,13 +91,16 @@ class FileResource(ModelResource):
         fields = ('id', 'name', 'category', 'type', 'size', 'upload_by', 'upload_by__username', 'status', 'upload_date', 'course__name', 'file')
 
 @admin.register(File)
-class FileAdmin(ExportMixin, admin.ModelAdmin):
+class FileAdmin(BackgroundExportMixin, ExportMixin, admin.ModelAdmin):
     form = FileAdminForm
     resource_class = FileResource
     list_display = ('name', 'course__name' ,'category', 'type', 'get_human_readable_size', 'display_upload_by', 'status', 'upload_date', 'view_file')
     list_filter = ('status', 'type', 'upload_date', 'category')
     search_fields = ('name', 'upload_by__username', 'type', 'category')
     readonly_fields = ('name', 'category', 'size', 'type', 'upload_by', 'upload_date')
+    list_select_related = ('upload_by', 'course')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     class Media:
         js = ('js/validation.js',)
@@ -82,16 +142,22 @@ class CourseResource(ModelResource):
         fields = ('id', 'name', 'level', 'status', 'departments')
 
 @admin.register(Course)
-class CourseAdmin(ImportExportMixin, admin.ModelAdmin):
+class CourseAdmin(BackgroundImportExportMixin, ImportExportMixin, admin.ModelAdmin):
     resource_class = CourseResource
     list_display = ('id', 'name', 'name_initials' , 'level',  'list_departments', 'status',)
     list_filter = ('level', 'status')
     search_fields = ('name',)
     list_display_links = ('id', 'name', 'name_initials')
     ordering = ('id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # أسماء الأقسام تُجمع في نفس استعلام الجدول بدل استعلام لكل صف
+        return super().get_queryset(request).annotate(departments_names=joined_names('departments'))
 
     def list_departments(self, obj): # إرجاع أسماء الأقسام المرتبطة بالكورس
-        return ", ".join(department.name for department in obj.departments.all())
+        return obj.departments_names
     list_departments.short_description = 'Departments'  # تغيير عنوان العمود في الجدول
 
     def name_initials(self, obj):  # أخذ أول حرف من كل كلمة في اسم القسم
@@ -113,16 +179,22 @@ class DepartmentResource(ModelResource):
         fields = ('id', 'name', 'status')
 
 @admin.register(Department)
-class DepartmentAdmin(ImportExportMixin, admin.ModelAdmin):
+class DepartmentAdmin(BackgroundImportExportMixin, ImportExportMixin, admin.ModelAdmin):
     resource_class = DepartmentResource
     list_display = ('id', 'name', 'name_initials', 'list_courses', 'status') # إضافة دالة لعرض الكورسات
     list_filter = ('status',)
     search_fields = ('name', 'id')
     list_display_links = ('id', 'name', 'name_initials')
     ordering = ('id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # أسماء الكورسات تُجمع في نفس استعلام الجدول بدل استعلام لكل صف
+        return super().get_queryset(request).annotate(courses_names=joined_names('courses'))
 
     def list_courses(self, obj): # إرجاع أسماء الكورسات المرتبطة بالقسم
-        return ", ".join(course.name for course in obj.courses.all())
+        return obj.courses_names
     list_courses.short_description = 'Courses'  # تغيير عنوان العمود في الجدول
 
     def name_initials(self, obj): # أخذ أول حرف من كل كلمة في اسم القسم
@@ -141,7 +213,7 @@ class GroupResource(ModelResource):
         fields = ('id', 'name', 'status', 'level', 'department')
 
 @admin.register(Group)
-class GroupAdmin(ImportExportMixin, admin.ModelAdmin):
+class GroupAdmin(BackgroundImportExportMixin, ImportExportMixin, admin.ModelAdmin):
     resource_class = GroupResource
     list_display = ('name', 'level', 'department', 'status')
     list_filter = ('department', 'level', 'status')
@@ -289,21 +361,140 @@ class StudentResource(ModelResource):
             except Course.DoesNotExist:
                 raise ValueError(f"Course '{course_name}' does not exist.")
 
+class BulkStudentResource(StudentResource):
+    """
+    StudentResource for large intake spreadsheets: users, departments, groups
+    and courses are loaded into dictionaries once per import, every row is
+    validated against them without a query, and students and their courses
+    are written with bulk_create in batches of Meta.batch_size. The rules are
+    the same as StudentResource, but the student is matched to its user by
+    first and last name together, and an update row with an empty courses
+    cell keeps the student's current courses.
+    """
+
+    class Meta(StudentResource.Meta):
+        use_bulk = True
+        batch_size = 1000
+        skip_diff = True
+        instance_loader_class = CachedInstanceLoader
+
+    def before_import(self, dataset, **kwargs):
+        super().before_import(dataset, **kwargs)
+        self.departments = {department.name: department for department in Department.objects.all()}
+        self.groups = {(group.name, group.department.name, group.level): group for group in Group.objects.select_related('department')}
+        self.courses = {course.name: course for course in Course.objects.all()}
+        self.course_departments = defaultdict(set)  # اسم المادة: أسماء أقسامها
+        for course_name, department_name in Course.departments.through.objects.values_list('course__name', 'department__name'):
+            self.course_departments[course_name].add(department_name)
+        self.users = {
+            (user.first_name, user.last_name): user
+            for user in User.objects.filter(role=User.Roles.STUDENT).only('id', 'first_name', 'last_name')
+        }
+        self.taken_names = {
+            (first_name, last_name): student_id
+            for student_id, first_name, last_name in Student.objects.values_list('id', 'user__first_name', 'user__last_name')
+        }
+
+    def before_import_row(self, row, **kwargs):
+        first_name = (row.get('first_name') or '').strip()
+        last_name = (row.get('last_name') or '').strip()
+        department = (row.get('department') or '').strip()
+        level = str(row.get('level') or '').strip()
+
+        # التحقق مما إذا كان الطالب بنفس الاسم الأول والأخير موجودًا، في قاعدة البيانات أو في صف سابق من الملف
+        # (إلا إذا كان الصف يعدّل نفس الطالب بمعرّفه)
+        row_id = str(row.get('id') or '').strip()
+        if (first_name, last_name) in self.taken_names and str(self.taken_names[(first_name, last_name)]) != row_id:
+            raise ValueError(f"Student with the name '{first_name} {last_name}' already exists.")
+        user = self.users.get((first_name, last_name))
+        if user is None:
+            raise ValueError(f"No student user named '{first_name} {last_name}'.")
+
+        if not department or not level:
+            raise ValueError("Both 'department' and 'level' fields are required.")
+        elif department not in self.departments:
+            raise ValueError(f"Department '{department}' does not exist.")
+        elif not level.isdigit() or not (1 <= int(level) <= 4):
+            raise ValueError("The 'level' must be a number between 1 and 4.")
+
+        group_name = (row.get('group') or '').strip()
+        group = self.groups.get((group_name, department, int(level)))
+        if group is None:
+            raise ValueError(f"No group found for name '{group_name}' in department '{department}' for level '{level}'.")
+
+        courses = []
+        for course_name in filter(None, (name.strip() for name in (row.get('courses') or '').split(','))):
+            course = self.courses.get(course_name)
+            if course is None:
+                raise ValueError(f"Course '{course_name}' does not exist.")
+            if department not in self.course_departments[course_name]:
+                raise ValueError(f"Course '{course_name}' does not belong to department '{department}'.")
+            if course.level != int(level):
+                raise ValueError(f"Course '{course_name}' does not match the student's level '{level}'.")
+            courses.append(course)
+
+        self.taken_names[(first_name, last_name)] = None  # صف لاحق بنفس الاسم مكرر
+        row['resolved'] = (user, self.departments[department], int(level), group, courses)
+
+    def import_instance(self, instance, row, **kwargs):
+        # القيم محلولة مسبقاً في before_import_row، فلا حاجة لاستعلام لكل حقل
+        instance.user, instance.department, instance.level, instance.group, instance.import_courses = row['resolved']
+
+    def save_m2m(self, instance, row, **kwargs):
+        pass  # المواد تُكتب مع كل دفعة في bulk_create/bulk_update
+
+    def get_bulk_update_fields(self):
+        return ['user', 'department', 'level', 'group']
+
+    def bulk_create(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        students = list(self.create_instances)
+        super().bulk_create(using_transactions, dry_run, raise_errors, batch_size=batch_size, result=result)
+        self.save_courses(students, using_transactions, dry_run, batch_size)
+        adjust_counter('students', sum(1 for student in students if student.pk))
+
+    def bulk_update(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        students = list(self.update_instances)
+        super().bulk_update(using_transactions, dry_run, raise_errors, batch_size=batch_size, result=result)
+        # خلية المواد الفارغة تُبقي مواد الطالب الحالية، وإلا تُستبدل بالمواد الجديدة
+        replaced = [student for student in students if student.import_courses]
+        if replaced and (using_transactions or not dry_run):
+            StudentCourse.objects.filter(student__in=replaced).delete()
+        self.save_courses(students, using_transactions, dry_run, batch_size)
+
+    def save_courses(self, students, using_transactions, dry_run, batch_size):
+        """bulk_create the StudentCourse rows of a saved batch, and index its students for search."""
+        students = [student for student in students if student.pk]
+        if not students or (dry_run and not using_transactions):
+            return
+        StudentCourse.objects.bulk_create(
+            [StudentCourse(student=student, course=course) for student in students for course in student.import_courses],
+            batch_size=batch_size,
+        )
+        # bulk_create لا يرسل الإشارات، لذلك نبني مستندات البحث مباشرة
+        refresh_people(User.objects.filter(id__in=[student.user_id for student in students]))
+
 @admin.register(Student)
-class StudentAdmin(ImportExportMixin, admin.ModelAdmin):
-    resource_class = StudentResource
+class StudentAdmin(BackgroundImportExportMixin, ImportExportMixin, admin.ModelAdmin):
+    resource_classes = [StudentResource, BulkStudentResource]
     form = StudentForm
     list_display = ('student_id', 'student_user', 'department', 'level', 'group', 'list_courses', 'edit_user_link')
-    list_filter = ('department', 'level', 'group',)
-    search_fields = ('student_user__first_name', 'student_user__last_name')
+    list_filter = ('department', 'level', ('group', GroupListFilter),)
+    search_fields = ('user__first_name', 'user__last_name')
     list_display_links = ('student_id', 'student_user',)
+    list_select_related = ('user', 'department', 'group__department')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [StudentCourseInline]
     fieldsets = (
         ('Student Details', {'fields': ('user', 'department', 'level', 'group',)}),
     )
 
+    def get_queryset(self, request):
+        # أسماء الكورسات تُجمع في نفس استعلام الجدول بدل استعلام لكل صف
+        return super().get_queryset(request).annotate(courses_names=joined_names('course'))
+
     def list_courses(self, obj):  # إرجاع أسماء الكورسات المرتبطة بالقسم
-        return ", ".join(course.name for course in obj.course.all())
+        return obj.courses_names
     list_courses.short_description = 'Courses'
 
     def student_id(self, obj):
@@ -326,18 +517,29 @@ class InstructorInline(admin.StackedInline):
     fk_name = 'user'
     can_delete = False
 
+    def get_queryset(self, request):
+        # القيم الحالية لحقول الأقسام والكورسات والجروبات من استعلام واحد لكل علاقة
+        return super().get_queryset(request).prefetch_related('departments', 'courses', 'groups')
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        if db_field.name == 'groups':
+            kwargs['queryset'] = Group.objects.filter(status=True).select_related('department')  # اسم الجروب يتضمن القسم
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
 class UserResource(ModelResource):
     class Meta:
         model = User
         fields = ('id', 'first_name', 'last_name', 'username', 'password', 'email', 'phone', 'gender', 'birth_date', 'role', 'is_superuser', 'is_staff', 'is_active', 'image')
         
 @admin.register(User)
-class UserAdmin(ImportExportMixin, admin.ModelAdmin):
+class UserAdmin(BackgroundImportExportMixin, ImportExportMixin, admin.ModelAdmin):
     resource_class = UserResource
     list_display = ('user_image', 'id', 'first_name', 'last_name', 'username', 'email', 'phone', 'gender', 'role', 'birth_date', 'date_joined', 'is_active', 'is_staff', 'is_superuser')
     list_filter = ('is_staff', 'is_superuser', 'role', 'gender', 'is_active')    
     search_fields = ('id', 'first_name', 'last_name', 'username', 'email', 'phone')
     list_display_links = ('id', 'username', 'first_name', 'last_name', 'user_image',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         (None, {'fields': ('username', 'password', 'role')}),
         ('Personal Information', {
@@ -368,9 +570,14 @@ class UserAdmin(ImportExportMixin, admin.ModelAdmin):
         return fieldsets
     
     def user_image(self, obj):
-        return format_html('<img src="{}" style="width: 40px; height: 40px; border-radius: 50%;" />', obj.get_profile_image_url())
+        return format_html('<img src="{}" loading="lazy" style="width: 40px; height: 40px; border-radius: 50%; object-fit: cover;" />', obj.get_profile_image_url())
     user_image.short_description = 'Image'  # تغيير عنوان العمود
 
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        if db_field.name == 'user_permissions':
+            kwargs['queryset'] = db_field.remote_field.model.objects.select_related('content_type')  # اسم الصلاحية يتضمن نوع المحتوى
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
     def save_model(self, request, obj, form, change):
         if change: # إذا كان السجل موجودًا (تعديل المستخدم)
             # التحقق من الدور القديم
@@ -515,4 +722,57 @@ class AccountRequestAdmin(admin.ModelAdmin):
                 else:
                     messages.error(request, f"Cannot reject. User with email {account_request.email} and phone {account_request.phone_number} exists.")
             else:
-                messages.error(request,"Must be verified by admin and must check is_approved equal false")
\ No newline at end of file
+                messages.error(request,"Must be verified by admin and must check is_approved equal false")
+
+@admin.register(ImportExportJob)
+class ImportExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'resource_name', 'status', 'progress_bar', 'created_by', 'created_at', 'finished_at', 'result_link')
+    list_filter = ('kind', 'status')
+    list_select_related = ('created_by',)
+    exclude = ('selected_ids', 'checkpoint')
+    readonly_fields = ('progress_bar', 'result_link')
+
+    def get_queryset(self, request):
+        jobs = super().get_queryset(request).defer('selected_ids')
+        if not request.user.is_superuser:
+            jobs = jobs.filter(created_by=request.user)  # ملفات النتائج قد تحتوي بيانات شخصية
+        return jobs
+
+    def has_add_permission(self, request):
+        return False  # المهام تُنشأ من صفحات الاستيراد والتصدير
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        in_progress = self.get_queryset(request).filter(status__in=[ImportExportJob.Statuses.PENDING, ImportExportJob.Statuses.RUNNING]).exists()
+        return super().changelist_view(request, {**(extra_context or {}), 'jobs_in_progress': in_progress})
+
+    def get_urls(self):
+        return [
+            path('<int:job_id>/result/', self.admin_site.admin_view(self.result_view), name='admin_app_importexportjob_result'),
+        ] + super().get_urls()
+
+    def result_view(self, request, job_id):
+        job = get_object_or_404(self.get_queryset(request), pk=job_id, status=ImportExportJob.Statuses.DONE)
+        if not job.result_file:
+            raise PermissionDenied
+        return FileResponse(job.result_file.open('rb'), as_attachment=True, filename=job.result_filename())
+
+    def resource_name(self, obj):
+        return obj.resource.rsplit('.', 1)[-1]
+    resource_name.short_description = 'Resource'
+
+    def progress_bar(self, obj):
+        return format_html(
+            '<progress value="{}" max="100"></progress> {}% ({} / {} rows)',
+            obj.progress(), obj.progress(), obj.processed_rows, obj.total_rows or '?',
+        )
+    progress_bar.short_description = 'Progress'
+
+    def result_link(self, obj):
+        if obj.status != ImportExportJob.Statuses.DONE or not obj.result_file:
+            return "-"
+        label = 'Download report' if obj.kind == ImportExportJob.Kinds.IMPORT else 'Download CSV'
+        return format_html('<a href="{}">{}</a>', reverse('admin:admin_app_importexportjob_result', args=[obj.pk]), label)
+    result_link.short_description = 'Result'
@@ -0,0 +1,61 @@
+"""
+Fixed-size avatar variants of User.image.
+
+When a user is saved with a new image, User.avatar_pending is set and the
+request returns. The build_avatars command (with --watch) then crops the
+photo to a square and writes it as WebP at every size of AVATAR_SIZES, next
+to the original (user_images/25/01/31/photo.jpg.avatar-96.webp), so neither
+profile saves nor import rows wait for Pillow. User.has_image records that
+the variants exist, so rendering an avatar needs no filesystem check and
+lists of users never download the original photo; until then the default
+logo is shown.
+"""
+import io
+import logging
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+from .storage import derivative_name
+
+logger = logging.getLogger(__name__)
+
+# ضعف أكبر عرض يُعرض به كل مقاس، للشاشات عالية الدقة
+AVATAR_SIZES = {
+    'small': 96,    # القوائم، الدردشة، شريط التنقل ولوحة الإدارة (40-48px)
+    'medium': 192,  # بطاقات الطلاب والمدرسين (96px)
+    'large': 320,   # صفحة الملف الشخصي ولوحة الطالب (128-160px)
+}
+AVATAR_QUALITY = 82
+
+
+def avatar_name(name, size):
+    return derivative_name(name, f"avatar-{AVATAR_SIZES[size]}.webp")
+
+
+def render_avatar(image, pixels):
+    avatar = ImageOps.fit(image, (pixels, pixels), Image.Resampling.LANCZOS)
+    if avatar.mode not in ('RGB', 'RGBA'):
+        avatar = avatar.convert('RGBA' if 'transparency' in avatar.info or avatar.mode in ('LA', 'PA') else 'RGB')
+    output = io.BytesIO()
+    avatar.save(output, 'WEBP', quality=AVATAR_QUALITY)
+    return output.getvalue()
+
+
+def save_avatars(storage, name):
+    """Write every variant of the image `name`; False when it is missing or not an image."""
+    try:
+        with storage.open(name) as source, Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            variants = {size: render_avatar(image, pixels) for size, pixels in AVATAR_SIZES.items()}
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.warning("No avatar for %s: %s", name, e)
+        return False
+    for size, data in variants.items():
+        variant = avatar_name(name, size)
+        storage.delete(variant)  # الحفظ فوق ملف موجود يغير الاسم
+        storage.save(variant, ContentFile(data))
+    return True
+
+
+def delete_avatars(storage, name):
+    for size in AVATAR_SIZES:
+        storage.delete(avatar_name(name, size))
@@ -0,0 +1,56 @@
+"""
+Precomputed (department, level) -> course names lookup.
+
+The instructor dashboard lists the courses of every group it shows, and the
+courses of a group are those of its department at its level. The whole
+mapping is built from the Course/Department link table in one query and
+cached until a course, its departments or a department change (see the
+receivers in admin_app.signals).
+
+count_rows() turns a queryset into a COUNT subquery, so the dashboard
+statistics are annotated onto the instructor row instead of costing one
+query each.
+"""
+from collections import defaultdict
+from django.core.cache import cache
+from django.db.models import Func, IntegerField, Subquery
+from .models import Course
+
+COURSE_LOOKUP_CACHE_KEY = 'course_lookup'
+
+
+def build_course_lookup():
+    """{(department_id, level): [course names]} for every course, in a single query."""
+    lookup = defaultdict(list)
+    links = (
+        Course.departments.through.objects
+        .order_by('course_id')
+        .values_list('department_id', 'course__level', 'course__name')
+    )
+    for department_id, level, name in links:
+        lookup[(department_id, level)].append(name)
+    return dict(lookup)
+
+
+def get_course_lookup():
+    """The cached lookup, rebuilt on first use after an invalidation."""
+    lookup = cache.get(COURSE_LOOKUP_CACHE_KEY)
+    if lookup is None:
+        lookup = build_course_lookup()
+        cache.set(COURSE_LOOKUP_CACHE_KEY, lookup, None)
+    return lookup
+
+
+def courses_for(department_id, level):
+    """Names of the courses taught to a group of `department_id` at `level`."""
+    return get_course_lookup().get((department_id, level), [])
+
+
+def count_rows(queryset):
+    """COUNT(*) of `queryset` as a scalar subquery, to annotate several counts onto one query."""
+    count = Func('pk', function='COUNT', output_field=IntegerField())
+    return Subquery(queryset.order_by().annotate(count=count).values('count')[:1], output_field=IntegerField())
+
+
+def invalidate_course_lookup():
+    cache.delete(COURSE_LOOKUP_CACHE_KEY)
@@ -0,0 +1,163 @@
+"""
+Permission-checked downloads of library files (download_file in
+admin_app.views).
+
+serve_file answers conditional requests (If-None-Match, If-Modified-Since,
+If-Match, If-Unmodified-Since) with 304/412 from the file's ETag and mtime.
+The ETag of a content-addressed blob is its SHA-256. A single `Range` is
+served as 206 unless `If-Range` names another version of the file.
+Several ranges in one request are answered with the whole file, which the
+RFC allows.
+
+Only types a browser shows without running anything are sent inline:
+images other than SVG, PDF, audio, video and plain text. Any other file
+asked for inline is sent as an application/octet-stream attachment, so an
+uploaded .html or .svg can never run script on our origin. Inline responses
+carry `Content-Security-Policy: sandbox` as well, except PDFs: the browsers'
+PDF viewers do not render in a sandboxed document.
+
+With settings.LIBRARY_DOWNLOAD_OFFLOAD set, Django only checks the request
+and the front proxy sends the bytes (and the ranges): nginx through
+X-Accel-Redirect to LIBRARY_DOWNLOAD_ACCEL_PREFIX, Apache or lighttpd
+through X-Sendfile.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from .storage import blob_digest
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+INLINE_TYPE_PREFIXES = ('image/', 'audio/', 'video/')
+INLINE_TYPES = {'application/pdf', 'text/plain'}
+UNSAFE_INLINE_TYPES = {'image/svg+xml'}  # SVG قد يحتوي سكربت
+UNSANDBOXED_TYPES = {'application/pdf'}  # عارض PDF في Chrome لا يعمل داخل sandbox
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class LibraryFileResponse(FileResponse):
+    block_size = 64 * 1024
+
+
+class RangeFile:
+    """Read at most `length` bytes of `file` from `start`."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(name, stat):
+    digest = blob_digest(name)
+    return f'"{digest}"' if digest else f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """(first, last) byte of a single range, or None to send the whole file."""
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or not any(match.groups()):
+        return None  # ترويسة غير مفهومة أو عدة نطاقات: يُرسل الملف كاملاً
+    first, last = match.groups()
+    if not first:
+        # bytes=-500: آخر 500 بايت
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - int(last)), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable
+    return first, min(int(last), size - 1) if last else size - 1
+
+
+def if_range_matches(request, etag, last_modified):
+    value = request.headers.get('If-Range')
+    if value is None:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag  # مقارنة قوية فقط
+    return parse_http_date_safe(value) == last_modified
+
+
+def can_show_inline(content_type):
+    if content_type in UNSAFE_INLINE_TYPES:
+        return False
+    return content_type in INLINE_TYPES or content_type.startswith(INLINE_TYPE_PREFIXES)
+
+
+def serve_file(request, storage, name, filename, as_attachment=True, max_age=None):
+    """Send the stored file `name` under `filename`, answering conditional and range requests."""
+    path = storage.path(name)
+    stat = os.stat(path)
+    etag = file_etag(name, stat)
+    last_modified = int(stat.st_mtime)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if not as_attachment and not can_show_inline(content_type):
+        # النوع يأتي من امتداد اسم اختاره من رفع الملف: HTML أو SVG قد يشغّل سكربت على موقعنا
+        as_attachment = True
+        content_type = 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        offload = settings.LIBRARY_DOWNLOAD_OFFLOAD
+        if offload:
+            response = HttpResponse(content_type=content_type)
+            if offload == 'X-Accel-Redirect':
+                response['X-Accel-Redirect'] = settings.LIBRARY_DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + quote(name)
+            else:
+                response[offload] = path
+        else:
+            response = range_response(request, path, stat.st_size, etag, last_modified, content_type)
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    response['X-Content-Type-Options'] = 'nosniff'
+    if not as_attachment and content_type not in UNSANDBOXED_TYPES:
+        response['Content-Security-Policy'] = 'sandbox'
+    if max_age:
+        patch_cache_control(response, private=True, max_age=max_age)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)  # الصلاحية تُفحص مع كل طلب، والتحقق بالـ ETag رخيص
+    return response
+
+
+def range_response(request, path, size, etag, last_modified, content_type):
+    byte_range = None
+    header = request.headers.get('Range')
+    if header and if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(header, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    source = open(path, 'rb')
+    if byte_range is None:
+        return LibraryFileResponse(source, content_type=content_type)
+    first, last = byte_range
+    response = LibraryFileResponse(RangeFile(source, first, last - first + 1), status=206, content_type=content_type)
+    response['Content-Length'] = last - first + 1
+    response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    return response
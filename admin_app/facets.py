@@ -0,0 +1,74 @@
+"""
+Filter facets (category, course, type, uploader) of the library page.
+
+One GROUP BY query returns the number of approved files for every
+combination of the four facet values; the rows are cached under the current
+library version (bumped by the File signals), and the counts for the
+currently applied filters are derived from them in Python.
+"""
+from django.core.cache import cache
+from django.db.models import Count
+from .models import File
+from .search import get_library_version
+
+FACETS_CACHE_TIMEOUT = 60 * 60
+
+# اسم الفلتر: (حقل القيمة، حقل الاسم المعروض)
+FACET_FIELDS = {
+    'category': ('category', 'category'),
+    'course': ('course_id', 'course__name'),
+    'type': ('type', 'type'),
+    'uploader': ('upload_by_id', 'upload_by__username'),
+}
+
+
+def facet_rows(files):
+    """Count `files` per combination of facet values in a single query."""
+    fields = {field for pair in FACET_FIELDS.values() for field in pair}
+    return list(files.order_by().values(*sorted(fields)).annotate(count=Count('id')))
+
+
+def get_library_facet_rows():
+    """Facet rows of all approved files, cached until the library changes."""
+    key = f"library_facets:{get_library_version()}"
+    rows = cache.get(key)
+    if rows is None:
+        rows = facet_rows(File.objects.filter(status='APPROVED'))
+        cache.set(key, rows, FACETS_CACHE_TIMEOUT)
+    return rows
+
+
+def facet_values(rows, name):
+    """All values of one facet as strings, as they arrive in request.GET."""
+    value_field = FACET_FIELDS[name][0]
+    return {str(row[value_field]) for row in rows}
+
+
+def build_facets(rows, selected):
+    """
+    Return {facet name: [{'value', 'label', 'count'}, ...]}. Each facet is
+    counted with every other selected filter applied but not its own, so the
+    options of a facet show what choosing them would return.
+    """
+    facets = {}
+    for name, (value_field, label_field) in FACET_FIELDS.items():
+        others = [(FACET_FIELDS[other][0], value) for other, value in selected.items() if other != name and value]
+        counts, labels = {}, {}
+        for row in rows:
+            value = row[value_field]
+            labels[value] = row[label_field]
+            if all(str(row[field]) == other_value for field, other_value in others):
+                counts[value] = counts.get(value, 0) + row['count']
+            elif selected.get(name) == str(value):
+                counts.setdefault(value, 0)  # الخيار المحدد يبقى ظاهراً ولو كان عدده صفراً
+        facets[name] = sorted(
+            ({'value': value, 'label': labels[value], 'count': count} for value, count in counts.items()),
+            key=lambda facet: str(facet['label']).lower(),
+        )
+    return facets
+
+
+def facet_total(rows, selected):
+    """Number of files matching every selected filter, taken from the facet rows."""
+    filters = [(FACET_FIELDS[name][0], value) for name, value in selected.items() if value]
+    return sum(row['count'] for row in rows if all(str(row[field]) == value for field, value in filters))
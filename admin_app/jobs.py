@@ -0,0 +1,224 @@
+"""
+Background imports and exports for the import-export admins.
+
+The admin only stores an ImportExportJob (the uploaded file, or the primary
+keys of the selected rows) and returns; the run_jobs workers claim pending
+jobs and process them JOB_CHUNK_ROWS rows at a time.
+
+Every chunk is committed together with the job's checkpoint: the number of
+processed rows and the size of the result file so far. A worker that dies
+stops sending heartbeats, and after JOB_HEARTBEAT_TIMEOUT seconds another
+worker claims the job again. That worker cuts the result file back to the
+checkpoint and continues from the next chunk. A job is failed after
+JOB_MAX_ATTEMPTS claims.
+
+Imports keep the all-or-nothing rule of the admin import, per chunk: a
+chunk with errors is rolled back, and its errors are written to the CSV
+report that is the job's result. Exports write CSV.
+"""
+import bisect
+import csv
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import ImportExportJob
+from .storage import job_file_name
+
+logger = logging.getLogger(__name__)
+
+JOB_CHUNK_ROWS = 1000
+JOB_HEARTBEAT_TIMEOUT = 5 * 60
+JOB_MAX_ATTEMPTS = 3
+IMPORT_TOTALS = ('new', 'update', 'delete', 'skip', 'error', 'invalid', 'rolled_back')
+
+
+class JobLost(Exception):
+    """Another worker claimed the job after this one missed its heartbeats."""
+
+
+def class_path(cls):
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def enqueue_import(resource_class, input_format, uploaded_file, user=None):
+    job = ImportExportJob(
+        kind=ImportExportJob.Kinds.IMPORT, resource=class_path(resource_class),
+        input_format=class_path(input_format), created_by=user,
+    )
+    job.input_file.save(os.path.basename(uploaded_file.name), uploaded_file, save=False)
+    job.save()
+    logger.info("Queued import job #%s (%s) by %s", job.pk, job.resource, user)
+    return job
+
+
+def enqueue_export(resource_class, queryset, user=None):
+    job = ImportExportJob.objects.create(
+        kind=ImportExportJob.Kinds.EXPORT, resource=class_path(resource_class),
+        selected_ids=sorted(queryset.order_by().values_list('pk', flat=True)), created_by=user,
+    )
+    logger.info("Queued export job #%s (%s) by %s", job.pk, job.resource, user)
+    return job
+
+
+def claim_job(worker):
+    """Take the oldest pending job, or a running job whose worker stopped sending heartbeats."""
+    now = timezone.now()
+    stale = now - timedelta(seconds=JOB_HEARTBEAT_TIMEOUT)
+    candidates = (
+        ImportExportJob.objects
+        .filter(Q(status=ImportExportJob.Statuses.PENDING) | Q(status=ImportExportJob.Statuses.RUNNING, heartbeat__lt=stale))
+        .order_by('created_at', 'id')
+        .values_list('id', 'status', 'heartbeat')[:10]
+    )
+    for job_id, status, heartbeat in candidates:
+        # التحديث المشروط يضمن أن عاملاً واحداً فقط يأخذ المهمة
+        claimed = ImportExportJob.objects.filter(pk=job_id, status=status, heartbeat=heartbeat).update(
+            status=ImportExportJob.Statuses.RUNNING, worker=worker, heartbeat=now,
+            attempts=F('attempts') + 1, started_at=Coalesce('started_at', now),
+        )
+        if claimed:
+            return ImportExportJob.objects.get(pk=job_id)
+    return None
+
+
+def save_progress(job, **fields):
+    """Store progress with a heartbeat, unless another worker has taken the job."""
+    fields['heartbeat'] = timezone.now()
+    if not ImportExportJob.objects.filter(pk=job.pk, worker=job.worker).update(**fields):
+        raise JobLost(job.pk)
+    for name, value in fields.items():
+        setattr(job, name, value)
+
+
+def finish_job(job, status, error=''):
+    save_progress(job, status=status, error=error, finished_at=timezone.now())
+    logger.info("Job #%s %s after %s rows", job.pk, status.lower(), job.processed_rows)
+
+
+def run_job(job):
+    if job.attempts > JOB_MAX_ATTEMPTS:
+        finish_job(job, ImportExportJob.Statuses.FAILED, f"Gave up after {JOB_MAX_ATTEMPTS} attempts.")
+        return
+    try:
+        if job.kind == ImportExportJob.Kinds.IMPORT:
+            run_import(job)
+        else:
+            run_export(job)
+        finish_job(job, ImportExportJob.Statuses.DONE)
+    except JobLost:
+        logger.warning("Job #%s was taken over by another worker", job.pk)
+    except Exception as e:
+        logger.exception("Job #%s failed", job.pk)
+        try:
+            finish_job(job, ImportExportJob.Statuses.FAILED, str(e))
+        except JobLost:
+            pass
+
+
+def open_result(job):
+    """The job's result file, cut back to the last checkpoint."""
+    if not job.result_file:
+        storage = job.result_file.storage
+        name = job_file_name('results', 'result.csv')
+        path = storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'w').close()
+        save_progress(job, result_file=name, checkpoint={})
+    result = open(job.result_file.path, 'r+', newline='', encoding='utf-8')
+    result.truncate(job.checkpoint.get('offset', 0))
+    result.seek(0, os.SEEK_END)
+    return result
+
+
+def run_import(job):
+    resource = import_string(job.resource)()
+    input_format = import_string(job.input_format)()
+    if not input_format.is_binary():
+        input_format.encoding = 'utf-8-sig'
+    with job.input_file.open('rb') as source:
+        data = source.read()
+    if not input_format.is_binary():
+        data = data.decode(input_format.encoding)
+    dataset = input_format.create_dataset(data)
+    if job.total_rows != len(dataset):
+        save_progress(job, total_rows=len(dataset))
+
+    with open_result(job) as report:
+        writer = csv.writer(report)
+        if not report.tell():
+            writer.writerow(['row', 'error'])
+        totals = dict.fromkeys(IMPORT_TOTALS, 0) | job.checkpoint.get('totals', {})
+        for start in range(job.processed_rows, len(dataset), JOB_CHUNK_ROWS):
+            end = min(start + JOB_CHUNK_ROWS, len(dataset))
+            with transaction.atomic():
+                result = resource.import_data(dataset.subset(rows=range(start, end)), dry_run=False, use_transactions=True)
+                for name in IMPORT_TOTALS[:-1]:
+                    totals[name] += result.totals.get(name, 0)
+                if result.has_errors():
+                    totals['rolled_back'] += end - start  # الدفعة أُلغيت كاملة كما في استيراد لوحة الإدارة
+                for error in result.base_errors:
+                    writer.writerow(['', f"Rows {start + 1}-{end}: {error.error}"])
+                for number, errors in result.row_errors():
+                    for error in errors:
+                        writer.writerow([start + number, error.error])
+                for invalid in result.invalid_rows:
+                    writer.writerow([start + invalid.number, '; '.join(
+                        f"{field}: {' '.join(messages)}" for field, messages in invalid.error_dict.items()
+                    )])
+                report.flush()
+                save_progress(job, processed_rows=end, checkpoint={'offset': report.tell(), 'totals': totals})
+        writer.writerow(['', ', '.join(f"{name}={count}" for name, count in totals.items())])
+
+
+def run_export(job):
+    resource = import_string(job.resource)()
+    # علاقات many-to-many المصدّرة تُجلب مع كل دفعة بدل استعلام لكل صف
+    exported = {field.attribute for field in resource.get_export_fields()}
+    queryset = resource.get_queryset()
+    many_to_many = [field.name for field in queryset.model._meta.many_to_many if field.name in exported]
+    queryset = queryset.order_by('pk').prefetch_related(*many_to_many)
+    ids = job.selected_ids
+    if not job.total_rows:
+        save_progress(job, total_rows=len(ids))
+
+    with open_result(job) as output:
+        writer = csv.writer(output)
+        last_pk = job.checkpoint.get('last_pk')
+        first = 0 if last_pk is None else bisect.bisect_right(ids, last_pk)
+        for start in range(first, len(ids), JOB_CHUNK_ROWS):
+            chunk = ids[start:start + JOB_CHUNK_ROWS]
+            # الصفوف المحذوفة بعد اختيارها لا تُصدَّر
+            rows = list(queryset.filter(pk__in=chunk))
+            dataset = resource.export(queryset=rows)
+            if not output.tell():
+                writer.writerow(dataset.headers)
+            writer.writerows(dataset)
+            output.flush()
+            save_progress(job, processed_rows=job.processed_rows + len(chunk), checkpoint={'offset': output.tell(), 'last_pk': chunk[-1]})
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def work(poll=2.0, once=False, stop=None):
+    """Run jobs until `stop` is set; with `once`, until no job is left."""
+    name = worker_name()
+    logger.info("Job worker %s started", name)
+    while not (stop and stop.is_set()):
+        job = claim_job(name)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll)
+            continue
+        logger.info("Worker %s runs job #%s (attempt %s)", name, job.pk, job.attempts)
+        run_job(job)
+    logger.info("Job worker %s stopped", name)
@@ -0,0 +1,200 @@
+"""
+Reading the log files for log_viewer / download_logs without loading them.
+
+Pages of the unfiltered log come from a sidecar index (`<log>.idx`) that
+records the line number and byte offset of one line per CHECKPOINT_BYTES of
+log, so any page can be reached with a seek and a short forward read. The
+index is extended from where it stopped on every read, and rebuilt when the
+log is rotated or truncated.
+
+Keyword searches read the file backwards in blocks from the end (or from a
+byte-offset cursor), newest first, and stop as soon as a page is full.
+"""
+import logging
+import os
+import zlib
+from array import array
+from bisect import bisect_right
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LOG_FILES = {
+    'admin': os.path.join(settings.BASE_DIR, 'sss/logs', 'admin_app.log'),
+    'server': os.path.join(settings.BASE_DIR, 'sss/logs', 'default.log'),
+}
+LOG_PAGE_SIZE = 200
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+BLOCK_SIZE = 64 * 1024
+CHECKPOINT_BYTES = 64 * 1024
+SEARCH_SCAN_BYTES = 32 * 1024 * 1024  # أقصى ما يقرأه طلب بحث واحد قبل إعادة مؤشر للمتابعة
+INDEX_FORMAT = 1
+FINGERPRINT_BYTES = 256
+
+
+def decode_line(raw):
+    return raw.rstrip(b'\r\n').decode('utf-8', errors='replace')
+
+
+class LogIndex:
+    """Sparse line-number -> byte-offset index of one log file, kept in `<path>.idx`."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.reset(None)
+
+    def reset(self, inode):
+        self.inode = inode
+        self.fingerprint = 0  # crc32 لأول بايتات الملف لاكتشاف ملف استُبدل بنفس الـ inode
+        self.indexed_size = 0  # الموضع بعد آخر سطر مكتمل تمت فهرسته
+        self.line_count = 0
+        self.checkpoints = array('Q', [0, 0])  # أزواج (رقم السطر، موضع بدايته)
+
+    def load(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = array('Q')
+                data.frombytes(f.read())
+        except (OSError, ValueError):
+            return
+        if len(data) >= 7 and data[0] == INDEX_FORMAT and len(data) % 2 == 1:
+            self.inode, self.fingerprint, self.indexed_size, self.line_count = data[1:5]
+            self.checkpoints = data[5:]
+
+    def save(self):
+        data = array('Q', [INDEX_FORMAT, self.inode, self.fingerprint, self.indexed_size, self.line_count]) + self.checkpoints
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                data.tofile(f)
+            os.replace(temp_path, self.index_path)
+        except OSError:
+            logger.warning("Could not write log index: %s", self.index_path)
+
+    def refresh(self):
+        """Bring the index up to date with the log file and return the number of complete lines."""
+        stat = os.stat(self.path)
+        self.load()
+        with open(self.path, 'rb') as f:
+            if (self.inode != stat.st_ino or stat.st_size < self.indexed_size
+                    or self.fingerprint != self.head_checksum(f, self.indexed_size)):
+                self.reset(stat.st_ino)
+            if stat.st_size > self.indexed_size:
+                before = (self.indexed_size, self.line_count)
+                self.extend(f, stat.st_size)
+                if (self.indexed_size, self.line_count) != before:
+                    self.fingerprint = self.head_checksum(f, self.indexed_size)
+                    self.save()
+        return self.line_count
+
+    @staticmethod
+    def head_checksum(f, size):
+        f.seek(0)
+        return zlib.crc32(f.read(min(size, FINGERPRINT_BYTES)))
+
+    def extend(self, f, size):
+        f.seek(self.indexed_size)
+        position, lines = self.indexed_size, self.line_count
+        last_checkpoint = self.checkpoints[-1]
+        while position < size:
+            block = f.read(min(BLOCK_SIZE, size - position))
+            if not block:
+                break
+            newlines = block.count(b'\n')
+            if newlines:
+                first = block.find(b'\n')
+                if position + first + 1 - last_checkpoint >= CHECKPOINT_BYTES:
+                    last_checkpoint = position + first + 1
+                    self.checkpoints.extend((lines + 1, last_checkpoint))
+                lines += newlines
+                self.indexed_size = position + block.rfind(b'\n') + 1
+            position += len(block)
+        self.line_count = lines
+
+    def read_lines(self, start, stop):
+        """Lines [start, stop) of the file, in file order."""
+        numbers = self.checkpoints[0::2]
+        checkpoint = bisect_right(numbers, start) - 1
+        line_number, offset = self.checkpoints[2 * checkpoint], self.checkpoints[2 * checkpoint + 1]
+        lines = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            while line_number < stop:
+                raw = f.readline()
+                if not raw:
+                    break
+                if line_number >= start:
+                    lines.append(decode_line(raw))
+                line_number += 1
+        return lines
+
+
+def read_log_page(path, page=1, page_size=LOG_PAGE_SIZE):
+    """Return (lines newest first, page, number of pages) for one page of the log."""
+    index = LogIndex(path)
+    total = index.refresh()
+    pages = max((total + page_size - 1) // page_size, 1)
+    page = min(max(page, 1), pages)
+    stop = total - (page - 1) * page_size
+    lines = index.read_lines(max(stop - page_size, 0), stop)
+    lines.reverse()
+    return lines, page, pages
+
+
+def iter_lines_backwards(path, end=None, block_size=BLOCK_SIZE):
+    """Yield (offset, raw line) from byte `end` (default: end of file) back to the start."""
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END) if end is None else end
+        tail = b''
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            parts = (f.read(size) + tail).split(b'\n')
+            offsets = [position]
+            for part in parts[:-1]:
+                offsets.append(offsets[-1] + len(part) + 1)
+            # الجزء الأول قد يكون بقية سطر يبدأ في الكتلة السابقة
+            tail = parts[0]
+            for offset, part in zip(reversed(offsets[1:]), reversed(parts[1:])):
+                if part:
+                    yield offset, part
+        if tail:
+            yield 0, tail
+
+
+def search_log(path, keyword, before=None, limit=LOG_PAGE_SIZE, scan_bytes=SEARCH_SCAN_BYTES):
+    """
+    Return (lines newest first, cursor) of up to `limit` lines containing
+    `keyword`, read backwards from the byte offset `before`. The cursor is
+    the offset to continue from, or None once the start of the file is reached.
+    """
+    needle = keyword.lower()
+    end = before if before is not None else os.path.getsize(path)
+    lines = []
+    for offset, raw in iter_lines_backwards(path, end):
+        line = decode_line(raw)
+        if needle in line.lower():
+            lines.append(line)
+            if len(lines) >= limit:
+                return lines, offset or None
+        elif end - offset >= scan_bytes:
+            return lines, offset or None
+    return lines, None
+
+
+def iter_log_matches(path, keyword, block_size=BLOCK_SIZE):
+    """Yield the lines containing `keyword` in file order, a block of output at a time."""
+    needle = keyword.lower()
+    with open(path, 'rb') as f:
+        buffer, buffered = [], 0
+        for raw in f:
+            if needle in raw.decode('utf-8', errors='replace').lower():
+                buffer.append(raw)
+                buffered += len(raw)
+                if buffered >= block_size:
+                    yield b''.join(buffer)
+                    buffer, buffered = [], 0
+        if buffer:
+            yield b''.join(buffer)
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from admin_app.models import User
+
+
+class Command(BaseCommand):
+    help = "Render the avatar variants of users whose image has none yet (all users with --all)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Render again the variants of every user with an image.")
+        parser.add_argument('--watch', action='store_true', help="Keep running and render the images of saved users as they come in.")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds between checks for new images with --watch (default 2).")
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(image='').only('id', 'image', 'has_image', 'avatar_pending').order_by('pk')
+        if not options['all']:
+            users = users.filter(Q(has_image=False) | Q(avatar_pending=True))
+        self.build(users)
+        if not options['watch']:
+            return
+        self.stdout.write("Waiting for new images.")
+        try:
+            while True:
+                # الصور التي لم تُقرأ لا تُعاد: refresh_avatars يلغي avatar_pending في الحالتين
+                if not self.build(users.filter(avatar_pending=True), quiet=True):
+                    time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped.")
+
+    def build(self, users, quiet=False):
+        built = missing = 0
+        for user in users.iterator():
+            if user.refresh_avatars():
+                built += 1
+            else:
+                missing += 1
+        if built or missing or not quiet:
+            self.stdout.write(self.style.SUCCESS(f"Rendered the avatars of {built:,} users, {missing:,} images missing or unreadable."))
+        return built + missing
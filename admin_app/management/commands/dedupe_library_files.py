@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from admin_app.models import Blob, File
+from admin_app.storage import BLOB_DIR, blob_storage, file_sha256
+
+
+class Command(BaseCommand):
+    help = (
+        "Move library files stored by name before the content-addressed storage into blobs, "
+        "so identical files are kept once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report how much space would be saved.")
+
+    def handle(self, *args, **options):
+        files = File.objects.exclude(file__startswith=f"{BLOB_DIR}/").exclude(file='').only('id', 'file').order_by('pk')
+        moved = {}  # الاسم القديم: اسم الـ blob
+        seen = set()
+        total = saved = count = 0
+        temp_dir = blob_storage.path(f"{BLOB_DIR}/tmp")
+        os.makedirs(temp_dir, exist_ok=True)
+        for file in files.iterator():
+            old_name = file.file.name
+            if old_name in moved:
+                # سجلان يشيران إلى نفس الملف القديم
+                if not options['dry_run']:
+                    with transaction.atomic():
+                        Blob.objects.filter(name=moved[old_name]).update(references=F('references') + 1)
+                        File.objects.filter(pk=file.pk).update(file=moved[old_name])
+                continue
+            path = blob_storage.path(old_name)
+            if not os.path.isfile(path):
+                self.stdout.write(self.style.WARNING(f"File #{file.pk}: {old_name} is missing, skipped."))
+                continue
+
+            size = os.path.getsize(path)
+            digest = file_sha256(path)
+            total += size
+            count += 1
+            if digest in seen:
+                saved += size
+            seen.add(digest)
+            if options['dry_run']:
+                moved[old_name] = None
+                continue
+
+            # نسخة مؤقتة تُنقل إلى الـ blob؛ الأصل لا يُحذف إلا بعد حفظ الاسم الجديد
+            fd, temp = tempfile.mkstemp(dir=temp_dir)
+            os.close(fd)
+            shutil.copyfile(path, temp)
+            with transaction.atomic():
+                name = blob_storage.save_local(temp, old_name, digest)
+                File.objects.filter(pk=file.pk).update(file=name)
+                transaction.on_commit(lambda path=path: os.remove(path))
+            moved[old_name] = name
+
+        action = "Would move" if options['dry_run'] else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {count:,} files ({total / 1024 / 1024:.1f} MB) into {len(seen):,} distinct contents, "
+            f"{saved / 1024 / 1024:.1f} MB saved."
+        ))
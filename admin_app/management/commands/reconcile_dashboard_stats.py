@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from admin_app.stats import rebuild_activity, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Recount the cached admin dashboard counters, and optionally rebuild the daily activity rollup."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild-activity', action='store_true', help="Recompute the DailyActivity rollup from the base tables.")
+
+    def handle(self, *args, **options):
+        counts = reconcile_counters()
+        self.stdout.write(', '.join(f"{name}={count}" for name, count in counts.items()))
+        if options['rebuild_activity']:
+            self.stdout.write(f"Rebuilt {rebuild_activity()} daily activity rows.")
@@ -0,0 +1,52 @@
+import multiprocessing
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from admin_app.jobs import work
+from sss.logqueue import configure_logging, stop_listener
+
+
+def worker_main(poll, once, stop):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # الأب يوقف العمال عبر stop بعد إنهاء المهمة الحالية
+    connections.close_all()  # لا يُشارك اتصال قاعدة البيانات الموروث من الأب
+    configure_logging(settings.LOGGING)  # خيط كتابة السجلات لا ينتقل مع fork
+    try:
+        work(poll=poll, once=once, stop=stop)
+    finally:
+        stop_listener()  # العملية الفرعية تنتهي بـ os._exit دون atexit
+
+
+class Command(BaseCommand):
+    help = "Run the background import/export jobs queued from the admin."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Worker processes (default 2).")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds between checks for new jobs (default 2).")
+        parser.add_argument('--once', action='store_true', help="Exit when no job is left instead of waiting for more.")
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 1:
+            work(poll=options['poll'], once=options['once'])
+            return
+
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        connections.close_all()
+        workers = [
+            context.Process(target=worker_main, args=(options['poll'], options['once'], stop), daemon=True)
+            for _ in range(options['workers'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Started {len(workers)} job workers.")
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping after the current jobs...")
+            stop.set()
+            for worker in workers:
+                worker.join()
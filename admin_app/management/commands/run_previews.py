@@ -0,0 +1,37 @@
+import multiprocessing
+import os
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from admin_app.models import File
+from admin_app.previews import work
+
+
+def ignore_sigint():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # الأب يوقف العمال بعد إنهاء الدفعة الحالية
+
+
+class Command(BaseCommand):
+    help = "Render the preview images of library files in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help="Worker processes (default: one per CPU).")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds between checks for new files (default 2).")
+        parser.add_argument('--once', action='store_true', help="Exit when no file is waiting instead of waiting for more.")
+        parser.add_argument('--retry-failed', action='store_true', help="Queue the files whose preview failed again first.")
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            retried = File.objects.filter(preview_status=File.PreviewStatuses.FAILED).update(preview_status=File.PreviewStatuses.PENDING)
+            self.stdout.write(f"Queued {retried} failed previews again.")
+
+        context = multiprocessing.get_context('fork')
+        connections.close_all()  # العمال لا يستخدمون قاعدة البيانات، فلا يرثون اتصال الأب
+        with context.Pool(max(options['workers'], 1), initializer=ignore_sigint) as pool:
+            self.stdout.write(f"Started {options['workers']} preview workers.")
+            try:
+                work(pool, poll=options['poll'], once=options['once'])
+            except KeyboardInterrupt:
+                self.stdout.write("Stopped.")
@@ -0,0 +1,72 @@
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# PostgreSQL: tsvector موزون (اسم الملف A، الباقي B) مع فهرس GIN، وفهرس trigram للأخطاء الإملائية
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    ALTER TABLE admin_app_filesearchdocument ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX file_search_vector_idx ON admin_app_filesearchdocument USING gin (search_vector)",
+    "CREATE INDEX file_search_trgm_idx ON admin_app_filesearchdocument USING gin ((title || ' ' || body) gin_trgm_ops)",
+]
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS file_search_trgm_idx",
+    "DROP INDEX IF EXISTS file_search_vector_idx",
+    "ALTER TABLE admin_app_filesearchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def add_postgresql_search_columns(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        with schema_editor.connection.cursor() as cursor:
+            for statement in POSTGRESQL_FORWARD:
+                cursor.execute(statement)
+
+
+def remove_postgresql_search_columns(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        with schema_editor.connection.cursor() as cursor:
+            for statement in POSTGRESQL_BACKWARD:
+                cursor.execute(statement)
+
+
+def backfill_documents(apps, schema_editor):
+    File = apps.get_model('admin_app', 'File')
+    FileSearchDocument = apps.get_model('admin_app', 'FileSearchDocument')
+
+    documents = []
+    for file in File.objects.select_related('course', 'upload_by').iterator(chunk_size=2000):
+        uploader = file.upload_by
+        body = [file.description, file.course.name, f"{uploader.first_name} {uploader.last_name} {uploader.username}"]
+        title = ' '.join(re.findall(r'[^\W_]+', file.name.lower()))[:255]
+        documents.append(FileSearchDocument(file_id=file.id, title=title, body=' '.join(part for part in body if part)))
+        if len(documents) >= 2000:
+            FileSearchDocument.objects.bulk_create(documents, ignore_conflicts=True)
+            documents = []
+    FileSearchDocument.objects.bulk_create(documents, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0004_alter_file_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileSearchDocument',
+            fields=[
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='admin_app.file')),
+                ('title', models.CharField(blank=True, default='', max_length=255)),
+                ('body', models.TextField(blank=True, default='')),
+            ],
+        ),
+        migrations.RunPython(add_postgresql_search_columns, remove_postgresql_search_columns),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,113 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from admin_app.utils import sqlite_supports_trigram
+
+# PostgreSQL: فهرس trigram يخدم LIKE '%...%' على نص البحث
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX person_search_trgm_idx ON admin_app_personsearchdocument USING gin (document gin_trgm_ops)",
+]
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS person_search_trgm_idx",
+]
+
+# SQLite: جدول FTS5 بمقاطع trigram يُحدَّث بواسطة triggers
+# (بدون مُقسِّم trigram يبحث search_people بـ LIKE)
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE admin_app_personsearchdocument_fts USING fts5(
+        document, content='admin_app_personsearchdocument', content_rowid='user_id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER admin_app_personsearchdocument_fts_ai AFTER INSERT ON admin_app_personsearchdocument BEGIN
+        INSERT INTO admin_app_personsearchdocument_fts(rowid, document) VALUES (new.user_id, new.document);
+    END
+    """,
+    """
+    CREATE TRIGGER admin_app_personsearchdocument_fts_ad AFTER DELETE ON admin_app_personsearchdocument BEGIN
+        INSERT INTO admin_app_personsearchdocument_fts(admin_app_personsearchdocument_fts, rowid, document)
+        VALUES ('delete', old.user_id, old.document);
+    END
+    """,
+    """
+    CREATE TRIGGER admin_app_personsearchdocument_fts_au AFTER UPDATE ON admin_app_personsearchdocument BEGIN
+        INSERT INTO admin_app_personsearchdocument_fts(admin_app_personsearchdocument_fts, rowid, document)
+        VALUES ('delete', old.user_id, old.document);
+        INSERT INTO admin_app_personsearchdocument_fts(rowid, document) VALUES (new.user_id, new.document);
+    END
+    """,
+    "INSERT INTO admin_app_personsearchdocument_fts(admin_app_personsearchdocument_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS admin_app_personsearchdocument_fts_au",
+    "DROP TRIGGER IF EXISTS admin_app_personsearchdocument_fts_ad",
+    "DROP TRIGGER IF EXISTS admin_app_personsearchdocument_fts_ai",
+    "DROP TABLE IF EXISTS admin_app_personsearchdocument_fts",
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor not in statements:
+            return
+        if vendor == 'sqlite' and not sqlite_supports_trigram(schema_editor.connection):
+            return
+        with schema_editor.connection.cursor() as cursor:
+            for statement in statements[vendor]:
+                cursor.execute(statement)
+    return run
+
+
+def backfill_documents(apps, schema_editor):
+    User = apps.get_model('admin_app', 'User')
+    Student = apps.get_model('admin_app', 'Student')
+    Instructor = apps.get_model('admin_app', 'Instructor')
+    PersonSearchDocument = apps.get_model('admin_app', 'PersonSearchDocument')
+
+    students = {student.user_id: student for student in Student.objects.select_related('department', 'group')}
+    instructors = {
+        instructor.user_id: instructor
+        for instructor in Instructor.objects.prefetch_related('departments', 'courses')
+    }
+    documents = []
+    for user in User.objects.filter(models.Q(id__in=students.keys()) | models.Q(id__in=instructors.keys())).iterator(chunk_size=2000):
+        parts = [str(user.id), user.first_name, user.last_name, user.username, user.email, str(user.phone or '')]
+        if user.birth_date:
+            parts += [user.birth_date.isoformat(), user.birth_date.strftime('%d-%m-%Y')]
+        if user.id in students:
+            student = students[user.id]
+            parts += [str(student.level), student.department.name, student.group.name]
+        if user.id in instructors:
+            instructor = instructors[user.id]
+            parts += [department.name for department in instructor.departments.all()]
+            parts += [course.name for course in instructor.courses.all()]
+        documents.append(PersonSearchDocument(user_id=user.id, document=' '.join(part for part in parts if part).lower()))
+        if len(documents) >= 2000:
+            PersonSearchDocument.objects.bulk_create(documents, ignore_conflicts=True)
+            documents = []
+    PersonSearchDocument.objects.bulk_create(documents, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0005_file_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonSearchDocument',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('document', models.TextField(blank=True, default='')),
+            ],
+        ),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+        migrations.RunPython(
+            run_statements({'postgresql': POSTGRESQL_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run_statements({'postgresql': POSTGRESQL_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_activity(apps, schema_editor):
+    File = apps.get_model('admin_app', 'File')
+    AccountRequest = apps.get_model('admin_app', 'AccountRequest')
+    DailyActivity = apps.get_model('admin_app', 'DailyActivity')
+
+    rows = []
+    for kind, model, field in (('uploads', File, 'upload_date'), ('account_requests', AccountRequest, 'created_at')):
+        days = model.objects.order_by().annotate(day=TruncDate(field)).values('day').annotate(count=models.Count('id'))
+        rows += [DailyActivity(kind=kind, day=row['day'], count=row['count']) for row in days if row['day']]
+    DailyActivity.objects.bulk_create(rows, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0006_person_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('uploads', 'Uploads'), ('account_requests', 'Account requests')], max_length=20)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily activity',
+                'unique_together': {('kind', 'day')},
+            },
+        ),
+        migrations.RunPython(backfill_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0007_daily_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('IMPORT', 'Import'), ('EXPORT', 'Export')], max_length=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('resource', models.CharField(max_length=255)),
+                ('input_format', models.CharField(blank=True, max_length=255)),
+                ('input_file', models.FileField(blank=True, upload_to='jobs/input/%y/%m/%d/')),
+                ('query', models.BinaryField(blank=True, null=True)),
+                ('result_file', models.FileField(blank=True, upload_to='jobs/results/%y/%m/%d/')),
+                ('total_rows', models.PositiveIntegerField(default=0)),
+                ('processed_rows', models.PositiveIntegerField(default=0)),
+                ('checkpoint', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('heartbeat', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Import/Export Job',
+                'verbose_name_plural': 'Import/Export Jobs',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='admin_app_i_status_441d97_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0010_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='preview_status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('READY', 'Ready'), ('NONE', 'No preview'), ('FAILED', 'Failed')], db_index=True, default='PENDING', editable=False, max_length=10),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0011_file_preview_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='has_image',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0012_user_has_image'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='importexportjob',
+            name='query',
+        ),
+        migrations.AddField(
+            model_name='importexportjob',
+            name='selected_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
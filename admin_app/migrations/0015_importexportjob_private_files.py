@@ -0,0 +1,42 @@
+import os
+import admin_app.storage
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.db import migrations, models
+
+
+def move_job_files(apps, schema_editor):
+    """Move the files of existing jobs out of MEDIA_ROOT, under random names."""
+    ImportExportJob = apps.get_model('admin_app', 'ImportExportJob')
+    for job in ImportExportJob.objects.exclude(input_file='', result_file=''):
+        for field, directory in (('input_file', 'input'), ('result_file', 'results')):
+            name = getattr(job, field).name
+            source = os.path.join(settings.MEDIA_ROOT, name) if name else None
+            if not source or not os.path.isfile(source):
+                continue
+            new_name = admin_app.storage.job_file_name(directory, name)
+            destination = os.path.join(settings.JOB_FILES_ROOT, new_name)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            file_move_safe(source, destination)
+            ImportExportJob.objects.filter(pk=job.pk).update(**{field: new_name})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0014_user_avatar_pending'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importexportjob',
+            name='input_file',
+            field=models.FileField(blank=True, storage=admin_app.storage.JobFileStorage(), upload_to=admin_app.storage.job_input_name),
+        ),
+        migrations.AlterField(
+            model_name='importexportjob',
+            name='result_file',
+            field=models.FileField(blank=True, storage=admin_app.storage.JobFileStorage(), upload_to=''),
+        ),
+        migrations.RunPython(move_job_files, migrations.RunPython.noop),
+    ]
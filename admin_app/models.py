@@ -6,6 +6,7 @@ from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator, RegexValidator
 import os
 import re
+import uuid
 from datetime import date
 from django.templatetags.static import static
 from django.utils import timezone
@@ -15,6 +16,8 @@ from django.utils.timezone import now, timedelta
 from django.db.models import Count
 from datetime import date
 import logging
+from .avatars import avatar_name, save_avatars
+from .storage import PREVIEW_SUFFIX, blob_storage, derivative_name, job_input_name, job_storage
 
 # Create your models here.
 
@@ -22,7 +25,15 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 
+FILE_MAX_SIZE = 80 * 1024 * 1024  # الحد الأقصى لحجم ملف المكتبة
+
 class File(models.Model):
+    class PreviewStatuses(models.TextChoices):
+        PENDING = 'PENDING', _('Pending')
+        READY = 'READY', _('Ready')
+        NONE = 'NONE', _('No preview')
+        FAILED = 'FAILED', _('Failed')
+
     choices = (
         ('PENDING', _('Pending')),
         ('APPROVED', _('Approved')),
@@ -32,6 +43,7 @@ class File(models.Model):
     file = models.FileField(
         max_length=255,
         upload_to="uploaded_files/%y/%m/%d",
+        storage=blob_storage,  # الملفات المتطابقة تُخزن مرة واحدة
         validators=[
             FileExtensionValidator([
                 # Documents
@@ -70,12 +82,19 @@ class File(models.Model):
         related_name="files",  # اسم العلاقة العكسية (للوصول إلى الملفات من الدورة)
         limit_choices_to={'status': True}
     )
+    preview_status = models.CharField(
+        max_length=10,
+        choices=PreviewStatuses.choices,
+        default=PreviewStatuses.PENDING,  # تولّده عمليات run_previews بعد الحفظ
+        editable=False,
+        db_index=True,
+    )
 
     def clean(self):
         super().clean()
         self.description = self.description.strip().capitalize()
         # Validate file size (max 80MB)
-        if self.file and self.file.size > 80 * 1024 * 1024:
+        if self.file and self.file.size > FILE_MAX_SIZE:
             logger.error("File size exceeds limit for file: %s", self.file.name)
             raise ValidationError(_("File size must be less than 80MB."))
                 # تحقق من وصف الملف
@@ -89,18 +108,9 @@ class File(models.Model):
         
 
     def save(self, *args, **kwargs):
-        # Auto-detect file name, size, and type on save
-        if self.file:
-
-            original_name = os.path.basename(self.file.name) # Get file name
-            if len(original_name) > 100:
-                self.name = original_name[:97] + '...'  # تقصير الاسم مع إضافة "..."
-            else:
-                self.name = original_name
-
-            self.size = self.file.size  # تحويل الحجم إلى تنسيق قابل للقراءة
-            self.type = self.get_file_extension()  # Detect file extension/type
-            self.category = self.detect_category()  # Detect and set the category
+        # Auto-detect file name, size, and type when a new file is uploaded
+        if self.file and not self.file._committed:
+            self.describe_file(self.file.name)
 
         super().save(*args, **kwargs)
         if hasattr(self, 'upload_by') and self.upload_by:
@@ -108,14 +118,35 @@ class File(models.Model):
         else:
             logger.info("File '%s' saved.", self.name)
 
+    def describe_file(self, original_name):
+        """Set name, size, type and category; the stored name is a content hash, so they come from the upload."""
+        original_name = os.path.basename(original_name) # Get file name
+        if len(original_name) > 100:
+            self.name = original_name[:97] + '...'  # تقصير الاسم مع إضافة "..."
+        else:
+            self.name = original_name
+
+        self.size = self.file.size  # تحويل الحجم إلى تنسيق قابل للقراءة
+        self.type = self.get_file_extension()  # Detect file extension/type
+        self.category = self.detect_category()  # Detect and set the category
+        self.preview_status = self.PreviewStatuses.PENDING
+
     def delete(self, *args, **kwargs):
-        # حذف الملف المخزن عند حذف الكائن
+        # الملف المخزن قد يكون مشتركاً: إشارة post_delete تنقص مراجعه ولا تحذفه إلا إذا لم يبق له مرجع
         logger.warning("Initiating delete process for File: %s", self.file.name if self.file else "No file")
-        if self.file and os.path.isfile(self.file.path):
-            os.remove(self.file.path)  # حذف الملف الفعلي من نظام الملفات
         super().delete(*args, **kwargs)
         logger.info("File deleted from database: %s", self.file.name if self.file else "No file")
 
+    def can_be_downloaded_by(self, user):
+        """Approved files are open to every user; pending and rejected ones to their uploader and the admins."""
+        if self.status == 'APPROVED':
+            return True
+        return self.upload_by_id == user.pk or user.role == User.Roles.ADMIN or user.is_staff
+
+    @property
+    def preview_name(self):
+        return derivative_name(self.file.name, PREVIEW_SUFFIX)
+
     def get_file_extension(self):
         _, ext = os.path.splitext(self.file.name)
         ext = ext.lower().replace('.', '')
@@ -165,6 +196,19 @@ class File(models.Model):
         verbose_name = "File"
         verbose_name_plural = "Library Files"
 
+class FileSearchDocument(models.Model):
+    """
+    Denormalized search text of a library File: its name plus description,
+    course and uploader. Kept up to date by the signals in admin_app.signals
+    and searched by admin_app.search.
+    """
+    file = models.OneToOneField(File, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    title = models.CharField(max_length=255, blank=True, default='')  # اسم الملف مقسماً إلى كلمات
+    body = models.TextField(blank=True, default='')  # الوصف واسم المقرر واسم الرافع
+
+    def __str__(self):
+        return self.title
+
 class ParentAll(models.Model):
     name = models.CharField(max_length=100, unique=True)  # Common name field for all entities
     status = models.BooleanField(default=True)  # Common status field (active/inactive)
@@ -280,9 +324,43 @@ class User(AbstractUser):
     birth_date = models.DateField(null=False, blank=False)
     role = models.CharField(max_length=10, choices=Roles.choices,)
     image = models.ImageField(upload_to='user_images/%y/%m/%d',)
+    has_image = models.BooleanField(default=False, editable=False)  # مقاسات الصورة المصغرة موجودة (admin_app.avatars)
+    avatar_pending = models.BooleanField(default=False, editable=False, db_index=True)  # تولّدها build_avatars --watch بعد الحفظ
+
+    _saved_image = None  # اسم الصورة المحفوظ في قاعدة البيانات
 
     class Meta:
         unique_together = ('first_name', 'last_name',)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            instance._saved_image = values[field_names.index('image')]
+        return instance
+
+    def save(self, *args, **kwargs):
+        # 'image' غائب عن __dict__ إذا كان الحقل مؤجلاً ولم يُغيَّر
+        image_loaded = 'image' in self.__dict__
+        if image_loaded and self.image.name != self._saved_image:
+            # المقاسات تُولَّد خارج الطلب (وخارج صفوف الاستيراد) بأمر build_avatars
+            self.has_image = False
+            self.avatar_pending = bool(self.image)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'has_image', 'avatar_pending'}
+        super().save(*args, **kwargs)
+        if image_loaded:
+            self._saved_image = self.image.name
+
+    def refresh_avatars(self):
+        """Render the avatar variants of the current image and record whether they exist."""
+        has_image = bool(self.image) and save_avatars(self.image.storage, self.image.name)
+        # الشرط على image يتجاهل صورة استُبدلت أثناء التوليد
+        User.objects.filter(pk=self.pk, image=self.image.name).update(has_image=has_image, avatar_pending=False)
+        self.has_image = has_image
+        self.avatar_pending = False
+        return has_image
         
     def clean(self):
         super().clean()  # استدعاء التحقق الأساسي للنموذج
@@ -316,13 +394,19 @@ class User(AbstractUser):
         logger.info("Clean completed for User: %s %s", self.first_name, self.last_name)
     
     
-    def get_profile_image_url(self):
+    def get_profile_image_url(self, size='small'):
         """
-        Returns the URL of the user's profile image if it exists, otherwise the default logo.
+        Returns the URL of the user's avatar at `size` (see AVATAR_SIZES), otherwise the default logo.
         """
-        if self.image and os.path.isfile(self.image.path):  # تحقق من وجود الملف فعليًا
-            return self.image.url
+        if self.has_image:  # لا فحص لنظام الملفات عند كل عرض
+            return self.image.storage.url(avatar_name(self.image.name, size))
         return static('img/user_black.svg')  # الصورة الافتراضية
+
+    def get_medium_profile_image_url(self):
+        return self.get_profile_image_url('medium')
+
+    def get_large_profile_image_url(self):
+        return self.get_profile_image_url('large')
     
     def get_formatted_number_birth_date(self):
         return self.birth_date.strftime('%d-%m-%Y')
@@ -400,6 +484,19 @@ class  Student(models.Model):
     def __str__(self):
         return f"{self.user.get_full_name()}"
 
+class PersonSearchDocument(models.Model):
+    """
+    Denormalized, lower-cased search text of a student or instructor: names,
+    contact details, birth date, and department/group or departments/courses.
+    Kept up to date by the signals in admin_app.signals and searched by
+    admin_app.search.search_people.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    document = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return self.document[:50]
+
 class StudentCourse(models.Model):
     class Levels(models.TextChoices):
         STUDY = 'STUDY', _('Study')
@@ -462,6 +559,114 @@ class AccountRequest(models.Model):
         verbose_name = "Account Request"
         verbose_name_plural = "Account Requests"
 
+class DailyActivity(models.Model):
+    """
+    Rollup of library uploads and account requests per day, kept up to date
+    by the signals in admin_app.signals so that the dashboard trends in
+    admin_app.stats never scan the base tables.
+    """
+    class Kinds(models.TextChoices):
+        UPLOADS = 'uploads', _('Uploads')
+        ACCOUNT_REQUESTS = 'account_requests', _('Account requests')
+
+    kind = models.CharField(max_length=20, choices=Kinds.choices)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('kind', 'day',)
+        verbose_name_plural = "Daily activity"
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.day}: {self.count}"
+
+class ImportExportJob(models.Model):
+    """
+    An admin import or export run in the background by the run_jobs workers
+    (admin_app.jobs), with its progress, its resume point and its result file.
+    """
+    class Kinds(models.TextChoices):
+        IMPORT = 'IMPORT', _('Import')
+        EXPORT = 'EXPORT', _('Export')
+
+    class Statuses(models.TextChoices):
+        PENDING = 'PENDING', _('Pending')
+        RUNNING = 'RUNNING', _('Running')
+        DONE = 'DONE', _('Done')
+        FAILED = 'FAILED', _('Failed')
+
+    kind = models.CharField(max_length=10, choices=Kinds.choices)
+    status = models.CharField(max_length=10, choices=Statuses.choices, default=Statuses.PENDING)
+    resource = models.CharField(max_length=255)  # المسار الكامل لصنف الـ Resource
+    input_format = models.CharField(max_length=255, blank=True)  # المسار الكامل لصيغة ملف الاستيراد
+    input_file = models.FileField(upload_to=job_input_name, storage=job_storage, blank=True)  # خارج MEDIA_ROOT
+    selected_ids = models.JSONField(default=list, blank=True)  # المفاتيح الأساسية للصفوف المصدّرة، مرتبة
+    result_file = models.FileField(storage=job_storage, blank=True)  # اسم عشوائي يولّده admin_app.jobs
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    checkpoint = models.JSONField(default=dict, blank=True)  # نقطة الاستئناف بعد انقطاع العامل
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+        verbose_name = "Import/Export Job"
+        verbose_name_plural = "Import/Export Jobs"
+
+    def progress(self):
+        """Processed rows in percent, 0 until the total is known."""
+        if self.status == self.Statuses.DONE:
+            return 100
+        return int(self.processed_rows * 100 / self.total_rows) if self.total_rows else 0
+
+    def result_filename(self):
+        """Name the result is downloaded under; the stored name is random."""
+        suffix = '-report.csv' if self.kind == self.Kinds.IMPORT else '.csv'
+        return f"{self.get_kind_display().lower()}-{self.pk}{suffix}"
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.resource.rsplit('.', 1)[-1]})"
+
+class Blob(models.Model):
+    """
+    A file in the content-addressed storage (admin_app.storage) and the
+    number of stored names that point to it.
+    """
+    name = models.CharField(max_length=255, unique=True)  # blobs/ab/cd/<sha256><ext>
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField()
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.references})"
+
+class UploadSession(models.Model):
+    """
+    A library file being uploaded in chunks (admin_app.uploads). The chunks
+    are appended to a temporary file until `received` reaches `size`, then
+    the upload is finalized into a File.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)  # البايتات المكتوبة في الملف المؤقت، ومنها يستأنف العميل
+    checksum = models.CharField(max_length=64, blank=True)  # SHA-256 الذي أرسله العميل
+    description = models.TextField(max_length=500)
+    course = models.ForeignKey('Course', on_delete=models.CASCADE, related_name='upload_sessions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
 def default_expiry():
      return now() + timedelta(minutes=5)
 
@@ -0,0 +1,201 @@
+"""
+Keyset pagination and streaming "show all" for the list pages
+(students_list, instructors_list, library_view).
+
+A page is fetched with `WHERE (ordering field, pk) > cursor ORDER BY ...
+LIMIT n` instead of COUNT + OFFSET, so every page costs the same no matter
+how deep it is. The cursor is the ordering name plus the (value, pk) of the
+edge row, passed back as ?after= / ?before=.
+
+The "Total Records" line comes from estimated_total(): on PostgreSQL a list
+past ESTIMATED_COUNT_THRESHOLD rows shows the planner's estimate of the
+filtered query instead of running a COUNT over it.
+"""
+import base64
+import json
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+from django.http import StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+from .changelists import ESTIMATED_COUNT_THRESHOLD
+
+PAGE_SIZE = 10
+STREAM_CHUNK_SIZE = 500
+STREAM_MARKER = '<!-- stream-rows -->'
+
+
+class KeysetPage:
+    """One page of rows; iterable like a Paginator page, with cursors to its neighbours."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def estimated_total(queryset):
+    """(number of rows, whether it is an estimate) for the total shown above a list."""
+    queryset = queryset.order_by()
+    if connections[queryset.db].vendor == 'postgresql':
+        plan = json.loads(queryset.explain(format='json'))
+        if isinstance(plan, list):  # psycopg يعيد القائمة، وقد يفكها Django إلى عنصرها الوحيد
+            plan = plan[0]
+        estimate = int(plan['Plan']['Plan Rows'])
+        if estimate >= ESTIMATED_COUNT_THRESHOLD:
+            return estimate, True
+    return queryset.count(), False  # عدد صغير: العدّ الدقيق رخيص
+
+
+def encode_cursor(*values):
+    data = json.dumps(values, cls=DjangoJSONEncoder).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for anything malformed."""
+    data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    values = json.loads(data)
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor.")
+    return values
+
+
+def keyset_order(field, descending):
+    # NULL يعتبر أصغر قيمة في الاتجاهين حتى يتطابق الترتيب مع شرط المؤشر
+    if descending:
+        return [F(field).desc(nulls_last=True), '-pk']
+    return [F(field).asc(nulls_first=True), 'pk']
+
+
+def rows_after(field, value, pk, descending):
+    """Q for the rows that come strictly after (value, pk) in the given order."""
+    op = 'lt' if descending else 'gt'
+    if value is None:
+        if descending:
+            return Q(**{f'{field}__isnull': True, f'pk__{op}': pk})
+        return Q(**{f'{field}__isnull': True, 'pk__gt': pk}) | Q(**{f'{field}__isnull': False})
+    condition = Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'pk__{op}': pk})
+    if descending:
+        condition |= Q(**{f'{field}__isnull': True})
+    return condition
+
+
+def paginate_keyset(queryset, ordering, after=None, before=None, page_size=PAGE_SIZE):
+    """
+    Return the KeysetPage of `queryset` ordered by `ordering` (a whitelisted
+    field path, optionally prefixed with '-') that follows the `after`
+    cursor or precedes the `before` cursor. A cursor from another ordering,
+    or a malformed one, starts again from the first page.
+    """
+    descending = ordering.startswith('-')
+    field = ordering.lstrip('-')
+    backwards = bool(before) and not after
+    cursor = after or before
+
+    queryset = queryset.annotate(keyset_value=F(field))
+    position = None
+    if cursor:
+        try:
+            cursor_ordering, value, pk = decode_cursor(cursor)
+            if cursor_ordering == ordering:
+                queryset = queryset.filter(rows_after(field, value, pk, descending != backwards))
+                position = (value, pk)
+        except (ValueError, TypeError, ValidationError):
+            pass
+    if position is None:
+        backwards = False
+
+    rows = list(queryset.order_by(*keyset_order(field, descending != backwards))[:page_size + 1])
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+        has_previous, has_next = more, True
+    else:
+        has_previous, has_next = position is not None, more
+
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(ordering, rows[-1].keyset_value, rows[-1].pk) if has_next and rows else None,
+        previous_cursor=encode_cursor(ordering, rows[0].keyset_value, rows[0].pk) if has_previous and rows else None,
+    )
+
+
+def paginate_ranked(queryset, ranked_ids, after=None, before=None, page_size=PAGE_SIZE):
+    """
+    Page through `queryset` in the order of `ranked_ids` (search relevance).
+    The cursor is a position in the ranked list, which search keeps short.
+    """
+    matching = set(queryset.filter(pk__in=ranked_ids).values_list('pk', flat=True))
+    ordered_ids = [pk for pk in ranked_ids if pk in matching]
+
+    start = 0
+    try:
+        if after:
+            start = int(decode_cursor(after)[1])
+        elif before:
+            start = max(int(decode_cursor(before)[1]) - page_size, 0)
+    except (ValueError, TypeError, IndexError):
+        start = 0
+    start = min(max(start, 0), len(ordered_ids))
+
+    page_ids = ordered_ids[start:start + page_size]
+    objects = queryset.in_bulk(page_ids)
+    rows = [objects[pk] for pk in page_ids if pk in objects]
+    end = start + len(page_ids)
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor('relevance', end) if end < len(ordered_ids) else None,
+        previous_cursor=encode_cursor('relevance', start) if start > 0 else None,
+    )
+
+
+def stream_list_response(request, template_name, context, rows_template, queryset, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Render `template_name` without its rows, then stream the rows of
+    `queryset` in chunks of `chunk_size`, each rendered with `rows_template`
+    (which loops over `rows`), so the full list is never held in memory.
+    The page template prints `stream_marker` where the rows belong.
+    """
+    page = render_to_string(template_name, dict(context, page_obj=[], stream_marker=STREAM_MARKER), request)
+    head, tail = page.split(STREAM_MARKER, 1)
+    rows_template = get_template(rows_template)
+
+    def render_rows():
+        yield head
+        objects = queryset.iterator(chunk_size=chunk_size)
+        rendered = False
+        while chunk := list(islice(objects, chunk_size)):
+            rendered = True
+            yield rows_template.render(dict(context, rows=chunk), request)
+        if not rendered:
+            yield rows_template.render(dict(context, rows=[]), request)  # رسالة "لا توجد نتائج"
+        yield tail
+
+    if isinstance(request, ASGIRequest):
+        # تحت ASGI يحوّل Django المكرر المتزامن إلى قائمة كاملة، لذلك نمرر الأجزاء واحداً واحداً
+        async def render_rows_async():
+            parts = render_rows()
+            while (part := await sync_to_async(next, thread_sensitive=True)(parts, None)) is not None:
+                yield part
+        return StreamingHttpResponse(render_rows_async(), content_type='text/html; charset=utf-8')
+    return StreamingHttpResponse(render_rows(), content_type='text/html; charset=utf-8')
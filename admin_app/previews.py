@@ -0,0 +1,161 @@
+"""
+Preview images of library files for the card view of library_view.
+
+A File is saved with preview_status PENDING. The run_previews command
+renders the pending files in a pool of worker processes, so uploads are
+not slowed:
+- images go through Pillow;
+- PDFs have their first page rendered by poppler's pdftoppm, when it is
+  installed;
+- Office and OpenDocument files use the thumbnail stored in their zip,
+  when the application that saved them wrote one.
+Other files are marked NONE and keep their icon.
+
+A preview is stored next to the blob it was made from
+(blobs/ab/cd/<sha256>.preview.webp), so files sharing a blob share their
+preview, and admin_app.storage removes it together with the blob.
+"""
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import zipfile
+from PIL import Image, ImageOps
+from .models import File
+from .storage import PREVIEW_SUFFIX, blob_storage, derivative_name
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SIZE = (400, 400)
+PREVIEW_QUALITY = 80
+PREVIEW_BATCH = 50
+PREVIEW_MAX_AGE = 60 * 60  # مدة احتفاظ المتصفح بالمعاينة
+PDF_RENDER_TIMEOUT = 30
+IMAGE_TYPES = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'webp'}
+ZIP_THUMBNAIL_TYPES = {'docx', 'xlsx', 'pptx', 'odt'}
+ZIP_THUMBNAILS = ('docProps/thumbnail.jpeg', 'docProps/thumbnail.png', 'Thumbnails/thumbnail.png')
+
+
+def can_preview(file_type):
+    if file_type == 'pdf':
+        return shutil.which('pdftoppm') is not None
+    return file_type in IMAGE_TYPES or file_type in ZIP_THUMBNAIL_TYPES
+
+
+def to_webp(image):
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(PREVIEW_SIZE)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    output = io.BytesIO()
+    image.save(output, 'WEBP', quality=PREVIEW_QUALITY)
+    return output.getvalue()
+
+
+def pdf_first_page(path):
+    with tempfile.TemporaryDirectory() as directory:
+        root = os.path.join(directory, 'page')
+        subprocess.run(
+            ['pdftoppm', '-png', '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(max(PREVIEW_SIZE) * 2), path, root],
+            check=True, capture_output=True, timeout=PDF_RENDER_TIMEOUT,
+        )
+        with Image.open(f"{root}.png") as page:
+            return to_webp(page)
+
+
+def zip_thumbnail(path):
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        for name in ZIP_THUMBNAILS:
+            if name in names:
+                with Image.open(io.BytesIO(archive.read(name))) as image:
+                    return to_webp(image)
+    return None
+
+
+def render_preview(path, file_type):
+    """WebP bytes of the preview, or None when the file has none. Runs in the worker processes, without the database."""
+    if file_type in IMAGE_TYPES:
+        with Image.open(path) as image:
+            image.seek(0)  # الإطار الأول من GIF أو TIFF
+            return to_webp(image)
+    if file_type == 'pdf':
+        return pdf_first_page(path)
+    if file_type in ZIP_THUMBNAIL_TYPES:
+        return zip_thumbnail(path)
+    return None
+
+
+def render_task(task):
+    name, path, file_type = task
+    try:
+        return name, render_preview(path, file_type), ''
+    except Exception as e:
+        return name, None, f"{type(e).__name__}: {e}"
+
+
+def pending_previews(limit=PREVIEW_BATCH):
+    """(stored name, type) of files waiting for a preview; a blob shared by several files is listed once."""
+    return list(
+        File.objects.filter(preview_status=File.PreviewStatuses.PENDING)
+        .order_by().values_list('file', 'type').distinct()[:limit]
+    )
+
+
+def mark_preview(name, status):
+    # الشرط على file يتجاهل ملفاً استُبدل أثناء التوليد
+    return File.objects.filter(file=name, preview_status=File.PreviewStatuses.PENDING).update(preview_status=status)
+
+
+def store_preview(name, data):
+    if data is None:
+        mark_preview(name, File.PreviewStatuses.NONE)
+        return
+    path = blob_storage.path(derivative_name(name, PREVIEW_SUFFIX))
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            output.write(data)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+    if blob_storage.file_permissions_mode is not None:
+        os.chmod(path, blob_storage.file_permissions_mode)
+    mark_preview(name, File.PreviewStatuses.READY)
+
+
+def work(pool, poll=2.0, once=False, stop=None):
+    """Render pending previews with `pool` until `stop` is set; with `once`, until none is left."""
+    while not (stop and stop.is_set()):
+        tasks = []
+        for name, file_type in pending_previews():
+            if blob_storage.exists(derivative_name(name, PREVIEW_SUFFIX)):
+                mark_preview(name, File.PreviewStatuses.READY)  # معاينة الـ blob موجودة من ملف مطابق
+            elif not can_preview(file_type):
+                mark_preview(name, File.PreviewStatuses.NONE)
+            else:
+                tasks.append((name, blob_storage.path(name), file_type))
+        if not tasks:
+            if once and not pending_previews(1):
+                break
+            if not once:
+                time.sleep(poll)
+            continue
+
+        started = time.perf_counter()
+        for name, data, error in pool.imap_unordered(render_task, tasks):
+            if error:
+                mark_preview(name, File.PreviewStatuses.FAILED)
+                logger.warning("Preview of %s failed: %s", name, error)
+            else:
+                try:
+                    store_preview(name, data)
+                except Exception:
+                    # القرص ممتلئ أو الصلاحيات... يفشل هذا الملف وحده وتُكمل الدفعة
+                    logger.exception("Storing the preview of %s failed.", name)
+                    mark_preview(name, File.PreviewStatuses.FAILED)
+        logger.info("Rendered %s previews in %.1f s", len(tasks), time.perf_counter() - started)
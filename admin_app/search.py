@@ -0,0 +1,251 @@
+"""
+Search backends over denormalized search documents kept in sync by
+admin_app.signals.
+
+Library files (FileSearchDocument): on PostgreSQL a weighted tsvector column
+with a GIN index and prefix matching, falling back to pg_trgm word
+similarity when nothing matches (typos). Other databases (SQLite in
+development) use an in-process inverted index with prefix and close-match
+expansion, rebuilt when the library version changes.
+
+Students and instructors (PersonSearchDocument): substring matching of every
+query word, served by a pg_trgm GIN index on PostgreSQL and by an FTS5
+trigram table on SQLite.
+"""
+import bisect
+import difflib
+import threading
+import time
+import re
+from collections import defaultdict
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from .models import FileSearchDocument, PersonSearchDocument
+
+LIBRARY_VERSION_KEY = 'library_version'
+SEARCH_MAX_RESULTS = 1000
+MAX_QUERY_TERMS = 8
+TRIGRAM_THRESHOLD = 0.4
+
+# أوزان الحقول ودرجة التطابق في الفهرس الاحتياطي
+TITLE_WEIGHT = 1.0
+BODY_WEIGHT = 0.4
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.8
+CLOSE_MATCH = 0.5
+MAX_EXPANSIONS = 50
+
+PEOPLE_FTS_TABLE = 'admin_app_personsearchdocument_fts'
+TRIGRAM_MIN_LENGTH = 3
+
+_python_index = None
+_python_index_lock = threading.Lock()
+_people_fts_available = None
+
+
+def tokenize(text):
+    """Lower-case word tokens; underscores, dots and dashes split words."""
+    return re.findall(r'[^\W_]+', (text or '').lower())
+
+
+def build_document(file):
+    """Return (title, body) search text for a File with course and upload_by loaded."""
+    uploader = file.upload_by
+    body = [
+        file.description,
+        file.course.name if file.course_id else '',
+        f"{uploader.first_name} {uploader.last_name} {uploader.username}" if uploader else '',
+    ]
+    return ' '.join(tokenize(file.name))[:255], ' '.join(part for part in body if part)
+
+
+def refresh_documents(files):
+    """Rebuild the search documents of a File queryset (one SELECT, one upsert)."""
+    documents = []
+    for file in files.select_related('course', 'upload_by'):
+        title, body = build_document(file)
+        documents.append(FileSearchDocument(file=file, title=title, body=body))
+    if documents:
+        FileSearchDocument.objects.bulk_create(
+            documents, update_conflicts=True, unique_fields=['file'], update_fields=['title', 'body'],
+        )
+    bump_library_version()
+    return len(documents)
+
+
+def get_library_version():
+    """Current library version; any change to the library files changes it."""
+    version = cache.get(LIBRARY_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(LIBRARY_VERSION_KEY, version, None)
+        version = cache.get(LIBRARY_VERSION_KEY, version)
+    return version
+
+
+def bump_library_version():
+    cache.set(LIBRARY_VERSION_KEY, time.time_ns(), None)
+
+
+def search_library(query, limit=SEARCH_MAX_RESULTS):
+    """Return the ids of approved files matching `query`, best match first."""
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(terms, limit)
+    return [file_id for file_id, _ in get_python_index().search(terms, limit)]
+
+
+def _search_postgresql(terms, limit):
+    # tokenize() لا يُبقي إلا حروفاً وأرقاماً، لذلك بناء tsquery هنا آمن
+    tsquery = ' & '.join(f"{term}:*" for term in terms)
+    text = ' '.join(terms)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT d.file_id FROM admin_app_filesearchdocument d
+            JOIN admin_app_file f ON f.id = d.file_id
+            WHERE f.status = 'APPROVED' AND d.search_vector @@ to_tsquery('simple', %s)
+            ORDER BY ts_rank(d.search_vector, to_tsquery('simple', %s)) DESC, f.upload_date DESC
+            LIMIT %s
+            """,
+            [tsquery, tsquery, limit],
+        )
+        rows = cursor.fetchall()
+    if not rows:
+        # لا توجد نتائج مطابقة: نجرب التشابه الحرفي لتجاوز الأخطاء الإملائية
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", [str(TRIGRAM_THRESHOLD)])
+            cursor.execute(
+                """
+                SELECT d.file_id FROM admin_app_filesearchdocument d
+                JOIN admin_app_file f ON f.id = d.file_id
+                WHERE f.status = 'APPROVED' AND %s <%% (d.title || ' ' || d.body)
+                ORDER BY word_similarity(%s, d.title || ' ' || d.body) DESC, f.upload_date DESC
+                LIMIT %s
+                """,
+                [text, text, limit],
+            )
+            rows = cursor.fetchall()
+    return [file_id for file_id, in rows]
+
+
+class InvertedIndex:
+    """In-memory token -> {file_id: weight} index over the approved files."""
+
+    def __init__(self, documents):
+        self.postings = defaultdict(dict)
+        for file_id, title, body in documents:
+            for token in tokenize(body):
+                self.postings[token][file_id] = max(self.postings[token].get(file_id, 0), BODY_WEIGHT)
+            for token in tokenize(title):
+                self.postings[token][file_id] = TITLE_WEIGHT
+        self.tokens = sorted(self.postings)
+
+    def expand(self, term):
+        """Index tokens a query term matches, with the quality of each match."""
+        expansions = []
+        start = bisect.bisect_left(self.tokens, term)
+        for token in self.tokens[start:start + MAX_EXPANSIONS]:
+            if not token.startswith(term):
+                break
+            expansions.append((token, EXACT_MATCH if token == term else PREFIX_MATCH))
+        if not expansions:
+            expansions = [(token, CLOSE_MATCH) for token in difflib.get_close_matches(term, self.tokens, n=5, cutoff=0.75)]
+        return expansions
+
+    def search(self, terms, limit):
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for token, quality in self.expand(term):
+                for file_id, weight in self.postings[token].items():
+                    term_scores[file_id] = max(term_scores.get(file_id, 0), weight * quality)
+            # كل كلمة في البحث يجب أن تطابق الملف
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {file_id: scores[file_id] + score for file_id, score in term_scores.items() if file_id in scores}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+
+
+def get_python_index():
+    """The process-wide InvertedIndex, rebuilt when the library version has changed."""
+    global _python_index
+    version = get_library_version()
+    with _python_index_lock:
+        if _python_index is None or _python_index[0] != version:
+            documents = FileSearchDocument.objects.filter(file__status='APPROVED').values_list('file_id', 'title', 'body')
+            _python_index = (version, InvertedIndex(documents.iterator()))
+        return _python_index[1]
+
+
+def build_person_document(user):
+    """Search text of a user, with its student or instructor profile loaded."""
+    parts = [str(user.id), user.first_name, user.last_name, user.username, user.email, str(user.phone or '')]
+    if user.birth_date:
+        parts += [user.birth_date.isoformat(), user.get_formatted_number_birth_date()]
+    student = getattr(user, 'students', None)
+    if student is not None:
+        parts += [str(student.level), student.department.name, student.group.name]
+    instructor = getattr(user, 'instructors', None)
+    if instructor is not None:
+        parts += [department.name for department in instructor.departments.all()]
+        parts += [course.name for course in instructor.courses.all()]
+    return ' '.join(part for part in parts if part).lower()
+
+
+def refresh_people(users, chunk_size=2000):
+    """Rebuild the search documents of a User queryset, one upsert per chunk."""
+    users = (
+        users.select_related('students__department', 'students__group')
+        .prefetch_related('instructors__departments', 'instructors__courses')
+    )
+    documents = []
+    for user in users.iterator(chunk_size=chunk_size):
+        documents.append(PersonSearchDocument(user=user, document=build_person_document(user)))
+        if len(documents) >= chunk_size:
+            _save_person_documents(documents)
+            documents = []
+    _save_person_documents(documents)
+
+
+def _save_person_documents(documents):
+    if documents:
+        PersonSearchDocument.objects.bulk_create(
+            documents, update_conflicts=True, unique_fields=['user'], update_fields=['document'],
+        )
+
+
+def people_fts_available():
+    global _people_fts_available
+    if _people_fts_available is None:
+        _people_fts_available = PEOPLE_FTS_TABLE in connection.introspection.table_names()
+    return _people_fts_available
+
+
+def search_people(query):
+    """
+    Return a values('user_id') queryset of the users whose search document
+    contains every word of `query`, to be used as `user_id__in=` so the
+    list views stay a single query.
+    """
+    terms = query.lower().split()[:MAX_QUERY_TERMS]
+    documents = PersonSearchDocument.objects.all()
+    if connection.vendor == 'sqlite' and people_fts_available():
+        long_terms = [term for term in terms if len(term) >= TRIGRAM_MIN_LENGTH]
+        if long_terms:
+            match = ' AND '.join('"%s"' % term.replace('"', '""') for term in long_terms)
+            documents = documents.filter(user_id__in=RawSQL(
+                f"SELECT rowid FROM {PEOPLE_FTS_TABLE} WHERE {PEOPLE_FTS_TABLE} MATCH %s", [match],
+            ))
+            # مقاطع trigram تحتاج 3 أحرف على الأقل، الكلمات الأقصر تُطابق بـ LIKE
+            terms = [term for term in terms if len(term) < TRIGRAM_MIN_LENGTH]
+    for term in terms:
+        # على PostgreSQL يستخدم LIKE فهرس gin_trgm_ops
+        documents = documents.filter(document__contains=term)
+    return documents.values('user_id')
@@ -1,11 +1,18 @@
-from django.db.models.signals import pre_save, post_delete
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.db.models import Q
 from django.dispatch import receiver
 import os
-from .models import User, File
+from .avatars import delete_avatars
+from .models import User, File, Course, Department, Group, Student, Instructor, AccountRequest, DailyActivity
+from .search import bump_library_version, refresh_documents, refresh_people
+from .courses import invalidate_course_lookup
+from .stats import COUNTER_MODELS, adjust_counter, record_activity
+
+PERSON_SEARCH_FIELDS = {'first_name', 'last_name', 'username', 'email', 'phone', 'birth_date'}
 
 @receiver(pre_save, sender=File)
 def delete_old_file(sender, instance, **kwargs):
-    """Delete old file when the user updates the file."""
+    """Release the old file when the user updates the file."""
     if instance.pk:
         try:
             old_file = File.objects.get(pk=instance.pk).file
@@ -14,14 +21,13 @@ def delete_old_file(sender, instance, **kwargs):
         new_file = instance.file
         # Check if the old file exists and is different from the new file
         if old_file and old_file != new_file:
-            if os.path.isfile(old_file.path):
-                os.remove(old_file.path)
+            old_file.storage.delete(old_file.name)  # ينقص مراجع الملف، ولا يُحذف إلا إذا لم يعد مستخدماً
 
 @receiver(post_delete, sender=File)
 def delete_file_on_delete(sender, instance, **kwargs):
-    """Delete file when the file instance is deleted."""
-    if instance.file and os.path.isfile(instance.file.path):
-        os.remove(instance.file.path)
+    """Release the file when the file instance is deleted."""
+    if instance.file:
+        instance.file.storage.delete(instance.file.name)
 
 @receiver(pre_save, sender=User)
 def delete_old_image(sender, instance, **kwargs):
@@ -35,9 +41,117 @@ def delete_old_image(sender, instance, **kwargs):
         if old_image and old_image != new_image:
             if os.path.isfile(old_image.path):
                 os.remove(old_image.path)
+            delete_avatars(old_image.storage, old_image.name)
 
 @receiver(post_delete, sender=User)
 def delete_image_on_user_delete(sender, instance, **kwargs):
     """Delete image file when the user is deleted."""
     if instance.image and os.path.isfile(instance.image.path):
-        os.remove(instance.image.path)
\ No newline at end of file
+        os.remove(instance.image.path)
+    if instance.image:
+        delete_avatars(instance.image.storage, instance.image.name)
+
+@receiver(post_save, sender=File)
+def update_file_search_document(sender, instance, **kwargs):
+    """Re-index the file after it is created or edited."""
+    refresh_documents(File.objects.filter(pk=instance.pk))
+
+@receiver(post_delete, sender=File)
+def bump_library_on_file_delete(sender, instance, **kwargs):
+    """The search document is removed by the cascade, only the version changes."""
+    bump_library_version()
+
+@receiver(post_save, sender=Course)
+def update_course_files_search_documents(sender, instance, created, **kwargs):
+    """A renamed course changes the search text of all its files."""
+    if not created:
+        refresh_documents(File.objects.filter(course=instance))
+
+@receiver(post_save, sender=User)
+def update_uploader_files_search_documents(sender, instance, created, update_fields=None, **kwargs):
+    """A renamed uploader changes the search text of all their files."""
+    if created or (update_fields and not {'first_name', 'last_name', 'username'} & set(update_fields)):
+        return  # مثلاً تحديث last_login عند تسجيل الدخول
+    if instance.files.exists():
+        refresh_documents(File.objects.filter(upload_by=instance))
+
+@receiver(post_save, sender=User)
+def update_person_search_document(sender, instance, update_fields=None, **kwargs):
+    """Re-index a student or instructor after their account details change."""
+    if instance.role not in (User.Roles.STUDENT, User.Roles.INSTRUCTOR):
+        return
+    if update_fields and not PERSON_SEARCH_FIELDS & set(update_fields):
+        return
+    refresh_people(User.objects.filter(pk=instance.pk))
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Instructor)
+def update_profile_search_document(sender, instance, **kwargs):
+    """Level, department, group, courses... live on the profile, not the user."""
+    refresh_people(User.objects.filter(pk=instance.user_id))
+
+@receiver(m2m_changed, sender=Instructor.departments.through)
+@receiver(m2m_changed, sender=Instructor.courses.through)
+def update_instructor_search_document(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        refresh_people(User.objects.filter(pk=instance.user_id))
+    elif pk_set:  # department.instructors.add(...) / course.instructors.add(...)
+        refresh_people(User.objects.filter(instructors__pk__in=pk_set))
+
+@receiver(post_save, sender=Department)
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=Course)
+def update_people_search_documents_on_rename(sender, instance, created, **kwargs):
+    """A renamed department, group or course changes the search text of its people."""
+    if created:
+        return
+    if sender is Department:
+        users = User.objects.filter(Q(students__department=instance) | Q(instructors__departments=instance))
+    elif sender is Group:
+        users = User.objects.filter(students__group=instance)
+    else:
+        users = User.objects.filter(instructors__courses=instance)
+    refresh_people(users.distinct())
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Department)
+def invalidate_course_lookup_on_change(sender, **kwargs):
+    """A course's name or level changed, or a deleted row took its links with it."""
+    invalidate_course_lookup()
+
+@receiver(m2m_changed, sender=Course.departments.through)
+def invalidate_course_lookup_on_departments_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_course_lookup()
+
+COUNTER_NAMES = {model: name for name, model in COUNTER_MODELS.items()}
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Instructor)
+@receiver(post_save, sender=AccountRequest)
+@receiver(post_save, sender=File)
+def count_created_row(sender, instance, created, **kwargs):
+    """Keep the dashboard counters and the daily activity rollup in step with new rows."""
+    if not created:
+        return
+    adjust_counter(COUNTER_NAMES[sender], 1)
+    if sender is File:
+        record_activity(DailyActivity.Kinds.UPLOADS, instance.upload_date, 1)
+    elif sender is AccountRequest:
+        record_activity(DailyActivity.Kinds.ACCOUNT_REQUESTS, instance.created_at, 1)
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Instructor)
+@receiver(post_delete, sender=AccountRequest)
+@receiver(post_delete, sender=File)
+def count_deleted_row(sender, instance, **kwargs):
+    adjust_counter(COUNTER_NAMES[sender], -1)
+    if sender is File:
+        record_activity(DailyActivity.Kinds.UPLOADS, instance.upload_date, -1)
+    elif sender is AccountRequest:
+        record_activity(DailyActivity.Kinds.ACCOUNT_REQUESTS, instance.created_at, -1)
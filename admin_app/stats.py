@@ -0,0 +1,136 @@
+"""
+Admin dashboard statistics without scanning the base tables on every load.
+
+Counters (users, students, instructors, account requests, library files)
+live in the cache and are moved by +1/-1 from the post_save/post_delete
+receivers in admin_app.signals once the transaction commits. Writes that
+send no signals (bulk_create, raw SQL) or increments lost between a count
+and its store are corrected by reconcile_counters(), which recounts every
+STATS_RECONCILE_INTERVAL seconds on the next read and from the
+reconcile_dashboard_stats command.
+
+Trends (uploads per day, account requests per week) are read from the
+DailyActivity rollup, which the same receivers keep up to date in the
+writing transaction.
+"""
+import datetime
+from collections import defaultdict
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import AccountRequest, DailyActivity, File, Instructor, Student, User
+
+STATS_CACHE_PREFIX = 'dashboard_stats'
+STATS_RECONCILE_INTERVAL = 10 * 60
+UPLOAD_TREND_DAYS = 14
+REQUEST_TREND_WEEKS = 8
+
+# اسم العدّاد: النموذج الذي يُعدّ
+COUNTER_MODELS = {
+    'users': User,
+    'students': Student,
+    'instructors': Instructor,
+    'account_requests': AccountRequest,
+    'files': File,
+}
+
+RECONCILED_KEY = f"{STATS_CACHE_PREFIX}:reconciled"
+
+
+def counter_key(name):
+    return f"{STATS_CACHE_PREFIX}:{name}"
+
+
+def reconcile_counters():
+    """Recount every counter from its table and store the real values."""
+    counts = {name: model.objects.count() for name, model in COUNTER_MODELS.items()}
+    cache.set_many({counter_key(name): count for name, count in counts.items()}, None)
+    cache.set(RECONCILED_KEY, True, STATS_RECONCILE_INTERVAL)
+    return counts
+
+
+def get_counters():
+    """{counter name: count}, reconciled first when stale or evicted."""
+    if cache.get(RECONCILED_KEY) is None:
+        return reconcile_counters()
+    keys = {counter_key(name): name for name in COUNTER_MODELS}
+    values = cache.get_many(keys)
+    if len(values) < len(keys):
+        return reconcile_counters()
+    return {keys[key]: value for key, value in values.items()}
+
+
+def adjust_counter(name, delta):
+    """Move a counter by `delta` once the current transaction commits."""
+    def apply():
+        try:
+            cache.incr(counter_key(name), delta)
+        except ValueError:
+            pass  # العدّاد غير موجود في الذاكرة المؤقتة، وستعيد القراءة التالية حسابه
+    transaction.on_commit(apply)
+
+
+def activity_day(moment):
+    if timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    return moment.date()
+
+
+def record_activity(kind, moment, delta):
+    """Add `delta` to the rollup row of `kind` on the day of `moment`."""
+    day = activity_day(moment)
+    rows = DailyActivity.objects.filter(kind=kind, day=day)
+    if rows.update(count=F('count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            DailyActivity.objects.create(kind=kind, day=day, count=delta)
+    except IntegrityError:
+        rows.update(count=F('count') + delta)  # أنشأ طلب آخر الصف في نفس اللحظة
+
+
+def rebuild_activity():
+    """Recompute the whole rollup from the base tables."""
+    rows = []
+    for kind, model, field in (
+        (DailyActivity.Kinds.UPLOADS, File, 'upload_date'),
+        (DailyActivity.Kinds.ACCOUNT_REQUESTS, AccountRequest, 'created_at'),
+    ):
+        days = model.objects.order_by().annotate(day=TruncDate(field)).values('day').annotate(count=Count('id'))
+        rows += [DailyActivity(kind=kind, day=row['day'], count=row['count']) for row in days if row['day']]
+    with transaction.atomic():
+        DailyActivity.objects.all().delete()
+        DailyActivity.objects.bulk_create(rows, batch_size=2000)
+    return len(rows)
+
+
+def bars(buckets):
+    """[(label, count)] -> rows with a width in percent of the largest bucket."""
+    largest = max((count for _, count in buckets), default=0) or 1
+    return [{'label': label, 'count': count, 'percent': round(count * 100 / largest)} for label, count in buckets]
+
+
+def get_trends(today=None):
+    """Uploads per day and account requests per week, from one query on the rollup."""
+    today = today or activity_day(timezone.now())
+    first_upload_day = today - datetime.timedelta(days=UPLOAD_TREND_DAYS - 1)
+    this_week = today - datetime.timedelta(days=today.weekday())
+    first_request_week = this_week - datetime.timedelta(weeks=REQUEST_TREND_WEEKS - 1)
+
+    uploads = defaultdict(int)
+    requests = defaultdict(int)
+    rows = DailyActivity.objects.filter(day__gte=min(first_upload_day, first_request_week), day__lte=today)
+    for kind, day, count in rows.values_list('kind', 'day', 'count'):
+        if kind == DailyActivity.Kinds.UPLOADS:
+            uploads[day] += count
+        else:
+            requests[day - datetime.timedelta(days=day.weekday())] += count
+
+    days = [first_upload_day + datetime.timedelta(days=offset) for offset in range(UPLOAD_TREND_DAYS)]
+    weeks = [first_request_week + datetime.timedelta(weeks=offset) for offset in range(REQUEST_TREND_WEEKS)]
+    return {
+        'uploads_per_day': bars([(day.strftime('%b %d'), uploads[day]) for day in days]),
+        'requests_per_week': bars([(week.strftime('%b %d'), requests[week]) for week in weeks]),
+    }
@@ -0,0 +1,180 @@
+"""
+Content-addressed storage for uploaded files.
+
+ContentAddressedStorage stores every upload under the SHA-256 of its
+content, in sharded directories: blobs/ab/cd/abcd...<ext>. The content is
+hashed while it is written to a temporary file, so identical uploads (the
+same lecture PDF from ten students) share one blob on disk, and two uploads
+with the same name never overwrite each other.
+
+A Blob row counts the references to each blob. save() adds one and
+delete() removes one; the file is unlinked once the transaction that
+dropped the last reference commits. Both take the Blob row lock, so an
+upload of the same content cannot land between the check and the unlink.
+Names from before this storage (no Blob row) are deleted directly.
+Derivatives made from a blob (its preview, see admin_app.previews) are
+stored next to it and deleted with it.
+
+JobFileStorage keeps the inputs and results of the import/export jobs in
+settings.JOB_FILES_ROOT, outside MEDIA_ROOT, under random names: exports
+hold personal data, so they are only sent by the job admin's result view.
+"""
+import hashlib
+import logging
+import os
+import secrets
+import tempfile
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = 'blobs'
+HASH_BUFFER_SIZE = 1024 * 1024
+PREVIEW_SUFFIX = 'preview.webp'
+DERIVATIVE_SUFFIXES = (PREVIEW_SUFFIX,)
+
+
+def blob_name(digest, original_name):
+    """blobs/ab/cd/<digest><ext>; the extension keeps the content type of the served file."""
+    ext = os.path.splitext(original_name)[1].lower()
+    if not (1 < len(ext) <= 10 and ext[1:].isalnum()):
+        ext = ''
+    return f"{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def blob_digest(name):
+    """The SHA-256 in a blob name, or None for a name stored before the blobs."""
+    if not name.startswith(f"{BLOB_DIR}/"):
+        return None
+    digest = os.path.splitext(os.path.basename(name))[0]
+    return digest if len(digest) == 64 else None
+
+
+def derivative_name(name, suffix):
+    """A file made from the blob `name`, shared by every name of the same content."""
+    digest = blob_digest(name)
+    if digest:
+        return f"{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}.{suffix}"
+    return f"{name}.{suffix}"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(HASH_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        return name  # الاسم النهائي يحدده المحتوى في _save
+
+    def _save(self, name, content):
+        if hasattr(content, 'temporary_file_path'):
+            # الملف مكتوب على القرص مسبقاً: يُقرأ مرة للحساب ثم يُنقل دون نسخ
+            return self.save_local(content.temporary_file_path(), name)
+
+        directory = self.path(f"{BLOB_DIR}/tmp")
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as destination:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    destination.write(chunk)
+            return self.save_local(temp, name, digest.hexdigest())
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def save_local(self, path, name, digest=None):
+        """Move the file at `path` into its blob and add a reference; a blob that already exists keeps its copy."""
+        from .models import Blob
+
+        digest = digest or file_sha256(path)
+        blob = blob_name(digest, name)
+        destination = self.path(blob)
+        with transaction.atomic():
+            row, _ = Blob.objects.select_for_update().get_or_create(
+                name=blob, defaults={'sha256': digest, 'size': os.path.getsize(path)}
+            )
+            if os.path.exists(destination):
+                os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                file_move_safe(path, destination, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(destination, self.file_permissions_mode)
+            Blob.objects.filter(pk=row.pk).update(references=F('references') + 1)
+        logger.debug("Blob %s stored for '%s' (%s references)", blob, name, row.references + 1)
+        return blob
+
+    def delete(self, name):
+        from .models import Blob
+
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        if not Blob.objects.filter(name=name, references__gt=0).update(references=F('references') - 1):
+            if not Blob.objects.filter(name=name).exists():
+                self.unlink(name)  # ملف من قبل التخزين بالمحتوى
+            return
+        transaction.on_commit(lambda: self.collect(name))
+
+    def collect(self, name):
+        """Unlink the blob if nothing references it any more."""
+        from .models import Blob
+
+        with transaction.atomic():
+            if Blob.objects.select_for_update().filter(name=name, references__lte=0).exists():
+                self.unlink(name)
+                Blob.objects.filter(name=name).delete()
+                logger.info("Blob %s removed, no references left", name)
+
+    def unlink(self, name):
+        super().delete(name)
+        for suffix in DERIVATIVE_SUFFIXES:
+            super().delete(derivative_name(name, suffix))
+
+
+@deconstructible
+class JobFileStorage(FileSystemStorage):
+    """Private files of the import/export jobs; they have no URL."""
+
+    @property
+    def base_location(self):
+        return settings.JOB_FILES_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    @property
+    def base_url(self):
+        return None  # لا رابط مباشر: التنزيل عبر result_view فقط
+
+
+def job_file_name(directory, original_name):
+    """<directory>/%y/%m/%d/<random><ext>; the name reveals neither the job nor the uploaded file."""
+    ext = os.path.splitext(original_name)[1].lower()
+    if not (1 < len(ext) <= 10 and ext[1:].isalnum()):
+        ext = ''
+    return timezone.now().strftime(f"{directory}/%y/%m/%d/{secrets.token_hex(16)}{ext}")
+
+
+def job_input_name(instance, filename):
+    return job_file_name('input', filename)
+
+
+blob_storage = ContentAddressedStorage()
+job_storage = JobFileStorage()
@@ -1,3 +1,1081 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from multiprocessing.pool import ThreadPool
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.log import configure_logging as configure_django_logging
+from import_export.formats.base_formats import CSV
+from PIL import Image
+from tablib import Dataset
+from sss import logqueue
+from sss.logqueue import RoutedQueueHandler, configure_logging, stop_listener
+from sss.logstore import StructuredLogHandler, list_segments, query_records, request_context
+from sss.request_metrics import view_metrics
 
-# Create your tests here.
+from .admin import BulkStudentResource, DepartmentResource
+from .avatars import avatar_name
+from .courses import courses_for
+from .facets import build_facets, facet_rows, facet_total
+from .jobs import enqueue_export, enqueue_import, work
+from .logreader import iter_log_matches, read_log_page, search_log
+from .models import AccountRequest, Blob, Course, Department, File, Group, ImportExportJob, Instructor, PersonSearchDocument, Student, StudentCourse, UploadSession, User
+from .pagination import paginate_keyset, paginate_ranked
+from .previews import work as render_previews
+from .search import search_library, search_people
+from .stats import COUNTER_MODELS, REQUEST_TREND_WEEKS, UPLOAD_TREND_DAYS, activity_day, counter_key, get_counters, get_trends, rebuild_activity
+from .storage import PREVIEW_SUFFIX, blob_storage, derivative_name
+from .uploads import OffsetMismatch, UploadError, append_chunk, finalize_upload, start_upload, temp_path
+
+MEDIA_ROOT = tempfile.mkdtemp()
+JOB_FILES_ROOT = tempfile.mkdtemp()
+
+# أحجام البيانات التي يُقاس عندها كل view، ويجب أن يبقى عدد الاستعلامات ثابتاً بينها
+QUERY_COUNT_SIZES = (2, 8)
+
+
+def letters(number):
+    """Spell a number with letters only (names may not contain digits)."""
+    return ''.join(chr(ord('a') + int(digit)) for digit in str(number))
+
+
+class SchoolFixtures:
+    """
+    A small school that grows on demand: every grow(n) adds n departments,
+    each with a course, a group, a student enrolled in the course, an
+    instructor, uploaded files and an account request, and links the new
+    rows to the main student, group and instructor so their pages grow too.
+    """
+
+    def __init__(self):
+        self.sequence = 0
+        self.admin = self.user(User.Roles.ADMIN, is_staff=True, is_superuser=True)
+        department = Department.objects.create(name='Main Department')
+        group = Group.objects.create(name='Main Group', level=1, department=department)
+        self.student = Student.objects.create(user=self.user(User.Roles.STUDENT), department=department, group=group, level=1)
+        self.group = group
+        self.instructor = Instructor.objects.create(user=self.user(User.Roles.INSTRUCTOR))
+
+    def user(self, role, **extra):
+        self.sequence += 1
+        name = letters(self.sequence)
+        return User.objects.create(
+            username=f"user{self.sequence}", email=f"user{self.sequence}@example.com",
+            first_name=f"First{name}".title(), last_name=f"Last{name}".title(), phone=770000000 + self.sequence,
+            gender='M', birth_date=datetime.date(1995, 1, 1), role=role, image='user_images/missing.png', **extra,
+        )
+
+    def grow(self, count):
+        for _ in range(count):
+            name = letters(self.sequence + 1000).title()
+            department = Department.objects.create(name=f"Department {name}")
+            course = Course.objects.create(name=f"Course {name}", level=1)
+            course.departments.add(department)
+            group = Group.objects.create(name=f"Group {name}", level=1, department=department)
+
+            student = Student.objects.create(user=self.user(User.Roles.STUDENT), department=department, group=group, level=1)
+            StudentCourse.objects.create(student=student, course=course)
+            StudentCourse.objects.create(student=self.student, course=course)
+            classmate = Student.objects.create(user=self.user(User.Roles.STUDENT), department=self.group.department, group=self.group, level=1)
+            StudentCourse.objects.create(student=classmate, course=course)
+
+            instructor = Instructor.objects.create(user=self.user(User.Roles.INSTRUCTOR))
+            for teacher in (instructor, self.instructor):
+                teacher.departments.add(department)
+                teacher.courses.add(course)
+                teacher.groups.add(group)
+
+            for uploader in (student.user, self.student.user):
+                File.objects.create(
+                    file=SimpleUploadedFile(f"notes {name} {uploader.id}.pdf", b'%PDF-1.4 notes'),
+                    upload_by=uploader, course=course, description=f"Notes for {course.name}", status='APPROVED',
+                )
+            AccountRequest.objects.create(full_name=f"Applicant {name}", email=f"applicant{self.sequence}@example.com", phone_number='771234567')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryCountTestCase(TestCase):
+    """
+    Base class for the N+1 regression tests: assertConstantQueries() loads a
+    page at every size in QUERY_COUNT_SIZES and fails when the number of
+    queries grows with the data. Known N+1 pages are marked expectedFailure,
+    so fixing one is reported as an unexpected success until the mark is
+    removed.
+    """
+    fixtures_class = SchoolFixtures
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.data = self.fixtures_class()
+        self.size = 0
+
+    def get(self, url):
+        response = self.client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, f"GET {url} returned {response.status_code}")
+
+    def count_queries(self, user, url):
+        self.client.force_login(user)
+        self.get(url)  # تسخين: ما يُحفظ مرة واحدة لكل عملية لا يُحسب
+        cache.clear()  # لكن ذاكرة Django المؤقتة تُفرغ حتى يُقاس كل حجم بنفس الحالة
+        with CaptureQueriesContext(connection) as queries:
+            self.get(url)
+        return queries
+
+    def assertConstantQueries(self, user, url):
+        counts = {}
+        for size in QUERY_COUNT_SIZES:
+            self.data.grow(size - self.size)
+            self.size = size
+            queries = self.count_queries(user, url)
+            counts[size] = len(queries)
+        if len(set(counts.values())) > 1:
+            sql = '\n'.join(query['sql'] for query in queries.captured_queries)
+            self.fail(f"GET {url}: queries grow with the data {counts}. Queries at size {size}:\n{sql}")
+
+
+class ViewQueryCountTests(QueryCountTestCase):
+    def test_library(self):
+        self.assertConstantQueries(self.data.student.user, reverse('library_list'))
+
+    def test_library_search(self):
+        self.assertConstantQueries(self.data.student.user, reverse('library_list') + '?search=notes')
+
+    def test_library_my_uploaded_files(self):
+        self.assertConstantQueries(self.data.student.user, reverse('library_my_uploaded_files'))
+
+    def test_students_list(self):
+        self.assertConstantQueries(self.data.admin, reverse('students_list'))
+
+    def test_students_list_show_all(self):
+        self.assertConstantQueries(self.data.admin, reverse('students_list') + '?show_all=true')
+
+    def test_students_list_search(self):
+        self.assertConstantQueries(self.data.admin, reverse('students_list') + '?search=first')
+
+    def test_instructors_list(self):
+        self.assertConstantQueries(self.data.admin, reverse('instructors_list'))
+
+    def test_departments_list(self):
+        self.assertConstantQueries(self.data.admin, reverse('departments_list'))
+
+    def test_departments_with_groups(self):
+        self.assertConstantQueries(self.data.admin, reverse('departments_with_groups'))
+
+    def test_group_students(self):
+        self.assertConstantQueries(self.data.admin, reverse('group_students', kwargs={'group_id': self.data.group.id}))
+
+    def test_admin_dashboard(self):
+        self.assertConstantQueries(self.data.admin, reverse('admin_dashboard'))
+
+    def test_instructor_dashboard(self):
+        self.assertConstantQueries(self.data.instructor.user, reverse('instructor_dashboard'))
+
+    def test_student_dashboard(self):
+        self.assertConstantQueries(self.data.student.user, reverse('student_dashboard'))
+
+    def test_profile(self):
+        self.assertConstantQueries(self.data.student.user, reverse('profile'))
+
+
+class AdminChangelistQueryCountTests(QueryCountTestCase):
+    def assertConstantChangelist(self, model):
+        self.assertConstantQueries(self.data.admin, reverse(f'admin:admin_app_{model}_changelist'))
+
+    def test_file_changelist(self):
+        self.assertConstantChangelist('file')
+
+    def test_course_changelist(self):
+        self.assertConstantChangelist('course')
+
+    def test_department_changelist(self):
+        self.assertConstantChangelist('department')
+
+    def test_group_changelist(self):
+        self.assertConstantChangelist('group')
+
+    def test_student_changelist(self):
+        self.assertConstantChangelist('student')
+
+    def test_user_changelist(self):
+        self.assertConstantChangelist('user')
+
+    def test_accountrequest_changelist(self):
+        self.assertConstantChangelist('accountrequest')
+
+    def test_student_changelist_search(self):
+        self.assertConstantQueries(self.data.admin, reverse('admin:admin_app_student_changelist') + '?q=first')
+
+    def test_instructor_user_change(self):
+        self.assertConstantQueries(self.data.admin, reverse('admin:admin_app_user_change', args=[self.data.instructor.user.id]))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, JOB_FILES_ROOT=JOB_FILES_ROOT)
+class BackgroundExportTests(TestCase):
+    def setUp(self):
+        self.departments = [Department.objects.create(name=name) for name in ('Physics', 'Biology', 'Chemistry')]
+
+    def run_job(self, job):
+        work(once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportExportJob.Statuses.DONE, job.error)
+        with job.result_file.open('r') as result:
+            return result.read()
+
+    def test_exports_only_the_selected_rows(self):
+        physics, biology, chemistry = self.departments
+        job = enqueue_export(DepartmentResource, Department.objects.exclude(pk=biology.pk))
+        csv = self.run_job(job)
+        self.assertEqual(job.selected_ids, [physics.pk, chemistry.pk])
+        self.assertIn('Physics', csv)
+        self.assertIn('Chemistry', csv)
+        self.assertNotIn('Biology', csv)
+
+    def test_rows_deleted_after_the_selection_are_skipped(self):
+        job = enqueue_export(DepartmentResource, Department.objects.all())
+        self.departments[0].delete()
+        csv = self.run_job(job)
+        self.assertNotIn('Physics', csv)
+        self.assertIn('Biology', csv)
+
+    def test_job_files_are_private(self):
+        data = SchoolFixtures()
+        job = enqueue_export(DepartmentResource, Department.objects.all(), data.admin)
+        self.run_job(job)
+        imported = enqueue_import(DepartmentResource, CSV, SimpleUploadedFile('departments.csv', b'id,name,status\n'), data.admin)
+        for file in (job.result_file, imported.input_file):
+            self.assertTrue(file.path.startswith(os.path.abspath(JOB_FILES_ROOT) + os.sep))
+            self.assertRegex(os.path.basename(file.name), r'^[0-9a-f]{32}\.csv$')
+            with self.assertRaises(ValueError):
+                file.url
+
+        url = reverse('admin:admin_app_importexportjob_result', args=[job.pk])
+        self.client.force_login(data.admin)
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="export-{job.pk}.csv"')
+        self.assertIn(b'Biology', response.getvalue())
+        self.client.force_login(data.user(User.Roles.ADMIN, is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class BulkStudentImportTests(TestCase):
+    def setUp(self):
+        self.data = SchoolFixtures()
+        department = self.data.group.department
+        self.algebra = Course.objects.create(name='Algebra', level=1)
+        self.physics = Course.objects.create(name='Physics', level=1)
+        for course in (self.algebra, self.physics):
+            course.departments.add(department)
+        self.newcomers = [self.data.user(User.Roles.STUDENT) for _ in range(2)]
+
+    def row(self, user, courses='', id=''):
+        return (id, user.first_name, user.last_name, 'Main Department', '1', 'Main Group', courses)
+
+    def import_rows(self, *rows, dry_run=False):
+        dataset = Dataset(*rows, headers=['id', 'first_name', 'last_name', 'department', 'level', 'group', 'courses'])
+        return BulkStudentResource().import_data(dataset, dry_run=dry_run, use_transactions=True)
+
+    def row_errors(self, result):
+        return [str(error.error) for _, errors in result.row_errors() for error in errors]
+
+    def test_creates_students_with_their_courses(self):
+        first, second = self.newcomers
+        result = self.import_rows(self.row(first, 'Algebra, Physics'), self.row(second, 'Physics'))
+        self.assertFalse(result.has_errors(), self.row_errors(result))
+        self.assertEqual(result.totals['new'], 2)
+        student = Student.objects.get(user=first)
+        self.assertEqual((student.department, student.group, student.level), (self.data.group.department, self.data.group, 1))
+        self.assertCountEqual(
+            StudentCourse.objects.values_list('student__user', 'course'),
+            [(first.pk, self.algebra.pk), (first.pk, self.physics.pk), (second.pk, self.physics.pk)],
+        )
+        # bulk_create لا يرسل الإشارات، فمستند البحث يُبنى مع الدفعة
+        self.assertIn('main group', PersonSearchDocument.objects.get(user=first).document)
+
+    def test_dry_run_writes_nothing(self):
+        result = self.import_rows(self.row(self.newcomers[0], 'Algebra'), dry_run=True)
+        self.assertFalse(result.has_errors(), self.row_errors(result))
+        self.assertEqual(result.totals['new'], 1)
+        self.assertFalse(Student.objects.filter(user=self.newcomers[0]).exists())
+        self.assertFalse(StudentCourse.objects.exists())
+
+    def test_updates_by_id(self):
+        student = self.data.student
+        StudentCourse.objects.create(student=student, course=self.algebra)
+        result = self.import_rows(self.row(student.user, 'Physics', id=student.pk))
+        self.assertFalse(result.has_errors(), self.row_errors(result))
+        self.assertEqual(result.totals['update'], 1)
+        self.assertEqual(list(student.student_courses.values_list('course', flat=True)), [self.physics.pk])
+
+    def test_empty_courses_cell_keeps_the_current_courses(self):
+        student = self.data.student
+        StudentCourse.objects.create(student=student, course=self.algebra)
+        result = self.import_rows(self.row(student.user, id=student.pk))
+        self.assertFalse(result.has_errors(), self.row_errors(result))
+        self.assertEqual(list(student.student_courses.values_list('course', flat=True)), [self.algebra.pk])
+
+    def test_rejects_duplicates_in_the_file(self):
+        first = self.newcomers[0]
+        result = self.import_rows(self.row(first, 'Algebra'), self.row(first, 'Physics'))
+        self.assertEqual(self.row_errors(result), [f"Student with the name '{first.first_name} {first.last_name}' already exists."])
+        self.assertFalse(Student.objects.filter(user=first).exists())
+
+    def test_rejects_unknown_courses(self):
+        result = self.import_rows(self.row(self.newcomers[0], 'Algebra, Alchemy'))
+        self.assertEqual(self.row_errors(result), ["Course 'Alchemy' does not exist."])
+        self.assertFalse(Student.objects.filter(user=self.newcomers[0]).exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AvatarTests(TestCase):
+    def photo(self):
+        output = io.BytesIO()
+        Image.new('RGB', (300, 200), 'teal').save(output, 'PNG')
+        return SimpleUploadedFile('photo.png', output.getvalue())
+
+    def test_saving_an_image_leaves_the_rendering_to_build_avatars(self):
+        user = SchoolFixtures().student.user
+        user.image = self.photo()
+        user.save()
+        user.refresh_from_db()
+        variant = avatar_name(user.image.name, 'small')
+        self.assertTrue(user.avatar_pending)
+        self.assertFalse(user.has_image)
+        self.assertFalse(user.image.storage.exists(variant))
+
+        call_command('build_avatars', stdout=io.StringIO())
+        user.refresh_from_db()
+        self.assertFalse(user.avatar_pending)
+        self.assertTrue(user.has_image)
+        self.assertTrue(user.image.storage.exists(variant))
+        with user.image.storage.open(variant) as avatar, Image.open(avatar) as image:
+            self.assertEqual(image.size, (96, 96))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DownloadTests(TestCase):
+    def setUp(self):
+        self.data = SchoolFixtures()
+        self.course = Course.objects.create(name='Course Download', level=1)
+        self.client.force_login(self.data.student.user)
+
+    def upload(self, name, content=b'0123456789'):
+        return File.objects.create(
+            file=SimpleUploadedFile(name, content), upload_by=self.data.student.user,
+            course=self.course, description='Download test', status='APPROVED',
+        )
+
+    def download(self, file, query='', **headers):
+        response = self.client.get(reverse('download_file', args=[file.pk]) + query, headers=headers)
+        self.addCleanup(response.close)
+        return response
+
+    def test_safe_types_are_shown_inline_in_a_sandbox(self):
+        for name, content_type in (('notes.txt', 'text/plain'), ('board.png', 'image/png')):
+            with self.subTest(name=name):
+                response = self.download(self.upload(name), '?inline=1')
+                self.assertEqual(response['Content-Type'], content_type)
+                self.assertTrue(response['Content-Disposition'].startswith('inline'))
+                self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+                self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def test_inline_pdf_is_not_sandboxed(self):
+        response = self.download(self.upload('notes.pdf', b'%PDF-1.4 notes'), '?inline=1')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="notes.pdf"')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertNotIn('Content-Security-Policy', response)
+
+    def test_active_types_are_downloaded(self):
+        for name in ('evil.html', 'evil.svg', 'evil.xhtml'):
+            with self.subTest(name=name):
+                response = self.download(self.upload(name, b'<script>alert(1)</script>'), '?inline=1')
+                self.assertEqual(response['Content-Type'], 'application/octet-stream')
+                self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+
+    def test_single_range(self):
+        file = self.upload('range.txt')
+        response = self.download(file, Range='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.getvalue(), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(self.download(file, Range='bytes=-3').getvalue(), b'789')
+        self.assertEqual(self.download(file, Range='bytes=7-').getvalue(), b'789')
+        self.assertEqual(self.download(file, Range='bytes=8-100')['Content-Range'], 'bytes 8-9/10')
+
+    def test_unsupported_ranges_send_the_whole_file(self):
+        file = self.upload('range.txt')
+        for header in ('bytes=0-1,4-5', 'bytes=5-2', 'items=0-1'):
+            with self.subTest(header=header):
+                response = self.download(file, Range=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.getvalue(), b'0123456789')
+
+    def test_unsatisfiable_range(self):
+        file = self.upload('range.txt')
+        for header in ('bytes=10-', 'bytes=-0'):
+            with self.subTest(header=header):
+                response = self.download(file, Range=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_if_range(self):
+        file = self.upload('range.txt')
+        current = self.download(file)
+        for if_range in (current['ETag'], current['Last-Modified']):
+            with self.subTest(if_range=if_range):
+                self.assertEqual(self.download(file, Range='bytes=0-1', If_Range=if_range).status_code, 206)
+        for if_range in ('"another-version"', 'W/' + current['ETag'], 'Mon, 01 Jan 2001 00:00:00 GMT'):
+            with self.subTest(if_range=if_range):
+                response = self.download(file, Range='bytes=0-1', If_Range=if_range)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.getvalue(), b'0123456789')
+
+    def test_etag_is_the_content_hash(self):
+        file = self.upload('range.txt')
+        response = self.download(file)
+        self.assertEqual(response['ETag'], f'"{Blob.objects.get(name=file.file.name).sha256}"')
+        self.assertEqual(self.download(file, If_None_Match=response['ETag']).status_code, 304)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BlobStorageTests(TestCase):
+    def setUp(self):
+        self.data = SchoolFixtures()
+        self.course = Course.objects.create(name='Course Storage', level=1)
+
+    def upload(self, content, name='lecture.pdf'):
+        return File.objects.create(
+            file=SimpleUploadedFile(name, content), upload_by=self.data.student.user,
+            course=self.course, description='Storage test', status='APPROVED',
+        )
+
+    def references(self, name):
+        blob = Blob.objects.filter(name=name).first()
+        return blob.references if blob else None
+
+    def test_identical_uploads_share_a_blob(self):
+        first = self.upload(b'same lecture', 'week one.pdf')
+        second = self.upload(b'same lecture', 'copy.pdf')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(self.references(first.file.name), 2)
+        self.assertTrue(blob_storage.exists(first.file.name))
+
+    def replace(self, file, content):
+        file.file = SimpleUploadedFile('lecture.pdf', content)
+        with self.captureOnCommitCallbacks(execute=True):
+            file.save()
+
+    def test_replacing_a_file_releases_its_old_blob(self):
+        first = self.upload(b'draft')
+        second = self.upload(b'draft')
+        draft = first.file.name
+        self.replace(first, b'final')
+        self.assertEqual(self.references(draft), 1)
+        self.assertTrue(blob_storage.exists(draft))
+        self.replace(second, b'final')
+        self.assertIsNone(self.references(draft))
+        self.assertFalse(blob_storage.exists(draft))
+        self.assertEqual(self.references(first.file.name), 2)
+
+    def test_blob_is_removed_only_after_the_delete_commits(self):
+        file = self.upload(b'only copy')
+        name = file.file.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            file.delete()
+        self.assertEqual(self.references(name), 0)
+        self.assertTrue(blob_storage.exists(name))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(self.references(name))
+        self.assertFalse(blob_storage.exists(name))
+
+    def test_upload_before_the_collection_keeps_the_blob(self):
+        file = self.upload(b'uploaded again')
+        name = file.file.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            file.delete()
+        self.upload(b'uploaded again')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.references(name), 1)
+        self.assertTrue(blob_storage.exists(name))
+
+    def test_queryset_delete_releases_every_blob(self):
+        files = [self.upload(b'shared'), self.upload(b'shared'), self.upload(b'single')]
+        names = {file.file.name for file in files}
+        with self.captureOnCommitCallbacks(execute=True):
+            File.objects.filter(pk__in=[file.pk for file in files]).delete()
+        for name in names:
+            self.assertIsNone(self.references(name))
+            self.assertFalse(blob_storage.exists(name))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ChunkedUploadTests(TestCase):
+    content = b'chunked lecture notes'
+
+    def setUp(self):
+        self.data = SchoolFixtures()
+        self.course = Course.objects.create(name='Course Upload', level=1)
+
+    def start(self, checksum=None):
+        if checksum is None:
+            checksum = hashlib.sha256(self.content).hexdigest()
+        return start_upload(self.data.instructor.user, 'notes.pdf', len(self.content), 'Upload test', self.course.pk, checksum)
+
+    def send(self, session, offset, data, length=None):
+        return append_chunk(session.pk, offset, io.BytesIO(data), len(data) if length is None else length)
+
+    def test_chunks_make_a_file(self):
+        session = self.start()
+        self.assertEqual(self.send(session, 0, self.content[:8]), 8)
+        self.assertEqual(self.send(session, 8, self.content[8:]), len(self.content))
+        session.refresh_from_db()
+        file = finalize_upload(session)
+        with file.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertEqual((file.name, file.size, file.status), ('notes.pdf', len(self.content), 'APPROVED'))
+        self.assertFalse(UploadSession.objects.filter(pk=session.pk).exists())
+
+    def test_chunk_at_the_wrong_offset(self):
+        session = self.start()
+        self.send(session, 0, self.content[:8])
+        for offset in (0, 12):
+            with self.subTest(offset=offset), self.assertRaises(OffsetMismatch) as error:
+                self.send(session, offset, self.content[offset:offset + 4])
+            self.assertEqual(error.exception.received, 8)
+        with self.assertRaises(UploadError):
+            self.send(session, 8, self.content[8:] + b'extra')
+
+    def test_short_chunk_is_kept_up_to_its_last_byte(self):
+        session = self.start()
+        self.assertEqual(self.send(session, 0, self.content[:5], length=10), 5)
+        self.assertEqual(self.send(session, 5, self.content[5:]), len(self.content))
+        with open(temp_path(session), 'rb') as part:
+            self.assertEqual(part.read(), self.content)
+
+    def test_incomplete_upload_is_not_finalized(self):
+        session = self.start()
+        self.send(session, 0, self.content[:8])
+        session.refresh_from_db()
+        with self.assertRaises(UploadError):
+            finalize_upload(session)
+        self.assertFalse(File.objects.exists())
+
+    def test_bad_checksum_restarts_the_upload(self):
+        session = self.start(checksum='0' * 64)
+        self.send(session, 0, self.content)
+        session.refresh_from_db()
+        with self.assertRaises(UploadError):
+            finalize_upload(session)
+        session.refresh_from_db()
+        self.assertEqual(session.received, 0)
+        self.assertEqual(os.path.getsize(temp_path(session)), 0)
+        self.assertFalse(File.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class LibrarySearchTests(TestCase):
+    def setUp(self):
+        self.data = SchoolFixtures()
+        self.calculus = Course.objects.create(name='Calculus', level=1)
+        self.physics = Course.objects.create(name='Physics', level=1)
+
+    def upload(self, name, course, description='Lecture notes', status='APPROVED', uploader=None):
+        return File.objects.create(
+            file=SimpleUploadedFile(name, name.encode()), upload_by=uploader or self.data.student.user,
+            course=course, description=description, status=status,
+        )
+
+    def test_words_prefixes_and_typos(self):
+        limits = self.upload('limits and derivatives.pdf', self.calculus)
+        integrals = self.upload('integrals.pdf', self.calculus, description='Integration exercises')
+        optics = self.upload('optics.pdf', self.physics)
+        self.assertEqual(search_library('integrals'), [integrals.pk])
+        self.assertEqual(search_library('deriv'), [limits.pk])
+        self.assertEqual(search_library('integrls'), [integrals.pk])
+        self.assertEqual(search_library('calculus notes'), [limits.pk])
+        self.assertEqual(search_library('physics'), [optics.pk])
+        self.assertEqual(search_library('chemistry'), [])
+
+    def test_title_matches_rank_first_and_pending_files_are_hidden(self):
+        in_body = self.upload('week one.pdf', self.calculus, description='Vectors and matrices')
+        in_title = self.upload('vectors.pdf', self.physics)
+        self.upload('vectors draft.pdf', self.physics, status='PENDING')
+        self.assertEqual(search_library('vectors'), [in_title.pk, in_body.pk])
+
+    def test_edits_are_searchable_at_once(self):
+        file = self.upload('notes.pdf', self.calculus)
+        self.assertEqual(search_library('series'), [])
+        file.description = 'Taylor series'
+        file.save()
+        self.assertEqual(search_library('series'), [file.pk])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class LibraryFacetTests(TestCase):
+    def setUp(self):
+        self.data = SchoolFixtures()
+        self.calculus = Course.objects.create(name='Calculus', level=1)
+        self.physics = Course.objects.create(name='Physics', level=1)
+        for name, course in (('a.pdf', self.calculus), ('b.pdf', self.calculus), ('c.docx', self.calculus), ('d.pdf', self.physics)):
+            File.objects.create(
+                file=SimpleUploadedFile(name, name.encode()), upload_by=self.data.student.user,
+                course=course, description='Notes', status='APPROVED',
+            )
+        self.rows = facet_rows(File.objects.filter(status='APPROVED'))
+
+    def counts(self, facets, name):
+        return {facet['label']: facet['count'] for facet in facets[name]}
+
+    def test_counts_without_filters(self):
+        facets = build_facets(self.rows, {})
+        self.assertEqual(self.counts(facets, 'course'), {'Calculus': 3, 'Physics': 1})
+        self.assertEqual(self.counts(facets, 'type'), {'pdf': 3, 'docx': 1})
+        self.assertEqual(facet_total(self.rows, {}), 4)
+
+    def test_a_facet_ignores_its_own_filter(self):
+        selected = {'course': str(self.physics.pk), 'type': 'pdf'}
+        facets = build_facets(self.rows, selected)
+        self.assertEqual(self.counts(facets, 'course'), {'Calculus': 2, 'Physics': 1})
+        self.assertEqual(self.counts(facets, 'type'), {'pdf': 1})
+        self.assertEqual(facet_total(self.rows, selected), 1)
+
+    def test_selected_value_stays_listed_with_zero(self):
+        facets = build_facets(self.rows, {'course': str(self.physics.pk), 'type': 'docx'})
+        self.assertEqual(self.counts(facets, 'course'), {'Calculus': 1, 'Physics': 0})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        for number in range(8):
+            Course.objects.create(name=f"Course {letters(number)}", level=number % 3 + 1)
+
+    def walk(self, queryset, ordering, page_size=3):
+        pages, page = [], paginate_keyset(queryset, ordering, page_size=page_size)
+        pages.append([row.pk for row in page])
+        while page.has_next:
+            page = paginate_keyset(queryset, ordering, after=page.next_cursor, page_size=page_size)
+            pages.append([row.pk for row in page])
+        backwards = [[row.pk for row in page]]
+        while page.has_previous:
+            page = paginate_keyset(queryset, ordering, before=page.previous_cursor, page_size=page_size)
+            backwards.insert(0, [row.pk for row in page])
+        self.assertEqual(backwards, pages)
+        return [pk for rows in pages for pk in rows]
+
+    def test_pages_follow_the_ordering_with_ties(self):
+        courses = Course.objects.all()
+        self.assertEqual(self.walk(courses, 'level'), list(courses.order_by('level', 'pk').values_list('pk', flat=True)))
+        self.assertEqual(self.walk(courses, '-level'), list(courses.order_by('-level', '-pk').values_list('pk', flat=True)))
+
+    def test_null_values(self):
+        data = SchoolFixtures()
+        data.grow(2)
+        User.objects.filter(pk__in=[data.admin.pk, data.student.user.pk]).update(last_login=datetime.datetime(2025, 1, 1))
+        users = User.objects.all()
+        ascending = self.walk(users, 'last_login')
+        self.assertEqual(len(ascending), users.count())
+        self.assertEqual(ascending[-2:], sorted([data.admin.pk, data.student.user.pk]))
+        descending = self.walk(users, '-last_login')
+        self.assertEqual(descending[:2], sorted([data.admin.pk, data.student.user.pk], reverse=True))
+        self.assertEqual(sorted(descending), sorted(ascending))
+
+    def test_bad_or_foreign_cursor_starts_over(self):
+        courses = Course.objects.all()
+        first = [row.pk for row in paginate_keyset(courses, 'name', page_size=3)]
+        other = paginate_keyset(courses, 'level', page_size=3).next_cursor
+        for cursor in ('not-a-cursor', other):
+            with self.subTest(cursor=cursor):
+                self.assertEqual([row.pk for row in paginate_keyset(courses, 'name', after=cursor, page_size=3)], first)
+
+    def test_ranked_pages(self):
+        ranked = list(Course.objects.order_by('-pk').values_list('pk', flat=True))
+        courses = Course.objects.exclude(pk=ranked[1])
+        page = paginate_ranked(courses, ranked, page_size=3)
+        self.assertEqual([row.pk for row in page], [ranked[0], ranked[2], ranked[3]])
+        page = paginate_ranked(courses, ranked, after=page.next_cursor, page_size=3)
+        self.assertEqual([row.pk for row in page], ranked[4:7])
+        page = paginate_ranked(courses, ranked, before=page.previous_cursor, page_size=3)
+        self.assertEqual([row.pk for row in page], [ranked[0], ranked[2], ranked[3]])
+        self.assertFalse(page.has_previous)
+
+
+class PeopleSearchTests(TestCase):
+    def setUp(self):
+        self.data = SchoolFixtures()
+        self.student = self.data.student.user
+
+    def found(self, query):
+        return set(User.objects.filter(id__in=search_people(query)).values_list('id', flat=True))
+
+    def assertFound(self, query, *users):
+        # FTS5 إن توفر، ثم LIKE وحده كما في قواعد البيانات الأخرى
+        self.assertEqual(self.found(query), {user.id for user in users})
+        with mock.patch('admin_app.search.people_fts_available', return_value=False):
+            self.assertEqual(self.found(query), {user.id for user in users}, 'without FTS5')
+
+    def test_every_word_must_match(self):
+        self.assertFound(f"main group {self.student.first_name}", self.student)
+        self.assertFound(f"{self.student.last_name.upper()} gr", self.student)  # كلمة قصيرة تُطابق بـ LIKE
+        self.assertFound(f"main group {self.data.admin.first_name}")  # المشرف غير مفهرس
+        self.assertFound(self.student.email, self.student)
+
+    def test_documents_follow_their_sources(self):
+        self.student.first_name = 'Renamed'
+        self.student.save()
+        self.assertFound('renamed', self.student)
+
+        self.data.group.name = 'Evening Section'
+        self.data.group.save()
+        self.assertFound('evening', self.student)
+        self.assertFound('group')
+
+        course = Course.objects.create(name='Astronomy', level=1)
+        self.data.instructor.courses.add(course)
+        self.assertFound('astronomy', self.data.instructor.user)
+        course.name = 'Astrophysics'
+        course.save()
+        self.assertFound('astronomy')
+        self.assertFound('astrophysics', self.data.instructor.user)
+
+
+class LogReaderTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'app.log')
+        self.write(range(25))
+
+    def write(self, numbers, mode='a'):
+        with open(self.path, mode) as log:
+            for number in numbers:
+                log.write(f"line {number} {'ERROR' if number % 5 == 0 else 'INFO'}\n")
+
+    @mock.patch('admin_app.logreader.CHECKPOINT_BYTES', 32)
+    def test_pages_newest_first(self):
+        lines, page, pages = read_log_page(self.path, page=1, page_size=10)
+        self.assertEqual((page, pages), (1, 3))
+        self.assertEqual(lines[0], 'line 24 INFO')
+        self.assertEqual(lines[-1], 'line 15 ERROR')
+        lines, page, pages = read_log_page(self.path, page=3, page_size=10)
+        self.assertEqual(lines, [f"line {number} {'ERROR' if number % 5 == 0 else 'INFO'}" for number in range(4, -1, -1)])
+        self.write(range(25, 30))
+        self.assertEqual(read_log_page(self.path, page=1, page_size=10)[0][0], 'line 29 INFO')
+        self.assertEqual(read_log_page(self.path, page=3, page_size=10)[0][0], 'line 9 INFO')
+
+    def test_rotated_log_is_indexed_again(self):
+        read_log_page(self.path, page_size=10)
+        self.write(range(100, 103), mode='w')
+        lines, page, pages = read_log_page(self.path, page_size=10)
+        self.assertEqual((lines, pages), (['line 102 INFO', 'line 101 INFO', 'line 100 ERROR'], 1))
+
+    def test_search_backwards_with_cursor(self):
+        lines, cursor = search_log(self.path, 'error', limit=3)
+        self.assertEqual(lines, ['line 20 ERROR', 'line 15 ERROR', 'line 10 ERROR'])
+        lines, cursor = search_log(self.path, 'error', before=cursor, limit=3)
+        self.assertEqual((lines, cursor), (['line 5 ERROR', 'line 0 ERROR'], None))
+        matches = b''.join(iter_log_matches(self.path, 'ERROR')).decode().splitlines()
+        self.assertEqual(matches, [f"line {number} ERROR" for number in range(0, 25, 5)])
+
+
+class LogStoreTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.handler = StructuredLogHandler(self.directory, retention_days=2)
+        self.addCleanup(self.handler.close)
+
+    def log(self, moment, level, name, message, user=None, path=None):
+        record = logging.LogRecord(name, level, __file__, 1, message, None, None)
+        record.created = moment.timestamp()
+        record.user, record.path = user, path
+        self.handler.emit(record)
+
+    def messages(self, **filters):
+        records, cursor = query_records(self.directory, **filters)
+        return [record['message'] for record in records]
+
+    def test_filters(self):
+        now = datetime.datetime.now().replace(microsecond=0)
+        self.log(now, logging.INFO, 'admin_app.views', 'opened library', user='sara', path='/library_list/')
+        self.log(now, logging.ERROR, 'admin_app.uploads', 'upload 50% failed', user='omar', path='/upload/')
+        self.log(now, logging.WARNING, 'chat_app.views', 'room not found', user='sara', path='/chat/room/')
+        self.log(now, logging.INFO, 'admin_apps', 'other logger')
+        self.assertEqual(self.messages(level=logging.WARNING), ['room not found', 'upload 50% failed'])
+        self.assertEqual(self.messages(logger='admin_app'), ['upload 50% failed', 'opened library'])
+        self.assertEqual(self.messages(user='sara', path='/chat/'), ['room not found'])
+        self.assertEqual(self.messages(text='50%'), ['upload 50% failed'])
+        self.assertEqual(self.messages(text='5_%'), [])
+
+    def test_pages_across_days_and_retention(self):
+        today = datetime.datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        for days in (3, 1, 0):
+            for minute in range(3):
+                self.log(today - datetime.timedelta(days=days) + datetime.timedelta(minutes=minute), logging.INFO, 'admin_app', f"day -{days} minute {minute}")
+        self.assertEqual([day for day, path in list_segments(self.directory)], [
+            (today - datetime.timedelta(days=days)).date() for days in (0, 1)
+        ])
+        seen, cursor = [], None
+        while True:
+            records, cursor = query_records(self.directory, before=cursor, limit=4)
+            seen += [record['message'] for record in records]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f"day -{days} minute {minute}" for days in (0, 1) for minute in (2, 1, 0)])
+        since = today - datetime.timedelta(minutes=1)
+        self.assertEqual(self.messages(since=since, until=today + datetime.timedelta(minutes=1)), ['day -0 minute 1', 'day -0 minute 0'])
+
+    def test_aware_range_is_compared_in_local_time(self):
+        today = datetime.datetime.now().replace(hour=1, minute=30, second=0, microsecond=0)
+        late = today - datetime.timedelta(hours=2)  # 23:30 أمس
+        self.log(late, logging.INFO, 'admin_app', 'late yesterday')
+        self.log(today, logging.INFO, 'admin_app', 'early today')
+        local = timezone.get_current_timezone()
+        # بتوقيت آخر يقع until في الأمس و since في اليوم، لكن المقاطع تُسمّى بالتوقيت المحلي
+        until = timezone.make_aware(today + datetime.timedelta(minutes=15), local).astimezone(datetime.timezone(datetime.timedelta(hours=-12)))
+        since = timezone.make_aware(late - datetime.timedelta(minutes=15), local).astimezone(datetime.timezone(datetime.timedelta(hours=14)))
+        self.assertEqual((until.date(), since.date()), (late.date(), today.date()))
+        self.assertEqual(self.messages(since=since, until=until), ['early today', 'late yesterday'])
+
+
+class LogQueueTests(TestCase):
+    def setUp(self):
+        # configure_logging يستبدل إعداد السجلات كله، فيُعاد إعداد المشروع بعد الاختبار
+        self.addCleanup(configure_django_logging, settings.LOGGING_CONFIG, settings.LOGGING)
+        configure_logging({
+            'version': 1,
+            'disable_existing_loggers': False,
+            'handlers': {
+                'views': {'()': 'logging.handlers.BufferingHandler', 'capacity': 100},
+                'errors': {'()': 'logging.handlers.BufferingHandler', 'capacity': 100, 'level': 'ERROR'},
+                'uploads': {'()': 'logging.handlers.BufferingHandler', 'capacity': 100},
+            },
+            'loggers': {
+                'queued.views': {'handlers': ['views', 'errors'], 'level': 'INFO', 'propagate': False},
+                'queued.uploads': {'handlers': ['uploads'], 'level': 'INFO', 'propagate': False},
+            },
+        })
+        routes = logqueue._listener.routes
+        self.handlers = dict(zip(('views', 'errors', 'uploads'), routes['queued.views'] + routes['queued.uploads']))
+
+    def messages(self, name):
+        return [record.getMessage() for record in self.handlers[name].buffer]
+
+    def test_records_reach_only_the_handlers_of_their_logger(self):
+        views = logging.getLogger('queued.views')
+        self.assertEqual([type(handler) for handler in views.handlers], [RoutedQueueHandler])
+        token = request_context.set({'user': 'sara', 'path': '/library_list/'})
+        try:
+            views.info('opened library')
+        finally:
+            request_context.reset(token)
+        views.error('upload failed')
+        logging.getLogger('queued.uploads').info('chunk stored')
+        stop_listener()  # يكتب ما بقي في الطابور
+
+        self.assertEqual(self.messages('views'), ['opened library', 'upload failed'])
+        self.assertEqual(self.messages('errors'), ['upload failed'])
+        self.assertEqual(self.messages('uploads'), ['chunk stored'])
+        record = self.handlers['views'].buffer[0]
+        self.assertEqual((record.user, record.path), ('sara', '/library_list/'))
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.data = SchoolFixtures()
+        view_metrics.clear()
+        self.addCleanup(view_metrics.clear)
+
+    def test_server_timing_only_for_staff_or_debug(self):
+        url = reverse('login')
+        self.assertNotIn('Server-Timing', self.client.get(url))
+        with override_settings(DEBUG=True):
+            self.assertIn('Server-Timing', self.client.get(url))
+        self.client.force_login(self.data.student.user)
+        self.assertNotIn('Server-Timing', self.client.get(url))
+        self.client.force_login(self.data.admin)
+        self.assertRegex(self.client.get(url)['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_metrics_page_summarizes_each_view(self):
+        self.client.force_login(self.data.admin)
+        for _ in range(3):
+            response = self.client.get(reverse('departments_list'))
+        [row] = view_metrics.summary()
+        self.assertEqual((row['view'], row['requests'], row['sampled']), ('admin_app.views.departments_list', 3, 3))
+        self.assertEqual(row['size']['max'], len(response.content))
+        self.assertGreater(row['queries']['p50'], 0)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, 'admin_app.views.departments_list')
+        self.client.post(reverse('metrics'))
+        # يبقى فقط طلب إعادة الضبط نفسه، فهو يُقاس بعد انتهائه
+        self.assertEqual([row['view'] for row in view_metrics.summary()], ['admin_app.views.metrics_view'])
+
+        self.client.force_login(self.data.student.user)
+        self.assertRedirects(self.client.get(reverse('metrics')), reverse('403'), fetch_redirect_response=False)
+
+
+class CourseLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.physics, self.biology = Department.objects.create(name='Physics'), Department.objects.create(name='Biology')
+        self.course = Course.objects.create(name='Mechanics', level=1)
+        self.course.departments.add(self.physics)
+
+    def test_lookup_is_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(courses_for(self.physics.pk, 1), ['Mechanics'])
+        with self.assertNumQueries(0):
+            self.assertEqual(courses_for(self.physics.pk, 2), [])
+
+    def test_changes_invalidate_the_lookup(self):
+        courses_for(self.physics.pk, 1)
+        self.course.name, self.course.level = 'Optics', 2
+        self.course.save()
+        self.assertEqual((courses_for(self.physics.pk, 1), courses_for(self.physics.pk, 2)), ([], ['Optics']))
+
+        self.biology.courses.add(self.course)  # من جهة القسم
+        self.assertEqual(courses_for(self.biology.pk, 2), ['Optics'])
+        self.course.departments.remove(self.biology)
+        self.assertEqual(courses_for(self.biology.pk, 2), [])
+
+        physics = self.physics.pk
+        self.physics.delete()
+        self.assertEqual(courses_for(physics, 2), [])
+        Course.objects.create(name='Genetics', level=2).departments.add(self.biology)
+        self.assertEqual(courses_for(self.biology.pk, 2), ['Genetics'])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.requests = 0
+
+    def request_account(self):
+        self.requests += 1
+        return AccountRequest.objects.create(full_name='Applicant', email=f"applicant{self.requests}@example.com", phone_number='771234567')
+
+    def test_counters_move_after_commit(self):
+        self.assertEqual(get_counters()['account_requests'], 0)
+        with self.captureOnCommitCallbacks() as callbacks:
+            applicant = self.request_account()
+        self.assertEqual(get_counters()['account_requests'], 0)  # لم تُلتزم المعاملة بعد
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_counters()['account_requests'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            applicant.delete()
+            SchoolFixtures()
+        self.assertEqual(get_counters(), {name: model.objects.count() for name, model in COUNTER_MODELS.items()})
+
+    def test_evicted_counters_are_recounted(self):
+        get_counters()
+        cache.delete(counter_key('account_requests'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.request_account()  # لا عدّاد لتحريكه
+        self.assertEqual(get_counters()['account_requests'], 1)
+
+    def test_trends(self):
+        today = activity_day(timezone.now())
+        data = SchoolFixtures()
+        first, second = self.request_account(), self.request_account()
+        course = Course.objects.create(name='Mechanics', level=1)
+        File.objects.create(file=SimpleUploadedFile('notes.pdf', b'%PDF-1.4 notes'), upload_by=data.student.user, course=course, status='APPROVED')
+        trends = get_trends(today)
+        self.assertEqual(trends['uploads_per_day'][-1], {'label': today.strftime('%b %d'), 'count': 1, 'percent': 100})
+        self.assertEqual([row['count'] for row in trends['uploads_per_day'][:-1]], [0] * (UPLOAD_TREND_DAYS - 1))
+        self.assertEqual(trends['requests_per_week'][-1]['count'], 2)
+
+        # update() لا يرسل إشارات، فيُعاد بناء الملخص من الجداول
+        AccountRequest.objects.filter(pk=first.pk).update(created_at=timezone.now() - datetime.timedelta(weeks=3))
+        rebuild_activity()
+        second.delete()
+        weeks = [row['count'] for row in get_trends(today)['requests_per_week']]
+        self.assertEqual(weeks, [0] * (REQUEST_TREND_WEEKS - 4) + [1, 0, 0, 0])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class PreviewTests(TestCase):
+    def setUp(self):
+        self.data = SchoolFixtures()
+        self.course = Course.objects.create(name='Course Previews', level=1)
+        self.pool = ThreadPool(2)  # العمل نفسه في خيوط بدل العمليات
+        self.addCleanup(self.pool.terminate)
+
+    def upload(self, name, content):
+        return File.objects.create(
+            file=SimpleUploadedFile(name, content), upload_by=self.data.student.user,
+            course=self.course, description='Preview test', status='APPROVED',
+        )
+
+    def image(self, size=(800, 600), color='red'):
+        output = io.BytesIO()
+        Image.new('RGB', size, color).save(output, 'PNG')
+        return output.getvalue()
+
+    def docx(self, thumbnail=None):
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, 'w') as archive:
+            archive.writestr('word/document.xml', '<document/>')
+            if thumbnail:
+                archive.writestr('docProps/thumbnail.png', thumbnail)
+        return output.getvalue()
+
+    def status(self, file):
+        file.refresh_from_db()
+        return file.preview_status
+
+    def test_previews_are_rendered_by_type(self):
+        photo = self.upload('photo.png', self.image())
+        copy = self.upload('copy.png', self.image())  # نفس الـ blob
+        report = self.upload('report.docx', self.docx(self.image((200, 300), 'blue')))
+        plain = self.upload('plain.docx', self.docx())
+        notes = self.upload('notes.txt', b'plain text')
+        broken = self.upload('broken.png', b'not an image')
+        render_previews(self.pool, once=True)
+
+        Statuses = File.PreviewStatuses
+        self.assertEqual(
+            [self.status(file) for file in (photo, copy, report, plain, notes, broken)],
+            [Statuses.READY, Statuses.READY, Statuses.READY, Statuses.NONE, Statuses.NONE, Statuses.FAILED],
+        )
+        with blob_storage.open(derivative_name(photo.file.name, PREVIEW_SUFFIX)) as preview, Image.open(preview) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (400, 300)))
+
+    def test_a_file_that_cannot_be_stored_does_not_stop_the_batch(self):
+        first, second = self.upload('first.png', self.image(color='red')), self.upload('second.png', self.image(color='green'))
+        replace, failures = os.replace, [OSError('No space left on device')]
+
+        def replace_once(source, destination):
+            if failures:
+                raise failures.pop()
+            replace(source, destination)
+
+        with mock.patch('admin_app.previews.os.replace', side_effect=replace_once), self.assertLogs('admin_app.previews', 'ERROR'):
+            render_previews(self.pool, once=True)
+        self.assertCountEqual([self.status(first), self.status(second)], [File.PreviewStatuses.FAILED, File.PreviewStatuses.READY])
+        directory = os.path.dirname(blob_storage.path(first.file.name))
+        self.assertEqual([name for name in os.listdir(directory) if not name.endswith(('.png', '.webp'))], [])
@@ -0,0 +1,167 @@
+"""
+Chunked, resumable uploads of library files.
+
+The upload page asks for an UploadSession with the file's name, size and
+SHA-256 (start_upload), then PUTs the file in chunks of about
+UPLOAD_CHUNK_SIZE bytes, each with the offset it starts at
+(append_chunk). The chunks are streamed from the request straight into a
+temporary file next to the media files, and `received` is committed after
+every chunk, so a client that lost its connection asks for the offset and
+continues from there instead of sending the whole file again.
+
+finalize_upload checks the size and the checksum, moves the temporary file
+into the content-addressed storage (admin_app.storage) and creates the File
+row. Sessions left unfinished for UPLOAD_SESSION_TTL seconds are removed by
+expire_uploads().
+"""
+import logging
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import UnreadablePostError
+from django.utils import timezone
+from .storage import file_sha256
+from .models import FILE_MAX_SIZE, Course, File, UploadSession, User
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A chunk or a finalize request that does not fit the session."""
+
+
+class OffsetMismatch(UploadError):
+    """The chunk does not start where the temporary file ends."""
+
+    def __init__(self, received):
+        super().__init__(f"Expected offset {received}.")
+        self.received = received
+
+
+def temp_path(session):
+    return os.path.join(settings.MEDIA_ROOT, 'chunked_uploads', f"{session.pk}.part")
+
+
+def upload_errors(filename, size, description, course_id, checksum=''):
+    """The same checks as the single-POST upload, plus the file's name and size."""
+    errors = {}
+    if not filename or size is None:
+        errors['file'] = 'File is required.'
+    elif size <= 0 or size > FILE_MAX_SIZE:
+        errors['file'] = 'File size must be less than 80MB.'
+    else:
+        try:
+            for validator in File._meta.get_field('file').validators:
+                validator(File(file=filename).file)
+        except ValidationError as e:
+            errors['file'] = ' '.join(e.messages)
+    if checksum and (len(checksum) != 64 or not all(c in '0123456789abcdef' for c in checksum)):
+        errors['file'] = 'Invalid checksum.'
+    if not description:
+        errors['description'] = 'Description is required.'
+    elif len(description) > 100:
+        errors['description'] = 'Description must be at least 100 characters.'
+    if not course_id:
+        errors['course'] = 'You must select a course.'
+    elif not str(course_id).isdigit() or not Course.objects.filter(pk=course_id, status=True).exists():
+        errors['course'] = 'Select a valid course.'
+    return errors
+
+
+def start_upload(user, filename, size, description, course_id, checksum=''):
+    expire_uploads()
+    session = UploadSession.objects.create(
+        user=user, filename=os.path.basename(filename), size=size, checksum=checksum.lower(),
+        description=description, course_id=course_id,
+    )
+    path = temp_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    logger.info("Upload %s of '%s' (%s bytes) started by %s", session.pk, session.filename, size, user.username)
+    return session
+
+
+def append_chunk(session_id, offset, stream, length):
+    """
+    Write `length` bytes of `stream` at `offset` and return the new offset.
+    A chunk cut short by the client is kept up to its last received byte.
+    """
+    if length <= 0 or length > UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError(f"Chunks must be between 1 and {UPLOAD_MAX_CHUNK_SIZE} bytes.")
+    with transaction.atomic():
+        # قفل الصف يمنع طلبين من الكتابة في نفس الملف المؤقت معاً
+        session = UploadSession.objects.select_for_update().get(pk=session_id)
+        if offset != session.received:
+            raise OffsetMismatch(session.received)
+        if offset + length > session.size:
+            raise UploadError("The chunk goes past the end of the file.")
+
+        written = 0
+        with open(temp_path(session), 'r+b') as part:
+            part.truncate(offset)  # بايتات كُتبت بعد آخر نقطة محفوظة (انقطاع قبل الحفظ)
+            part.seek(offset)
+            try:
+                while written < length:
+                    data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                    if not data:
+                        break
+                    part.write(data)
+                    written += len(data)
+            except (UnreadablePostError, OSError):
+                logger.warning("Upload %s: connection lost after %s bytes of a chunk", session.pk, written)
+            part.flush()
+            os.fsync(part.fileno())  # received لا يسبق البيانات الموجودة فعلاً على القرص
+
+        session.received = offset + written
+        session.save(update_fields=['received', 'updated_at'])
+    return session.received
+
+
+def finalize_upload(session):
+    """Verify the temporary file and turn it into a File row."""
+    path = temp_path(session)
+    if session.received != session.size or os.path.getsize(path) != session.size:
+        raise UploadError(f"Received {session.received} of {session.size} bytes.")
+    digest = file_sha256(path)
+    if session.checksum and digest != session.checksum:
+        # البيانات تالفة: يبدأ العميل الرفع من جديد
+        with open(path, 'r+b') as part:
+            part.truncate(0)
+        session.received = 0
+        session.save(update_fields=['received', 'updated_at'])
+        logger.error("Upload %s of '%s' failed its checksum", session.pk, session.filename)
+        raise UploadError("The checksum does not match, the file must be uploaded again.")
+
+    user = session.user
+    file_instance = File(
+        description=session.description,
+        course_id=session.course_id,
+        upload_by=user,
+        status='APPROVED' if user.role in (User.Roles.INSTRUCTOR, User.Roles.ADMIN) else 'PENDING',
+    )
+    with transaction.atomic():
+        # الملف المؤقت يُنقل إلى مكانه في التخزين بالمحتوى دون نسخ 80MB
+        file_instance.file.name = file_instance.file.storage.save_local(path, session.filename, digest)
+        file_instance.describe_file(session.filename)
+        file_instance.save()
+        session.delete()
+    return file_instance
+
+
+def expire_uploads():
+    """Remove the sessions and temporary files of uploads abandoned for UPLOAD_SESSION_TTL seconds."""
+    stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=UPLOAD_SESSION_TTL))
+    for session in stale:
+        try:
+            os.remove(temp_path(session))
+        except FileNotFoundError:
+            pass
+        logger.info("Upload %s of '%s' expired after %s bytes", session.pk, session.filename, session.received)
+        session.delete()
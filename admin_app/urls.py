@@ -4,7 +4,7 @@ from django.conf.urls import  handler400, handler403, handler404, handler500
 
 from .views import (departments_list, download_logs, library_my_uploaded_files, delete_file, departments_with_groups, get_groups_view, 
                     access_denied, change_password_view, edit_profile_view, group_students, 
-                    instructor_dashboard, edit_file, log_viewer, upload_file, instructors_list, admin_dashboard, student_dashboard,
+                    instructor_dashboard, download_file, edit_file, file_preview, log_viewer, metrics_view, upload_file, upload_file_start, upload_file_chunk, upload_file_finish, instructors_list, admin_dashboard, student_dashboard,
                     library_view, home_view, login_view, logout_view, profile_view, request_otp, resend_otp, reset_password, 
                     request_account, students_list, verify_otp)
 
@@ -26,6 +26,11 @@ urlpatterns = [
     path('library_list/', library_view, name='library_list'),
     path('library_list/library_my_uploaded_files/', library_my_uploaded_files, name='library_my_uploaded_files'),
     path('library_list/upload_file/',upload_file, name='upload_file'),
+    path('library_list/upload_file/chunked/', upload_file_start, name='upload_file_start'),
+    path('library_list/upload_file/chunked/<uuid:upload_id>/', upload_file_chunk, name='upload_file_chunk'),
+    path('library_list/upload_file/chunked/<uuid:upload_id>/finish/', upload_file_finish, name='upload_file_finish'),
+    path('library_list/download/<int:file_id>/', download_file, name='download_file'),
+    path('library_list/preview/<int:file_id>/', file_preview, name='file_preview'),
     path('library_my_uploaded_files/edit_file/<file_id>/', edit_file, name='edit_file'),
     path('library_my_uploaded_files/delete_file/<int:file_id>/', delete_file, name='delete_file'),
     path('profile/', profile_view, name='profile'),
@@ -51,6 +56,7 @@ urlpatterns = [
     path('test-404/', lambda request: render(request, '404.html', status=404)),
     path('logs/', log_viewer, name='log_viewer'),
     path('downloadLogs/', download_logs, name='download_logs'),
+    path('metrics/', metrics_view, name='metrics'),
 
 ]
 
@@ -15,3 +15,14 @@ def send_otp_email(user_email, otp):
     except SMTPException as e:
         print(f"Failed to send email: {e}")
         return False
+
+# مُقسِّم trigram في FTS5 أُضيف في SQLite 3.34
+SQLITE_TRIGRAM_VERSION = (3, 34, 0)
+
+def sqlite_supports_trigram(connection):
+    """Whether this SQLite can create FTS5 tables with tokenize='trigram' (used by the search migrations)."""
+    if connection.Database.sqlite_version_info < SQLITE_TRIGRAM_VERSION:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
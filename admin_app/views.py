@@ -6,18 +6,31 @@ from django.contrib import messages
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
 from django.core.mail import send_mail
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.utils import timezone
-from django.utils.dateparse import parse_date
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.timezone import now
-from django.db.models import Q, F, Value, CharField
+from django.db.models import Q, F, Value, CharField, Case, When, IntegerField, OuterRef
 from django.contrib.auth.decorators import user_passes_test
+from django.views.decorators.http import require_http_methods, require_POST, require_safe
+from django.db import transaction
 from django.db.models.functions import Concat
 from django.http import Http404
 
 from .models import *
 from .utils import generate_otp, send_otp_email
+from .search import search_library, search_people
+from .facets import build_facets, facet_rows, facet_total, facet_values, get_library_facet_rows
+from .courses import count_rows, courses_for
+from .stats import get_counters, get_trends
+from .downloads import serve_file
+from .previews import PREVIEW_MAX_AGE
+from .uploads import UPLOAD_CHUNK_SIZE, OffsetMismatch, UploadError, append_chunk, finalize_upload, start_upload, upload_errors
+from .pagination import estimated_total, paginate_keyset, paginate_ranked, stream_list_response
+from .logreader import LOG_FILES, LOG_LEVELS, iter_log_matches, read_log_page, search_log
+from sss.logstore import query_records
+from sss.request_metrics import METRIC_FIELDS, SAMPLE_SIZE, view_metrics
 from django.core.paginator import Paginator
 from django.core.exceptions import FieldDoesNotExist, FieldError
 from itertools import groupby
@@ -132,33 +145,42 @@ def library_view(request):
     ordering = request.GET.get('ordering', '-upload_date').strip().lower()
 
     # Base query
-    files = File.objects.filter(status="APPROVED").select_related('upload_by')
+    files = File.objects.filter(status="APPROVED").select_related('upload_by', 'course')
+
+    # قيم الفلاتر وأعدادها من الذاكرة المؤقتة (admin_app/facets.py)، بدون استعلام لكل فلتر
+    all_facet_rows = get_library_facet_rows()
+    selected = {
+        'category': category_filter,
+        'course': course_filter,
+        'type': type_filter,
+        'uploader': uploader_filter,
+    }
+    for name, value in selected.items():
+        if value and value not in facet_values(all_facet_rows, name):
+            selected[name] = ''  # تجاهل القيم غير الصحيحة
 
-    # Fetch distinct data for filters
-    categories = files.values_list('category', flat=True).distinct()
-    courses = Course.objects.filter(
-        id__in=files.values_list('course__id', flat=True)
-    ).distinct()
-    types = files.values_list('type', flat=True).distinct()
-    uploaders = User.objects.filter(
-        id__in=files.values_list('upload_by__id', flat=True)
-    ).distinct()
+    ranked_ids = None
+    if search_query:
+        # البحث في الاسم والوصف والمقرر والرافع عبر فهرس البحث (admin_app/search.py)
+        ranked_ids = search_library(search_query)
+        files = files.filter(id__in=ranked_ids)
 
-    # Apply filters
-    if category_filter and category_filter in categories:
-        files = files.filter(category=category_filter)
+    # الأعداد تعكس نتائج البحث الحالية إن وُجد بحث
+    counted_rows = facet_rows(files) if search_query else all_facet_rows
+    facets = build_facets(counted_rows, selected)
 
-    if course_filter and course_filter.isdigit() and Course.objects.filter(id=course_filter).exists():
-        files = files.filter(course__id=course_filter)
+    # Apply filters
+    if selected['category']:
+        files = files.filter(category=selected['category'])
 
-    if type_filter and type_filter in types:
-        files = files.filter(type=type_filter)
+    if selected['course']:
+        files = files.filter(course__id=selected['course'])
 
-    if uploader_filter and uploader_filter.isdigit() and User.objects.filter(id=uploader_filter).exists():
-        files = files.filter(upload_by__id=uploader_filter)
+    if selected['type']:
+        files = files.filter(type=selected['type'])
 
-    if search_query:
-        files = files.filter(name__icontains=search_query)
+    if selected['uploader']:
+        files = files.filter(upload_by__id=selected['uploader'])
 
     valid_ordering_fields = [
         "name", "course__name", "category", "type", "size",
@@ -167,39 +189,49 @@ def library_view(request):
         "-upload_date", "-upload_by__first_name",
     ]
 
-    if ordering not in valid_ordering_fields:
-        ordering = "name"  # ترتيب افتراضي
-    files = files.order_by(ordering)
-
-    total_count = files.count()
-
+    total_count = facet_total(counted_rows, selected)
     show_all = request.GET.get('show_all', 'false').lower() == 'true'
-
     view_mode = request.GET.get('view', 'card').strip().lower()
+    relevance = ranked_ids is not None and 'ordering' not in request.GET
 
-    if show_all:
-        page_obj = files  # عرض جميع السجلات
-    else:
-        paginator = Paginator(files, 10)  # عدد السجلات في كل صفحة
-        page_number = request.GET.get('page')  # الحصول على رقم الصفحة من الطلب
-        page_obj = paginator.get_page(page_number)
+    if relevance:
+        ordering = "relevance"  # ترتيب نتائج البحث حسب الصلة ما لم يختر المستخدم ترتيباً آخر
+    elif ordering not in valid_ordering_fields:
+        ordering = "name"  # ترتيب افتراضي
 
-    return render(request, 'library_list.html', {
-        'page_obj': page_obj,
+    context = {
         'category_filter': category_filter,
         'course_filter': course_filter,
         'type_filter': type_filter,
         'uploader_filter': uploader_filter,
         'search_query': search_query,
-        'categories': categories,
-        'courses': courses,
-        'types': types,
-        'uploaders': uploaders,
+        'categories': facets['category'],
+        'courses': facets['course'],
+        'types': facets['type'],
+        'uploaders': facets['uploader'],
         'actual_ordering': ordering,
         'total_count': total_count,
         'show_all': show_all,
         'view_mode': view_mode,
-    })
+    }
+
+    if show_all:
+        if relevance:
+            files = files.order_by(Case(
+                *[When(id=file_id, then=position) for position, file_id in enumerate(ranked_ids)],
+                default=len(ranked_ids), output_field=IntegerField(),
+            ))
+        else:
+            files = files.order_by(ordering, 'pk')
+        rows_template = 'library_list_rows.html' if view_mode == 'list' else 'library_list_cards.html'
+        return stream_list_response(request, 'library_list.html', context, rows_template, files)
+
+    after, before = request.GET.get('after'), request.GET.get('before')
+    if relevance:
+        page_obj = paginate_ranked(files, ranked_ids, after=after, before=before)
+    else:
+        page_obj = paginate_keyset(files, ordering, after=after, before=before)
+    return render(request, 'library_list.html', dict(context, page_obj=page_obj))
 
 
 @login_required
@@ -346,7 +378,7 @@ def students_list(request):
         return redirect('403')
 
     if request.user.role == User.Roles.ADMIN or request.user.role == User.Roles.INSTRUCTOR:
-        students = Student.objects.filter(user__is_active=True).select_related('user').prefetch_related('department', 'group')
+        students = Student.objects.filter(user__is_active=True).select_related('user', 'department', 'group')
     # elif request.user.role == User.Roles.STUDENT:
     #     students = Student.objects.filter(user__is_active=True, user__gender=request.user.gender).select_related('user').prefetch_related('department', 'group')
 
@@ -392,37 +424,8 @@ def students_list(request):
         students = students.filter(user__gender=gender_filter)
 
     if search_query:
-        # تقسيم النص المدخل إلى كلمات بناءً على المسافات
-        search_words = search_query.split()
-        
-        # إنشاء استعلام للبحث عن الأسماء
-        search_filter = Q()
-        
-        # البحث عن أي كلمة (OR)
-        for word in search_words:
-            search_filter |= (
-                Q(user__first_name__icontains=word) |
-                Q(user__last_name__icontains=word)
-            )
-
-        # البحث عن جميع الكلمات معًا (AND)
-        for word in search_words:
-            search_filter &= (
-                Q(user__first_name__icontains=word) |
-                Q(user__last_name__icontains=word)
-            )
-
-        # إضافة البحث في بقية الحقول
-        search_filter |=Q(user__id__icontains=search_query) | \
-                        Q(user__email__icontains=search_query) | \
-                        Q(user__phone__icontains=search_query) | \
-                        Q(level__icontains=search_query) | \
-                        Q(department__name__icontains=search_query) | \
-                        Q(user__birth_date__icontains=search_query) | \
-                        Q(group__name__icontains=search_query)
-
-        # تطبيق الفلتر على قائمة المدرسين
-        students = students.filter(search_filter).distinct()
+        # البحث في الاسم والبريد والهاتف والقسم... عبر مستند البحث المفهرس (admin_app/search.py)
+        students = students.filter(user_id__in=search_people(search_query))
 
     # قائمة الحقول المسموح بها للترتيب
     valid_ordering_fields = [
@@ -451,8 +454,8 @@ def students_list(request):
         ordering = "user__id"  # ترتيب افتراضي
     students = students.order_by(ordering)
     
-    # حساب العدد الإجمالي للسجلات
-    total_count = students.count()
+    # العدد الإجمالي: تقدير المخطط للقوائم الكبيرة بدلاً من COUNT على الجدول كله
+    total_count, total_is_estimate = estimated_total(students)
 
      # التحقق من عرض جميع السجلات
     show_all = request.GET.get('show_all', 'false').lower() == 'true'
@@ -460,16 +463,7 @@ def students_list(request):
     # التبديل بين القائمة والكروت
     view_mode = request.GET.get('view', 'list').strip().lower()  # الوضع الافتراضي هو القائمة
 
-    # تطبيق التقسيم (Pagination) إذا لم يتم طلب عرض جميع السجلات
-    if show_all:
-        page_obj = students  # عرض جميع السجلات
-    else:                   # instructors, 10 if view_mode == 'list' else len(instructors)
-        paginator = Paginator(students, 10)  # عدد السجلات في كل صفحة
-        page_number = request.GET.get('page')  # الحصول على رقم الصفحة من الطلب
-        page_obj = paginator.get_page(page_number)  # البيانات الخاصة بالصفحة الحالية
-
-    return render(request, 'students_list.html', {
-        'page_obj': page_obj,
+    context = {
         'department_filter': department_filter,
         'group_filter': group_filter,
         'level_filter': level_filter,
@@ -481,9 +475,19 @@ def students_list(request):
         'genders': genders,
         'actual_ordering': ordering,
         'total_count': total_count,
+        'total_is_estimate': total_is_estimate,
         'show_all': show_all,
         'view_mode': view_mode,
-    })
+    }
+
+    # عرض جميع السجلات: إرسال الصفوف على دفعات بدلاً من تحميلها كلها في الذاكرة
+    if show_all:
+        rows_template = 'students_list_rows.html' if view_mode == 'list' else 'students_list_cards.html'
+        return stream_list_response(request, 'students_list.html', context, rows_template, students)
+
+    # تقسيم الصفحات بالمؤشر (keyset) بدلاً من COUNT و OFFSET
+    page_obj = paginate_keyset(students, ordering, after=request.GET.get('after'), before=request.GET.get('before'))
+    return render(request, 'students_list.html', dict(context, page_obj=page_obj))
 
 def request_otp(request):
     errors = {}
@@ -703,9 +707,9 @@ def group_students(request, group_id):
     else:
         try:
             # محاولة جلب المجموعة بناءً على المعرف
-            group = get_object_or_404(Group, id=int(group_id))
+            group = get_object_or_404(Group.objects.select_related('department'), id=int(group_id))
             department = group.department
-            students = group.students.all()  # جلب الطلاب المرتبطين بالجروب
+            students = group.students.select_related('user')  # جلب الطلاب المرتبطين بالجروب
         except Http404:
             # إذا لم يتم العثور على المجموعة
             error_message = "The requested group does not exist."
@@ -728,23 +732,23 @@ def instructor_dashboard(request):
     if request.user.role != User.Roles.INSTRUCTOR:
         return redirect('403')
 
-    instructor = get_object_or_404(Instructor, user=request.user)
-    groups_with_courses = []
+    # كل الإحصائيات في استعلام واحد: عدّادات الدكتور وعدد الدكاترة والطلاب النشطين كاستعلامات فرعية
+    instructor = get_object_or_404(
+        Instructor.objects.select_related('user').annotate(
+            total_courses=count_rows(Instructor.courses.through.objects.filter(instructor=OuterRef('pk'))),
+            total_departments=count_rows(Instructor.departments.through.objects.filter(instructor=OuterRef('pk'))),
+            total_instructors=count_rows(Instructor.objects.filter(user__is_active=True)),
+            total_students=count_rows(Student.objects.filter(user__is_active=True)),
+        ),
+        user=request.user,
+    )
     # الجروبات التي يدرسها الدكتور
-    groups = instructor.groups.all()
-    courses = instructor.courses.all()
-    departments = instructor.departments.all()
-    instructors = Instructor.objects.all().filter(user__is_active=True).count()
-    students = Student.objects.all().filter(user__is_active=True).count()
+    groups = list(instructor.groups.select_related('department'))
 
+    groups_with_courses = []
     for group in groups:
-        # الكورسات المرتبطة بالقسم والمستوى الخاصين بالجروب
-        courses_set = Course.objects.filter(
-            departments=group.department,
-            level=group.level
-        ).distinct()
-
-        courses_names = ", ".join(course.name for course in courses_set)
+        # الكورسات المرتبطة بالقسم والمستوى الخاصين بالجروب، من الجدول المحسوب مسبقاً
+        courses_names = ", ".join(courses_for(group.department_id, group.level))
         # إضافة البيانات للجروبات مع رابط
         group_link = reverse('group_students', kwargs={'group_id': group.id})
         groups_with_courses.append({
@@ -754,19 +758,15 @@ def instructor_dashboard(request):
             'department': group.department.name,
             'courses': courses_names,
         })
-    # جمع الإحصائيات
-    total_groups = groups.count()  # عدد الجروبات
-    total_courses = courses.count()  # عدد الكورسات
-    total_departments = departments.count()  # عدد الكورسات
 
     return render(request, 'instructor_dashboard.html', {
         'instructor': instructor,
         'groups_with_courses': groups_with_courses,
-        'total_groups': total_groups,
-        'total_courses': total_courses,
-        'total_departments': total_departments,
-        'total_instructors': instructors,
-        'total_students': students,
+        'total_groups': len(groups),
+        'total_courses': instructor.total_courses,
+        'total_departments': instructor.total_departments,
+        'total_instructors': instructor.total_instructors,
+        'total_students': instructor.total_students,
     })
 
 @login_required
@@ -774,21 +774,22 @@ def admin_dashboard(request):
     if request.user.role != User.Roles.ADMIN:
         return redirect('403')  # صفحة مخصصة لرفض الوصول
 
-     # إحصائيات
-    total_users = User.objects.count()
-    total_students = Student.objects.count()
-    total_instructors = Instructor.objects.count()
-    total_account_requests = AccountRequest.objects.count()
+    # إحصائيات من العدّادات المحفوظة في الذاكرة المؤقتة والاتجاهات من جدول التجميع اليومي
+    counters = get_counters()
+    trends = get_trends()
 
     # قوائم سريعة
     recent_account_requests = AccountRequest.objects.order_by('-created_at')[:5]
-    recent_files = File.objects.order_by('-upload_date')[:5]
+    recent_files = File.objects.select_related('upload_by').order_by('-upload_date')[:5]
 
     context = {
-        'total_users': total_users,
-        'total_students': total_students,
-        'total_instructors': total_instructors,
-        'total_account_requests': total_account_requests,
+        'total_users': counters['users'],
+        'total_students': counters['students'],
+        'total_instructors': counters['instructors'],
+        'total_account_requests': counters['account_requests'],
+        'total_files': counters['files'],
+        'uploads_per_day': trends['uploads_per_day'],
+        'requests_per_week': trends['requests_per_week'],
         'recent_account_requests': recent_account_requests,
         'recent_files': recent_files,
     }
@@ -800,10 +801,10 @@ def student_dashboard(request):
     if request.user.role != User.Roles.STUDENT:
         return redirect('403')
 
-    student = Student.objects.get(user=request.user)
-    student_courses = student.student_courses.all()
+    student = Student.objects.select_related('department').get(user=request.user)
+    student_courses = student.student_courses.select_related('course')
 
-    recent_files = File.objects.filter(upload_by=request.user).order_by('-upload_date')[:5]
+    recent_files = File.objects.filter(upload_by=request.user).select_related('course').order_by('-upload_date')[:5]
 
     return render(request, "student_dashboard.html", {
         "student": student,
@@ -844,35 +845,8 @@ def instructors_list(request):
         instructors = instructors.filter(user__gender=gender_filter)
 
     if search_query:
-        # تقسيم النص المدخل إلى كلمات بناءً على المسافات
-        search_words = search_query.split()
-        
-        # إنشاء استعلام للبحث عن الأسماء
-        search_filter = Q()
-
-        # البحث عن أي كلمة (OR)
-        for word in search_words:
-            search_filter |= (
-                Q(user__first_name__icontains=word) |
-                Q(user__last_name__icontains=word)
-            )
-        
-        # البحث عن جميع الكلمات معًا (AND)
-        for word in search_words:
-            search_filter &= (
-                Q(user__first_name__icontains=word) |
-                Q(user__last_name__icontains=word)
-            )
-
-        # إضافة البحث في بقية الحقول
-        search_filter |= Q(user__id__icontains=search_query) | \
-                         Q(user__email__icontains=search_query) | \
-                         Q(user__phone__icontains=search_query) | \
-                         Q(departments__name__icontains=search_query) | \
-                         Q(courses__name__icontains=search_query)
-
-        # تطبيق الفلتر على قائمة المدرسين
-        instructors = instructors.filter(search_filter).distinct()
+        # البحث في الاسم والبريد والهاتف والقسم... عبر مستند البحث المفهرس (admin_app/search.py)
+        instructors = instructors.filter(user_id__in=search_people(search_query))
 
     # قائمة الحقول المسموح بها للترتيب
     valid_ordering_fields = [
@@ -893,8 +867,8 @@ def instructors_list(request):
         ordering = "user__id"  # ترتيب افتراضي
     instructors = instructors.order_by(ordering)
     
-    # حساب العدد الإجمالي للسجلات
-    total_count = instructors.count()
+    # العدد الإجمالي: تقدير المخطط للقوائم الكبيرة بدلاً من COUNT على الجدول كله
+    total_count, total_is_estimate = estimated_total(instructors)
 
      # التحقق من عرض جميع السجلات
     show_all = request.GET.get('show_all', 'false').lower() == 'true'
@@ -902,16 +876,7 @@ def instructors_list(request):
     # التبديل بين القائمة والكروت
     view_mode = request.GET.get('view', 'list').strip().lower()  # الوضع الافتراضي هو القائمة
 
-    # تطبيق التقسيم (Pagination) إذا لم يتم طلب عرض جميع السجلات
-    if show_all:
-        page_obj = instructors  # عرض جميع السجلات
-    else:                   # instructors, 10 if view_mode == 'list' else len(instructors)
-        paginator = Paginator(instructors, 10)  # عدد السجلات في كل صفحة
-        page_number = request.GET.get('page')  # الحصول على رقم الصفحة من الطلب
-        page_obj = paginator.get_page(page_number)  # البيانات الخاصة بالصفحة الحالية
-
-    return render(request, 'instructors_list.html', {
-        'page_obj': page_obj,
+    context = {
         'department_filter': department_filter,
         'course_filter': course_filter,
         'gender_filter': gender_filter,
@@ -921,9 +886,19 @@ def instructors_list(request):
         'genders': genders,
         'actual_ordering': ordering,
         'total_count': total_count,
+        'total_is_estimate': total_is_estimate,
         'show_all': show_all,
         'view_mode': view_mode,
-    })
+    }
+
+    # عرض جميع السجلات: إرسال الصفوف على دفعات بدلاً من تحميلها كلها في الذاكرة
+    if show_all:
+        rows_template = 'instructors_list_rows.html' if view_mode == 'list' else 'instructors_list_cards.html'
+        return stream_list_response(request, 'instructors_list.html', context, rows_template, instructors)
+
+    # تقسيم الصفحات بالمؤشر (keyset) بدلاً من COUNT و OFFSET
+    page_obj = paginate_keyset(instructors, ordering, after=request.GET.get('after'), before=request.GET.get('before'))
+    return render(request, 'instructors_list.html', dict(context, page_obj=page_obj))
 
 @login_required
 def departments_with_groups(request):
@@ -969,6 +944,14 @@ def library_my_uploaded_files(request):
         'total_count': total_count,
     })
 
+def report_upload(request, file_instance):
+    if request.user.role == User.Roles.ADMIN or request.user.role == User.Roles.INSTRUCTOR:
+        messages.success(request, 'File uploaded successfully!')
+        logger.info("File '%s' uploaded by user %s.", file_instance.name, request.user.username)
+    elif request.user.role == User.Roles.STUDENT:
+        messages.success(request, 'Your file has been sent for approval or rejected by the administrator!')
+        logger.info("File '%s' uploaded by user %s.", file_instance.name, request.user.username)
+
 @login_required
 def upload_file(request):
     errors = {}  # لتخزين الأخطاء لكل حقل
@@ -999,15 +982,7 @@ def upload_file(request):
                     status= 'APPROVED' if request.user.role == User.Roles.INSTRUCTOR or request.user.role == User.Roles.ADMIN else 'PENDING'   # الحالة دائمًا Approved للدكتور
                 )
                 file_instance.save()
-
-                if request.user.role == User.Roles.ADMIN or request.user.role == User.Roles.INSTRUCTOR:
-                    messages.success(request, 'File uploaded successfully!')
-                    logger.info("File '%s' uploaded by user %s.", file_instance.name, request.user.username)
-                elif request.user.role == User.Roles.STUDENT:
-                    messages.success(request, 'Your file has been sent for approval or rejected by the administrator!')
-                    logger.info("File '%s' uploaded by user %s.", file_instance.name, request.user.username)
-            
-                
+                report_upload(request, file_instance)
                 return redirect('library_my_uploaded_files')
 
     # جلب الكورسات المرتبطة بالمستخدم الحالي
@@ -1029,6 +1004,70 @@ def upload_file(request):
     })
 
 
+@login_required
+@require_POST
+def upload_file_start(request):
+    """Open a chunked upload; the file itself is sent to upload_file_chunk."""
+    filename = request.POST.get('filename', '')
+    size = request.POST.get('size', '')
+    size = int(size) if size.isdigit() else None
+    description = request.POST.get('description', '')
+    course_id = request.POST.get('course', '')
+    checksum = request.POST.get('checksum', '').lower()
+
+    errors = upload_errors(filename, size, description, course_id, checksum)
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+    session = start_upload(request.user, filename, size, description, course_id, checksum)
+    return JsonResponse({
+        'id': str(session.pk),
+        'offset': 0,
+        'chunk_size': UPLOAD_CHUNK_SIZE,
+        'chunk_url': reverse('upload_file_chunk', args=[session.pk]),
+        'finish_url': reverse('upload_file_finish', args=[session.pk]),
+    }, status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def upload_file_chunk(request, upload_id):
+    """GET: the offset to resume from. PUT: append the body at the Upload-Offset header."""
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    if request.method == 'GET':
+        return JsonResponse({'offset': session.received, 'size': session.size})
+
+    offset = request.headers.get('Upload-Offset', '')
+    length = request.headers.get('Content-Length', '')
+    if not offset.isdigit() or not length.isdigit():
+        return JsonResponse({'error': 'Upload-Offset and Content-Length are required.'}, status=400)
+    try:
+        # الجسم يُقرأ من الطلب مباشرة إلى الملف المؤقت دون تحميله في الذاكرة
+        received = append_chunk(session.pk, int(offset), request, int(length))
+    except OffsetMismatch as e:
+        return JsonResponse({'error': str(e), 'offset': e.received}, status=409)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if received < int(offset) + int(length):
+        return JsonResponse({'error': 'The chunk was cut short.', 'offset': received}, status=400)
+    return JsonResponse({'offset': received, 'size': session.size})
+
+
+@login_required
+@require_POST
+def upload_file_finish(request, upload_id):
+    """Check the uploaded file and create its File row."""
+    with transaction.atomic():
+        session = get_object_or_404(
+            UploadSession.objects.select_for_update().select_related('user'), pk=upload_id, user=request.user
+        )
+        try:
+            file_instance = finalize_upload(session)
+        except UploadError as e:
+            return JsonResponse({'error': str(e), 'offset': session.received}, status=400)
+    report_upload(request, file_instance)
+    return JsonResponse({'id': file_instance.pk, 'redirect': reverse('library_my_uploaded_files')}, status=201)
+
+
 @login_required
 def edit_file(request, file_id):
     errors = {}
@@ -1093,11 +1132,37 @@ def edit_file(request, file_id):
         'errors': errors
     })
 
+@login_required
+@require_safe
+def download_file(request, file_id):
+    """Send a library file; ?inline=1 opens it in the browser instead of downloading it."""
+    file = get_object_or_404(File.objects.select_related('upload_by'), id=file_id)
+    if not file.can_be_downloaded_by(request.user) or not file.file:
+        raise Http404("File not found.")  # لا نكشف وجود ملف غير مسموح للمستخدم
+    try:
+        return serve_file(request, file.file.storage, file.file.name, file.name, as_attachment=not request.GET.get('inline'))
+    except FileNotFoundError:
+        logger.error("File '%s' (#%s) is missing from the storage.", file.name, file.pk)
+        raise Http404("File not found.")
+
+@login_required
+@require_safe
+def file_preview(request, file_id):
+    """The small image shown on the library card instead of the original file."""
+    file = get_object_or_404(File, id=file_id, preview_status=File.PreviewStatuses.READY)
+    if not file.can_be_downloaded_by(request.user):
+        raise Http404("File not found.")
+    try:
+        # المعاينة لا تتغير لنفس المحتوى، فيحتفظ بها المتصفح ساعة دون إعادة تحقق
+        return serve_file(request, file.file.storage, file.preview_name, f"{file.name.rsplit('.', 1)[0]}.webp",
+                          as_attachment=False, max_age=PREVIEW_MAX_AGE)
+    except FileNotFoundError:
+        raise Http404("Preview not found.")
+
 @login_required
 def delete_file(request, file_id):
     file = get_object_or_404(File, id=file_id)
-    file.file.delete()  # حذف الملف المرفوع من السيرفر
-    file.delete()       # حذف السجل من قاعدة البيانات
+    file.delete()       # حذف السجل من قاعدة البيانات، وإشارة post_delete تحرر الملف المرفوع
     messages.success(request, "File deleted successfully.")
     logger.info("File '%s' deleted by user %s.", file.name, request.user.username)
     return redirect('library_my_uploaded_files')  
@@ -1137,17 +1202,6 @@ def departments_list(request):
     })
     
 
-def read_log(file_path, filter_keyword=None,):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            if filter_keyword:
-                lines = [line for line in lines if filter_keyword.lower() in line.lower()]
-            return lines[::-1]  # Show latest logs first
-    except FileNotFoundError:
-        return ["Log file not found."]
-    
-    
 @login_required
 def log_viewer(request):
     if request.user.role != User.Roles.ADMIN:
@@ -1155,19 +1209,61 @@ def log_viewer(request):
     
     log_type = request.GET.get('log_type', 'admin')  # Default to admin logs
     filter_keyword = request.GET.get('filter', '')
+    log_file = LOG_FILES.get(log_type, LOG_FILES['admin'])
 
-    log_file_paths = {
-        'admin': os.path.join(settings.BASE_DIR, 'sss/logs', 'admin_app.log'),
-        'server': os.path.join(settings.BASE_DIR, 'sss/logs', 'default.log')
+    context = {
+        'log_type': log_type,
+        'filter_keyword': filter_keyword,
+        'mode': request.GET.get('mode', 'text'),
+        'log_levels': LOG_LEVELS,
     }
+    if context['mode'] == 'query':
+        # وضع الاستعلام: السجلات المنظمة مع فلاتر على الحقول ونطاق زمني
+        filters = {name: request.GET.get(name, '').strip() for name in ('level', 'logger', 'user', 'path', 'text', 'since', 'until')}
+        context['filters'] = filters
+        context['records'], context['next_cursor'] = query_records(
+            settings.LOG_STORE_DIR,
+            level=logging.getLevelName(filters['level']) if filters['level'] in LOG_LEVELS else None,
+            logger=filters['logger'], user=filters['user'], path=filters['path'], text=filters['text'],
+            since=parse_datetime(filters['since']) if filters['since'] else None,
+            until=parse_datetime(filters['until']) if filters['until'] else None,
+            before=request.GET.get('before'),
+        )
+        context['is_continued'] = bool(request.GET.get('before'))
+    elif not os.path.exists(log_file):
+        context['logs'] = ["Log file not found."]
+    elif filter_keyword:
+        # البحث يقرأ الملف من النهاية ويتوقف عند امتلاء الصفحة، والمؤشر موضع بايت للمتابعة
+        before = request.GET.get('before', '')
+        before = int(before) if before.isdigit() else None
+        context['logs'], context['next_cursor'] = search_log(log_file, filter_keyword, before=before)
+        context['is_continued'] = before is not None
+    else:
+        page = request.GET.get('page', '1')
+        context['logs'], context['page'], context['pages'] = read_log_page(log_file, int(page) if page.isdigit() else 1)
 
-    log_file = log_file_paths.get(log_type, log_file_paths['admin'])
-    logs = read_log(log_file, filter_keyword)
+    return render(request, 'log_viewer.html', context)
 
-    return render(request, 'log_viewer.html', {
-        'logs': logs,
-        'log_type': log_type,
-        'filter_keyword': filter_keyword
+    
+@login_required
+def metrics_view(request):
+    if request.user.role != User.Roles.ADMIN:
+        return redirect("403")
+
+    if request.method == 'POST':
+        view_metrics.clear()
+        messages.success(request, "Request metrics have been reset.")
+        return redirect('metrics')
+
+    sort = request.GET.get('sort', 'total')
+    if sort not in METRIC_FIELDS:
+        sort = 'total'
+    rows = sorted(view_metrics.summary(), key=lambda row: row[sort]['p95'] or 0, reverse=True)
+
+    return render(request, 'metrics.html', {
+        'rows': rows,
+        'sort': sort,
+        'sample_size': SAMPLE_SIZE,
     })
 
     
@@ -1176,19 +1272,17 @@ def download_logs(request):
     if request.user.role != User.Roles.ADMIN:
         return redirect("403")
     log_type = request.GET.get('log_type', 'admin')
-    
-    if log_type == 'admin':
-        log_file = os.path.join(settings.BASE_DIR, 'sss/logs', 'admin_app.log')
-    elif log_type == 'server':
-        log_file = os.path.join(settings.BASE_DIR, 'sss/logs', 'default.log')
-  # Adjust if chat logs are separate
-    else:
+    filter_keyword = request.GET.get('filter', '')
+
+    log_file = LOG_FILES.get(log_type)
+    if log_file is None:
         return HttpResponse('Invalid log type specified.', status=400)
 
     if not os.path.exists(log_file):
         return HttpResponse('Log file not found.', status=404)
 
-    with open(log_file, 'r') as f:
-        response = HttpResponse(f.read(), content_type='text/plain')
+    if filter_keyword:
+        response = StreamingHttpResponse(iter_log_matches(log_file, filter_keyword), content_type='text/plain; charset=utf-8')
         response['Content-Disposition'] = f'attachment; filename="{log_type}_logs.txt"'
-        return response
\ No newline at end of file
+        return response
+    return FileResponse(open(log_file, 'rb'), as_attachment=True, filename=f"{log_type}_logs.txt", content_type='text/plain; charset=utf-8')
@@ -5,3 +5,6 @@ class ChatAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "chat_app"
     verbose_name = 'Chats'
+
+    def ready(self):
+        import chat_app.signals # ربط إشارات الدردشة (إرسال الرسائل عبر WebSocket)
@@ -0,0 +1,72 @@
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.layers import get_channel_layer
+from .models import ChatRoom
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def room_group_name(room_id):
+    """Name of the channel-layer group that every socket of a room joins."""
+    return f"chat_room_{room_id}"
+
+
+def broadcast_messages(room_id, messages):
+    """
+    Push saved Messages of one room to every socket connected to it, as a
+    single channel-layer event. Safe to call from synchronous code (views, signals).
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not messages:
+        return
+    async_to_sync(channel_layer.group_send)(
+        room_group_name(room_id),
+        {'type': 'chat.messages', 'messages': [message.as_dict() for message in messages]},
+    )
+
+
+class ChatRoomConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Read-only WebSocket for one ChatRoom: /ws/chat/<room_id>/
+
+    Membership is checked once when the socket connects; after that the
+    consumer only relays messages pushed through the channel layer.
+    Messages are written through the regular HTTP views.
+    """
+
+    async def connect(self):
+        self.room_id = self.scope['url_route']['kwargs']['room_id']
+        self.group_name = room_group_name(self.room_id)
+        user = self.scope.get('user')
+
+        if user is None or not user.is_authenticated:
+            logger.warning("WebSocket rejected for anonymous user in room %s.", self.room_id)
+            await self.close(code=4401)
+            return
+
+        if not await self.is_room_member(user):
+            logger.warning("WebSocket rejected: user '%s' is not a member of room %s.", user.username, self.room_id)
+            await self.close(code=4403)
+            return
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        logger.info("WebSocket opened by user '%s' in room %s.", user.username, self.room_id)
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Sending goes through the HTTP API, the socket is push-only.
+        await self.send_json({'error': 'This socket is read-only.'})
+
+    async def chat_messages(self, event):
+        for message in event['messages']:
+            await self.send_json({'type': 'message', 'message': message})
+
+    @database_sync_to_async
+    def is_room_member(self, user):
+        return ChatRoom.objects.filter(id=self.room_id, members=user).exists()
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 22:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_app', '0002_message_room_timestamp_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='content_type',
+            field=models.CharField(choices=[('text', 'Text'), ('file', 'File')], default='text', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='file_name',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.4 on 2026-10-18 22:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_last_message_and_cursors(apps, schema_editor):
+    ChatRoom = apps.get_model('chat_app', 'ChatRoom')
+    Message = apps.get_model('chat_app', 'Message')
+    ReadCursor = apps.get_model('chat_app', 'ReadCursor')
+
+    for room in ChatRoom.objects.all():
+        last = Message.objects.filter(room=room).order_by('-timestamp', '-id').first()
+        if last:
+            text = (last.file_name or 'File') if last.content_type == 'file' else last.content
+            room.last_message_at = last.timestamp
+            room.last_message_preview = text[:100]
+            room.save(update_fields=['last_message_at', 'last_message_preview'])
+        # الرسائل القديمة تعتبر مقروءة
+        ReadCursor.objects.bulk_create(
+            [ReadCursor(room=room, user_id=user_id, last_read_at=room.last_message_at)
+             for user_id in room.members.values_list('id', flat=True)],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_app', '0003_message_attachment_fields'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.CreateModel(
+            name='ReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_at', models.DateTimeField(blank=True, null=True)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='chat_app.chatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_read_cursors', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('room', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_last_message_and_cursors, migrations.RunPython.noop),
+    ]
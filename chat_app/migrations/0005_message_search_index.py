@@ -0,0 +1,79 @@
+from django.db import migrations
+from admin_app.utils import sqlite_supports_trigram
+
+# PostgreSQL: عمود tsvector مولّد تلقائياً من نص الرسالة (أو اسم الملف) مع فهرس GIN
+POSTGRESQL_FORWARD = [
+    """
+    ALTER TABLE chat_app_message ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple', CASE WHEN content_type = 'file' THEN coalesce(file_name, '') ELSE content END)
+    ) STORED
+    """,
+    "CREATE INDEX chat_msg_search_vector_idx ON chat_app_message USING gin (search_vector)",
+]
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS chat_msg_search_vector_idx",
+    "ALTER TABLE chat_app_message DROP COLUMN IF EXISTS search_vector",
+]
+
+# SQLite: جدول FTS5 بمقاطع trigram يُحدَّث بواسطة triggers
+# (بدون مُقسِّم trigram يبقى البحث على icontains)
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE chat_app_message_fts USING fts5(
+        content, file_name, content='chat_app_message', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER chat_app_message_fts_ai AFTER INSERT ON chat_app_message BEGIN
+        INSERT INTO chat_app_message_fts(rowid, content, file_name) VALUES (new.id, new.content, new.file_name);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_app_message_fts_ad AFTER DELETE ON chat_app_message BEGIN
+        INSERT INTO chat_app_message_fts(chat_app_message_fts, rowid, content, file_name)
+        VALUES ('delete', old.id, old.content, old.file_name);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_app_message_fts_au AFTER UPDATE OF content, file_name ON chat_app_message BEGIN
+        INSERT INTO chat_app_message_fts(chat_app_message_fts, rowid, content, file_name)
+        VALUES ('delete', old.id, old.content, old.file_name);
+        INSERT INTO chat_app_message_fts(rowid, content, file_name) VALUES (new.id, new.content, new.file_name);
+    END
+    """,
+    "INSERT INTO chat_app_message_fts(chat_app_message_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS chat_app_message_fts_au",
+    "DROP TRIGGER IF EXISTS chat_app_message_fts_ad",
+    "DROP TRIGGER IF EXISTS chat_app_message_fts_ai",
+    "DROP TABLE IF EXISTS chat_app_message_fts",
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor not in statements:
+            return
+        if vendor == 'sqlite' and not sqlite_supports_trigram(schema_editor.connection):
+            return
+        with schema_editor.connection.cursor() as cursor:
+            for statement in statements[vendor]:
+                cursor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_app', '0004_room_last_message_read_cursor'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_statements({'postgresql': POSTGRESQL_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run_statements({'postgresql': POSTGRESQL_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
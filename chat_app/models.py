@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from admin_app.models import User
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,6 +20,9 @@ class ChatRoom(models.Model):
     creation_time = models.DateTimeField(auto_now_add=True)
     is_male_only = models.BooleanField(default=False)
     is_female_only = models.BooleanField(default=False)
+    # آخر رسالة في الغرفة (نسخة مخزنة مسبقاً لعرض قائمة الدردشات دون استعلام لكل غرفة)
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_message_preview = models.CharField(max_length=255, blank=True, default='')
 
     def __str__(self):
         return self.name
@@ -41,6 +46,65 @@ class ChatRoom(models.Model):
         self.members.add(user)
         logger.info("User '%s' added to chat room '%s'.", user.username, self.name)
 
+    def add_members(self, user_ids, candidates=None):
+        """
+        Add many users at once: one query for the candidates, one for the
+        existing members and one bulk INSERT into the members table.
+
+        `candidates` is an optional User queryset that restricts who may be
+        added (e.g. active students). Returns a report dict of lists:
+        `added`, `already_member` and `gender_mismatch` hold User objects,
+        `not_found` holds the submitted ids that matched no candidate.
+        """
+        report = {'added': [], 'already_member': [], 'gender_mismatch': [], 'not_found': []}
+
+        ids = []
+        for user_id in user_ids:
+            try:
+                ids.append(int(user_id))
+            except (TypeError, ValueError):
+                if str(user_id).strip():
+                    report['not_found'].append(user_id)
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return report
+
+        if candidates is None:
+            candidates = User.objects.all()
+        users = {user.id: user for user in candidates.filter(id__in=ids)}
+        existing_ids = set(self.members.filter(id__in=list(users)).values_list('id', flat=True))
+
+        for user_id in ids:
+            user = users.get(user_id)
+            if user is None:
+                report['not_found'].append(user_id)
+            elif (self.is_male_only and user.gender != 'M') or (self.is_female_only and user.gender != 'F'):
+                report['gender_mismatch'].append(user)
+            elif user_id in existing_ids:
+                report['already_member'].append(user)
+            else:
+                report['added'].append(user)
+
+        if report['added']:
+            through = ChatRoom.members.through
+            with transaction.atomic():
+                through.objects.bulk_create(
+                    [through(chatroom_id=self.id, user_id=user.id) for user in report['added']],
+                    ignore_conflicts=True,
+                )
+                # bulk_create على جدول الربط لا يرسل m2m_changed، لذلك ننشئ مؤشرات القراءة هنا
+                ReadCursor.objects.bulk_create(
+                    [ReadCursor(room=self, user=user) for user in report['added']],
+                    ignore_conflicts=True,
+                )
+
+        logger.info(
+            "Chat room '%s': %d added, %d already members, %d gender mismatches, %d not found.",
+            self.name, len(report['added']), len(report['already_member']),
+            len(report['gender_mismatch']), len(report['not_found']),
+        )
+        return report
+
     def remove_member(self, user):
         if user == self.created_by:
             logger.error("Attempt to remove creator '%s' from chat room '%s' blocked.", user.username, self.name)
@@ -77,20 +141,117 @@ class ChatRoom(models.Model):
 
         # Add students if provided
         if student_ids:
-            students = User.objects.filter(id__in=student_ids)
-            for student in students:
-                try:
-                    self.add_member(student)
-                except ValidationError as e:
-                    logger.error("Failed to add student '%s' to chat room '%s': %s", student.username, self.name, e)
+            report = self.add_members(student_ids)
+            for student in report['gender_mismatch']:
+                logger.error("Failed to add student '%s' to chat room '%s': gender mismatch.", student.username, self.name)
 
         return self
 
+    def send_messages(self, sender, messages_data):
+        """
+        Write one or more messages from `sender` in a single transaction and a
+        single INSERT. `messages_data` is a list of dicts with `content` and,
+        for attachments, `content_type`, `file_name` and `file_size`.
+        The new messages are pushed to the room's WebSockets after commit.
+        """
+        from .consumers import broadcast_messages
+
+        messages = [
+            Message(
+                room=self,
+                sender=sender,
+                content=data['content'],
+                content_type=data.get('content_type', Message.ContentTypes.TEXT),
+                file_name=data.get('file_name'),
+                file_size=data.get('file_size'),
+            )
+            for data in messages_data
+        ]
+        with transaction.atomic():
+            # bulk_create لا يرسل post_save، لذلك نحدّث العدادات ونبث الرسائل يدوياً
+            created = Message.objects.bulk_create(messages)
+            self.record_new_messages(sender, created)
+            transaction.on_commit(lambda: broadcast_messages(self.id, created))
+        logger.info("%s message(s) sent by user '%s' in chat room '%s'.", len(created), sender.username, self.name)
+        return created
+
+    def record_new_messages(self, sender, messages):
+        """
+        Update the denormalized last-message fields and the members' unread
+        counters after `sender` posted `messages` in this room.
+        """
+        if not messages:
+            return
+        last = max(messages, key=lambda message: (message.timestamp, message.id))
+        ChatRoom.objects.filter(
+            Q(last_message_at__isnull=True) | Q(last_message_at__lte=last.timestamp),
+            id=self.id,
+        ).update(last_message_at=last.timestamp, last_message_preview=last.get_preview())
+        self.last_message_at = last.timestamp
+        self.last_message_preview = last.get_preview()
+
+        ReadCursor.objects.filter(room=self).exclude(user=sender).update(unread_count=F('unread_count') + len(messages))
+        ReadCursor.objects.filter(room=self, user=sender).update(unread_count=0, last_read_at=last.timestamp)
+
+    def mark_read(self, user):
+        """Reset the unread counter of `user` in this room."""
+        ReadCursor.objects.filter(room=self, user=user).update(unread_count=0, last_read_at=timezone.now())
+
+class ReadCursor(models.Model):
+    """
+    Read position of one member in one chat room. One row per membership,
+    kept in sync with ChatRoom.members by the m2m_changed signal.
+    """
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='read_cursors')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_read_cursors')
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('room', 'user',)
+
+    def __str__(self):
+        return f'{self.user} in {self.room}: {self.unread_count} unread'
+
 class Message(models.Model):
+    class ContentTypes(models.TextChoices):
+        TEXT = 'text', 'Text'
+        FILE = 'file', 'File'
+
     room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    content_type = models.CharField(max_length=10, choices=ContentTypes.choices, default=ContentTypes.TEXT)
+    file_name = models.CharField(max_length=255, null=True, blank=True)
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)  # بالبايت
+
+    class Meta:
+        indexes = [
+            # يخدم صفحات السجل (history) بترتيب (timestamp, id) داخل كل غرفة
+            models.Index(fields=['room', 'timestamp', 'id'], name='chat_msg_room_ts_id_idx'),
+        ]
 
     def __str__(self):
-        return f'{self.sender} in {self.room}: {self.content}'
\ No newline at end of file
+        return f'{self.sender} in {self.room}: {self.content}'
+
+    def get_preview(self):
+        """Short text shown for this message in the chat list."""
+        text = (self.file_name or 'File') if self.content_type == self.ContentTypes.FILE else self.content
+        return text[:100]
+
+    def as_dict(self):
+        """
+        JSON-serializable payload used by the WebSocket push and the chat APIs.
+        """
+        return {
+            'id': self.id,
+            'room': self.room_id,
+            'sender_id': self.sender_id,
+            'sender': self.sender.get_full_name(),
+            'content': self.content,
+            'content_type': self.content_type,
+            'file_name': self.file_name,
+            'file_size': self.file_size,
+            'timestamp': self.timestamp.isoformat(),
+        }
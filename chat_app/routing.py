@@ -0,0 +1,6 @@
+from django.urls import path
+from .consumers import ChatRoomConsumer
+
+websocket_urlpatterns = [
+    path('ws/chat/<int:room_id>/', ChatRoomConsumer.as_asgi(), name='chat_room_socket'),
+]
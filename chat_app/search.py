@@ -0,0 +1,139 @@
+"""
+Full-text search over chat messages.
+
+PostgreSQL: a generated `search_vector` tsvector column on chat_app_message
+with a GIN index (see migration 0005), ranked with ts_rank.
+SQLite (development): an FTS5 table with the trigram tokenizer kept in sync
+by triggers, ranked with bm25. If neither is available the search falls back
+to a plain `icontains` scan.
+"""
+import re
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from .models import ChatRoom, Message
+
+SEARCH_CONFIG = 'simple'  # بدون تجذيع حتى يعمل مع العربية والإنجليزية معاً
+FTS_TABLE = 'chat_app_message_fts'
+TRIGRAM_MIN_LENGTH = 3
+MAX_QUERY_TERMS = 10
+
+_sqlite_fts_available = None
+
+
+def search_terms(query):
+    """Split a search string into lower-case word terms (at most MAX_QUERY_TERMS)."""
+    terms = re.findall(r'\w+', query.lower())
+    return list(dict.fromkeys(terms))[:MAX_QUERY_TERMS]
+
+
+def highlight(text, terms, width=160):
+    """
+    Return an HTML-escaped snippet of `text` around the first match, with
+    every occurrence of `terms` wrapped in <mark>.
+    """
+    text = text or ''
+    if not terms:
+        return escape(text[:width])
+    pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    match = pattern.search(text)
+    start = max(0, match.start() - width // 3) if match else 0
+    end = min(len(text), start + width)
+    snippet = text[start:end]
+
+    parts = ['…' if start > 0 else '']
+    last = 0
+    for found in pattern.finditer(snippet):
+        parts.append(escape(snippet[last:found.start()]))
+        parts.append(f'<mark>{escape(found.group())}</mark>')
+        last = found.end()
+    parts.append(escape(snippet[last:]))
+    parts.append('…' if end < len(text) else '')
+    return ''.join(parts)
+
+
+def sqlite_fts_available():
+    global _sqlite_fts_available
+    if _sqlite_fts_available is None:
+        _sqlite_fts_available = FTS_TABLE in connection.introspection.table_names()
+    return _sqlite_fts_available
+
+
+def search_messages(user, query, room_id=None, limit=20, offset=0):
+    """
+    Search the messages of the rooms `user` is a member of (optionally a
+    single room). Returns (results, has_more) where results is a list of
+    (message, rank) pairs, best match first.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return [], False
+
+    rooms = ChatRoom.objects.filter(members=user)
+    if room_id is not None:
+        rooms = rooms.filter(id=room_id)
+    room_ids = list(rooms.values_list('id', flat=True))
+    if not room_ids:
+        return [], False
+
+    if connection.vendor == 'postgresql':
+        ranked = _search_postgresql(query, room_ids, limit + 1, offset)
+    elif connection.vendor == 'sqlite' and sqlite_fts_available() and any(len(term) >= TRIGRAM_MIN_LENGTH for term in terms):
+        ranked = _search_sqlite(terms, room_ids, limit + 1, offset)
+    else:
+        ranked = _search_fallback(terms, room_ids, limit + 1, offset)
+
+    has_more = len(ranked) > limit
+    ranked = ranked[:limit]
+    messages = Message.objects.select_related('sender', 'room').in_bulk([message_id for message_id, _ in ranked])
+    return [(messages[message_id], rank) for message_id, rank in ranked if message_id in messages], has_more
+
+
+def _search_postgresql(query, room_ids, limit, offset):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+    from django.db.models.expressions import RawSQL
+
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    # search_vector عمود مولّد في قاعدة البيانات وليس حقلاً في النموذج
+    document = RawSQL('"chat_app_message"."search_vector"', [], output_field=SearchVectorField())
+    rows = (
+        Message.objects.filter(room_id__in=room_ids)
+        .annotate(document=document)
+        .filter(document=search_query)
+        .annotate(rank=SearchRank(document, search_query))
+        .order_by('-rank', '-timestamp', '-id')
+        .values_list('id', 'rank')[offset:offset + limit]
+    )
+    return list(rows)
+
+
+def _search_sqlite(terms, room_ids, limit, offset):
+    # مقاطع trigram تحتاج 3 أحرف على الأقل، الكلمات الأقصر تُطابق بـ LIKE
+    long_terms = [term for term in terms if len(term) >= TRIGRAM_MIN_LENGTH]
+    short_terms = [term for term in terms if len(term) < TRIGRAM_MIN_LENGTH]
+    match = ' AND '.join('"%s"' % term.replace('"', '""') for term in long_terms)
+
+    sql = [
+        f'SELECT m.id, -bm25({FTS_TABLE}) AS rank FROM {FTS_TABLE}',
+        f'JOIN chat_app_message m ON m.id = {FTS_TABLE}.rowid',
+        f'WHERE {FTS_TABLE} MATCH %s AND m.room_id IN ({", ".join(["%s"] * len(room_ids))})',
+    ]
+    params = [match, *room_ids]
+    for term in short_terms:
+        sql.append("AND (m.content LIKE %s ESCAPE '\\' OR m.file_name LIKE %s ESCAPE '\\')")
+        pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        params += [pattern, pattern]
+    sql.append('ORDER BY rank DESC, m.timestamp DESC, m.id DESC LIMIT %s OFFSET %s')
+    params += [limit, offset]
+
+    with connection.cursor() as cursor:
+        cursor.execute(' '.join(sql), params)
+        return cursor.fetchall()
+
+
+def _search_fallback(terms, room_ids, limit, offset):
+    messages_qs = Message.objects.filter(room_id__in=room_ids)
+    for term in terms:
+        messages_qs = messages_qs.filter(Q(content__icontains=term) | Q(file_name__icontains=term))
+    rows = messages_qs.order_by('-timestamp', '-id').values_list('id', flat=True)[offset:offset + limit]
+    return [(message_id, 0.0) for message_id in rows]
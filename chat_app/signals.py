@@ -0,0 +1,35 @@
+from django.db import transaction
+from django.db.models.signals import post_save, m2m_changed
+from django.dispatch import receiver
+from .consumers import broadcast_messages
+from .models import ChatRoom, Message, ReadCursor
+
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created, **kwargs):
+    """
+    Update the room's last message and unread counters, then push the new
+    message to the room's open WebSockets once the row is committed.
+    """
+    if created:
+        instance.room.record_new_messages(instance.sender, [instance])
+        transaction.on_commit(lambda: broadcast_messages(instance.room_id, [instance]))
+
+@receiver(m2m_changed, sender=ChatRoom.members.through)
+def sync_read_cursors(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep one ReadCursor per (room, member) when members are added or removed."""
+    if action == 'post_add' and pk_set:
+        if reverse:  # user.chat_rooms.add(room)
+            cursors = [ReadCursor(room_id=room_id, user=instance) for room_id in pk_set]
+        else:        # room.members.add(user)
+            cursors = [ReadCursor(room=instance, user_id=user_id) for user_id in pk_set]
+        ReadCursor.objects.bulk_create(cursors, ignore_conflicts=True)
+    elif action == 'post_remove' and pk_set:
+        if reverse:
+            ReadCursor.objects.filter(user=instance, room_id__in=pk_set).delete()
+        else:
+            ReadCursor.objects.filter(room=instance, user_id__in=pk_set).delete()
+    elif action == 'pre_clear':
+        if reverse:
+            ReadCursor.objects.filter(user=instance).delete()
+        else:
+            ReadCursor.objects.filter(room=instance).delete()
@@ -1,3 +1,308 @@
-from django.test import TestCase
+import datetime
+import json
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from admin_app.models import User
+from admin_app.tests import MEDIA_ROOT, QueryCountTestCase, SchoolFixtures
+from .models import ChatRoom, Message, ReadCursor
+from .routing import websocket_urlpatterns
+from .search import search_messages
+
+
+class ChatFixtures(SchoolFixtures):
+    """SchoolFixtures plus chat rooms: every grow(n) adds n group rooms and n private rooms of the main student."""
+
+    def __init__(self):
+        super().__init__()
+        self.room = ChatRoom.objects.create(name='Main Room', type='group', created_by=self.admin, is_male_only=True)
+        self.room.members.add(self.student.user, self.admin)
+        self.rooms = 0
+
+    def grow(self, count):
+        super().grow(count)
+        for _ in range(count):
+            self.rooms += 1
+            member = self.user(User.Roles.STUDENT)
+            self.room.members.add(member)
+            Message.objects.create(room=self.room, sender=member, content=f"Notes about chapter {self.rooms}")
+
+            group = ChatRoom.objects.create(name=f"Study Group {self.rooms}", type='group', created_by=self.admin, is_male_only=True)
+            group.members.add(self.student.user, member)
+            private = ChatRoom.objects.create(name=f"private_{self.student.user.id}_{member.id}", type='private')
+            private.members.add(self.student.user, member)
+            for room in (group, private):
+                Message.objects.create(room=room, sender=member, content=f"Notes about chapter {self.rooms}")
+
+
+class ChatViewQueryCountTests(QueryCountTestCase):
+    fixtures_class = ChatFixtures
+
+    def test_chat_list(self):
+        self.assertConstantQueries(self.data.student.user, reverse('chat_list'))
+
+    def test_chat_room(self):
+        self.assertConstantQueries(self.data.student.user, reverse('chat_room', kwargs={'room_name': self.data.room.name}))
+
+    def test_message_history(self):
+        self.assertConstantQueries(self.data.student.user, reverse('message_history', kwargs={'room_id': self.data.room.id}))
+
+    def test_message_search(self):
+        self.assertConstantQueries(self.data.student.user, reverse('message_search') + '?q=notes')
+
+    def test_get_group_members(self):
+        self.assertConstantQueries(self.data.student.user, reverse('get_group_members') + f'?room_name={self.data.room.name}')
+
+    def test_manage_group(self):
+        self.assertConstantQueries(self.data.admin, reverse('manage_group', kwargs={'group_id': self.data.room.id}))
+
+    def test_chatroom_changelist(self):
+        self.assertConstantQueries(self.data.admin, reverse('admin:chat_app_chatroom_changelist'))
+
+
+class ChatSocketTests(TestCase):
+    def setUp(self):
+        self.data = ChatFixtures()
+
+    def socket(self, user, room=None):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/chat/{(room or self.data.room).id}/")
+        communicator.scope['user'] = user
+        return communicator
+
+    def send(self, room, content):
+        # البث يحدث بعد الالتزام، فننفذ استدعاءات on_commit هنا
+        with self.captureOnCommitCallbacks(execute=True):
+            return Message.objects.create(room=room, sender=self.data.admin, content=content)
+
+    async def test_members_receive_messages_of_their_room(self):
+        other_room = await sync_to_async(ChatRoom.objects.create)(name='Other Room', type='group', created_by=self.data.admin)
+        await sync_to_async(other_room.members.add)(self.data.admin)
+        socket = self.socket(self.data.student.user)
+        connected, _ = await socket.connect()
+        self.assertTrue(connected)
+
+        await sync_to_async(self.send)(other_room, 'not for you')
+        message = await sync_to_async(self.send)(self.data.room, 'hello')
+        event = await socket.receive_json_from()
+        self.assertEqual(event['type'], 'message')
+        self.assertEqual((event['message']['id'], event['message']['content']), (message.id, 'hello'))
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+
+    async def test_socket_is_read_only(self):
+        socket = self.socket(self.data.student.user)
+        await socket.connect()
+        await socket.send_json_to({'content': 'hello'})
+        self.assertEqual(await socket.receive_json_from(), {'error': 'This socket is read-only.'})
+        self.assertFalse(await sync_to_async(Message.objects.exists)())
+        await socket.disconnect()
+
+    async def test_strangers_and_anonymous_users_are_rejected(self):
+        stranger = await sync_to_async(self.data.user)(User.Roles.STUDENT)
+        for user, code in ((stranger, 4403), (AnonymousUser(), 4401)):
+            self.assertEqual(await self.socket(user).connect(), (False, code))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class SendMessageTests(TestCase):
+    def setUp(self):
+        self.data = ChatFixtures()
+        self.client.force_login(self.data.student.user)
+
+    def send(self, **fields):
+        return self.client.post(reverse('send_message'), dict(room_name=self.data.room.name, **fields))
+
+    def upload(self, name='notes.pdf', content=b'%PDF-1.4 notes'):
+        file = SimpleUploadedFile(name, content, content_type='application/pdf')
+        return self.client.post(reverse('upload_file_in_chat'), {'file': file}).json()['url']
+
+    def test_file_url_must_come_from_upload(self):
+        never_uploaded = '/media/blobs/ab/cd/' + 'ab' * 32 + '.pdf'
+        for url in ('javascript:alert(1)', 'https://evil.example' + self.upload(), '/media/user_images/me.png', never_uploaded):
+            self.assertEqual(self.send(file_url=url).status_code, 400, url)
+        self.assertFalse(Message.objects.exists())
+
+    def test_uploaded_file(self):
+        url = self.upload()
+        response = self.send(file_url=url, file_name='notes.pdf', file_size=14)
+        message = Message.objects.get(id=response.json()['message_id'])
+        self.assertEqual(message.content_type, Message.ContentTypes.FILE)
+        self.assertEqual(message.content, url.removeprefix('http://testserver'))
+        self.assertEqual((message.file_name, message.file_size), ('notes.pdf', 14))
+
+    def test_first_message_creates_private_room_once(self):
+        me, other = self.data.student.user, self.data.user(User.Roles.STUDENT)
+        name = f"private_{me.id}_{other.id}"
+        for text in ('hello', 'again'):
+            self.assertEqual(self.client.post(reverse('send_message'), {'room_name': name, 'content': text}).status_code, 200)
+        room = ChatRoom.objects.get(name=name)
+        self.assertEqual(set(room.members.all()), {me, other})
+        self.assertEqual(room.messages.count(), 2)
+        stranger = self.data.user(User.Roles.STUDENT)
+        self.client.force_login(stranger)
+        self.assertEqual(self.client.post(reverse('send_message'), {'room_name': name, 'content': 'hi'}).status_code, 404)
+
+
+
+class MessageHistoryTests(TestCase):
+    def setUp(self):
+        self.data = ChatFixtures()
+        self.client.force_login(self.data.student.user)
+        self.messages = [Message.objects.create(room=self.data.room, sender=self.data.admin, content=f"Message {number}") for number in range(7)]
+        # رسائل بنفس الوقت تُرتب بالمعرف
+        Message.objects.filter(pk__in=[message.pk for message in self.messages[2:5]]).update(timestamp=datetime.datetime(2025, 1, 1, 12))
+
+    def page(self, **params):
+        response = self.client.get(reverse('message_history', kwargs={'room_id': self.data.room.id}), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_walk_back_through_the_whole_room(self):
+        expected = list(Message.objects.filter(room=self.data.room).order_by('timestamp', 'id').values_list('id', flat=True))
+        pages, params = [], {'limit': 3}
+        while True:
+            page = self.page(**params)
+            pages.insert(0, [message['id'] for message in page['messages']])
+            if not page['has_more']:
+                break
+            params['before'] = page['next_cursor']
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual([len(page) for page in pages], [1, 3, 3])
+
+    def test_bad_cursor_and_strangers(self):
+        url = reverse('message_history', kwargs={'room_id': self.data.room.id})
+        self.assertEqual(self.client.get(url, {'before': 'not-a-cursor'}).status_code, 400)
+        self.client.force_login(self.data.user(User.Roles.STUDENT))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class SendMessagesTests(TestCase):
+    def setUp(self):
+        self.data = ChatFixtures()
+        self.client.force_login(self.data.student.user)
+
+    def post(self, messages):
+        return self.client.post(
+            reverse('send_messages'), json.dumps({'room_name': self.data.room.name, 'messages': messages}),
+            content_type='application/json',
+        )
+
+    def test_batch_is_written_in_order(self):
+        response = self.post([{'content': 'first'}, {'content': 'second'}, {'content': 'third'}])
+        self.assertEqual(response.status_code, 200)
+        ids = response.json()['message_ids']
+        self.assertEqual(list(Message.objects.filter(pk__in=ids).order_by('id').values_list('content', flat=True)), ['first', 'second', 'third'])
+        self.data.room.refresh_from_db()
+        self.assertEqual(self.data.room.last_message_preview, 'third')
+        self.assertEqual(ReadCursor.objects.get(room=self.data.room, user=self.data.admin).unread_count, 3)
+
+    def test_one_bad_message_rejects_the_batch(self):
+        response = self.post([{'content': 'fine'}, {'file_url': 'javascript:alert(1)'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Message 1', response.json()['error'])
+        self.assertFalse(Message.objects.exists())
+
+
+class ReadCursorTests(TestCase):
+    def setUp(self):
+        self.data = ChatFixtures()
+        self.room = self.data.room
+
+    def unread(self, user):
+        return ReadCursor.objects.get(room=self.room, user=user).unread_count
+
+    def test_unread_counts(self):
+        student, admin = self.data.student.user, self.data.admin
+        for text in ('one', 'two'):
+            Message.objects.create(room=self.room, sender=admin, content=text)
+        self.assertEqual((self.unread(student), self.unread(admin)), (2, 0))
+
+        self.client.force_login(student)
+        self.assertEqual(self.client.post(reverse('mark_room_read', kwargs={'room_id': self.room.id})).status_code, 200)
+        self.assertEqual(self.unread(student), 0)
+        Message.objects.create(room=self.room, sender=admin, content='three')
+        self.assertEqual(self.unread(student), 1)
+
+        other = ChatRoom.objects.create(name='Other Room', type='group', created_by=admin, is_male_only=True)
+        other.members.add(student, admin)
+        Message.objects.create(room=other, sender=admin, content='elsewhere')
+        # فتح الغرفة يصفّر عدادها، والقائمة الجانبية تعرض عدادات الغرف الأخرى
+        response = self.client.get(reverse('chat_room', kwargs={'room_name': self.room.name}))
+        rooms = {room.name: room.unread_count for room in response.context['user_rooms']}
+        self.assertEqual(rooms, {self.room.name: 0, other.name: 1})
+
+    def test_cursors_follow_membership(self):
+        member = self.data.user(User.Roles.STUDENT)
+        self.room.members.add(member)
+        self.assertTrue(ReadCursor.objects.filter(room=self.room, user=member).exists())
+        self.room.members.remove(member)
+        self.assertFalse(ReadCursor.objects.filter(room=self.room, user=member).exists())
+        member.chat_rooms.add(self.room)
+        self.assertTrue(ReadCursor.objects.filter(room=self.room, user=member).exists())
+        self.room.members.clear()
+        self.assertFalse(ReadCursor.objects.filter(room=self.room).exists())
+
+
+class AddMembersTests(TestCase):
+    def test_report(self):
+        data = ChatFixtures()
+        room = data.room  # للذكور فقط
+        new, female = data.user(User.Roles.STUDENT), data.user(User.Roles.STUDENT)
+        User.objects.filter(pk=female.pk).update(gender='F')
+        report = room.add_members([new.id, str(new.id), female.id, data.student.user.id, 999999, 'abc', ''])
+        self.assertEqual(report['added'], [new])
+        self.assertEqual(report['gender_mismatch'], [female])
+        self.assertEqual(report['already_member'], [data.student.user])
+        self.assertEqual(report['not_found'], ['abc', 999999])
+        self.assertTrue(room.is_member(new))
+        self.assertFalse(room.is_member(female))
+        self.assertTrue(ReadCursor.objects.filter(room=room, user=new).exists())
+
+    def test_candidates_limit_who_is_added(self):
+        data = ChatFixtures()
+        instructor = data.instructor.user
+        report = data.room.add_members([instructor.id], candidates=User.objects.filter(role=User.Roles.STUDENT))
+        self.assertEqual((report['added'], report['not_found']), ([], [instructor.id]))
+
+
+class MessageSearchTests(TestCase):
+    def setUp(self):
+        self.data = ChatFixtures()
+        self.user = self.data.student.user
+        self.other = ChatRoom.objects.create(name='Other Room', type='group', created_by=self.data.admin, is_male_only=True)
+        self.other.members.add(self.user, self.data.admin)
+        self.hidden = ChatRoom.objects.create(name='Hidden Room', type='group', created_by=self.data.admin, is_male_only=True)
+        self.hidden.members.add(self.data.admin)
+
+    def send(self, room, text):
+        return Message.objects.create(room=room, sender=self.data.admin, content=text)
+
+    def found(self, query, room_id=None):
+        results, has_more = search_messages(self.user, query, room_id=room_id)
+        return [message.content for message, rank in results]
+
+    def test_only_rooms_of_the_user(self):
+        self.send(self.data.room, 'The final exam is on Monday')
+        self.send(self.other, 'Exam rooms are posted')
+        self.send(self.hidden, 'Exam answers')
+        self.send(self.data.room, 'Lunch at noon')
+        self.assertEqual(sorted(self.found('exam')), ['Exam rooms are posted', 'The final exam is on Monday'])
+        self.assertEqual(self.found('exam', room_id=self.other.id), ['Exam rooms are posted'])
+        self.assertEqual(self.found('exam', room_id=self.hidden.id), [])
+        self.assertEqual(self.found('exam monday'), ['The final exam is on Monday'])
+        self.assertEqual(self.found('on monday'), ['The final exam is on Monday'])
+
+    def test_view_highlights_matches(self):
+        self.send(self.data.room, 'Bring <b>notes</b> to the exam')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('message_search'), {'q': 'exam'})
+        result, = response.json()['results']
+        self.assertEqual(result['room_name'], self.data.room.name)
+        self.assertIn('<mark>exam</mark>', result['highlight'])
+        self.assertIn('&lt;b&gt;notes&lt;/b&gt;', result['highlight'])
+        self.assertEqual(self.client.get(reverse('message_search')).status_code, 400)
@@ -1,7 +1,7 @@
 import django.contrib
 from django.urls import path
 from .views import ( chat_list, create_group, get_group_members, manage_group, upload_file, start_private_chat, chat_room,  
-                    get_group_members, create_group, )
+                    get_group_members, create_group, message_history, send_message, send_messages, mark_room_read, message_search, )
 
 from admin_app.views import (custom_400, custom_403, custom_404, custom_405, custom_500)
 
@@ -12,6 +12,11 @@ urlpatterns = [
     path('get_group_members/', get_group_members, name='get_group_members'),
     path('manage_group/<int:group_id>/', manage_group, name='manage_group'),
     path('create_group/', create_group, name='create_group'),
+    path('rooms/<int:room_id>/messages/', message_history, name='message_history'),
+    path('rooms/<int:room_id>/read/', mark_room_read, name='mark_room_read'),
+    path('search/', message_search, name='message_search'),
+    path('send_message/', send_message, name='send_message'),
+    path('send_messages/', send_messages, name='send_messages'),
     path('<str:room_name>/', chat_room, name='chat_room'),
     
     path('400/', custom_400, name='400'),
@@ -1,17 +1,24 @@
+import base64
+import binascii
 import json
 import random
 import string
+from datetime import datetime
 from django.core.exceptions import ValidationError
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import  Http404, HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
-from django.conf import settings
+from django.db import IntegrityError, transaction
 import os
-from admin_app.models import User, Department
+import re
+from urllib.parse import unquote, urlsplit
+from admin_app.models import Blob, User, Department
+from admin_app.storage import blob_digest, blob_storage
 # from admin_app.views import 404
-from .models import ChatRoom, Message
-from django.db.models import Q
+from .models import ChatRoom, Message, ReadCursor
+from .search import highlight, search_messages, search_terms
+from django.db.models import F, OuterRef, Q, Subquery
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods
 import logging
@@ -23,13 +30,24 @@ logger = logging.getLogger(__name__)
 def chat_list(request):
     user = request.user
 
-    # Filter chat rooms into private and group chats
-    private_chats = user.chat_rooms.filter(type='private')
-    group_chats = user.chat_rooms.filter(type='group')
+    # غرف المستخدم مع عدد الرسائل غير المقروءة وآخر رسالة، بعدد ثابت من الاستعلامات
+    read_cursors = ReadCursor.objects.filter(user=user).select_related('room').prefetch_related(
+        'room__members'
+    ).order_by(F('room__last_message_at').desc(nulls_last=True), '-room__creation_time')
+
+    rooms = []
+    for cursor in read_cursors:
+        cursor.room.unread_count = cursor.unread_count
+        rooms.append(cursor.room)
+
+    # Split chat rooms into private and group chats
+    private_chats = [room for room in rooms if room.type == 'private']
+    group_chats = [room for room in rooms if room.type == 'group']
     all_users = User.objects.exclude(id=request.user.id)
 
     # Pass both private and group chats to the template
     return render(request, 'chat_app/chat_list.html', {
+        'rooms': rooms,
         'private_chats': private_chats,
         'group_chats': group_chats,
         'all_users': all_users,
@@ -40,33 +58,152 @@ def chat_list(request):
 def chat_room(request, room_name):
     """
     Render the chat room interface.
-    If the room doesn't exist, it will be created when the first message is sent.
+    Messages are not rendered here: the page loads them page by page from
+    `message_history` and receives new ones over the room's WebSocket.
     """
-    # Fetch the chat room if it exists
-    room = ChatRoom.objects.filter(name=room_name).first()
+    # القالب يمر على room.members.all داخل حلقة المستخدمين، لذلك نجلب الأعضاء مرة واحدة
+    room = get_object_or_404(ChatRoom.objects.prefetch_related('members'), name=room_name)
+
+    if not room.is_member(request.user):
+        # إذا لم يكن المستخدم عضواً، نرفع Http404 لكي لا يتمكن من الوصول
+        raise Http404
 
-    # Fetch all messages in the room, ordered by timestamp
-    messages = room.messages.all().order_by('timestamp') if room else []
+    room.mark_read(request.user)
 
     # Fetch all users except the current user for the user list
     all_users = User.objects.exclude(id=request.user.id)
-    
-    group = get_object_or_404(ChatRoom, name=room_name)
-    
-    if request.user not in group.members.all():
-        # إذا لم يكن المستخدم عضواً، نرفع Http404 لكي لا يتمكن من الوصول
-        raise Http404
 
-    # Pass the room, messages, and all_users to the template
     context = {
         'room': room,
-        'messages': messages,
+        'user_rooms': request.user.chat_rooms.prefetch_related('members').annotate(
+            unread_count=Subquery(ReadCursor.objects.filter(room=OuterRef('pk'), user=request.user).values('unread_count')[:1])
+        ),
         'all_users': all_users,
-        'group': group,
+        'group': room,
         'room_name': room_name,  # Pass the room name to the template
     }
     return render(request, 'chat_app/chat_room.html', context)
 
+
+@login_required
+@require_http_methods(["POST"])
+def mark_room_read(request, room_id):
+    """Reset the current user's unread counter, called while the room is open."""
+    room = get_object_or_404(ChatRoom, id=room_id)
+    if not room.is_member(request.user):
+        raise Http404
+    room.mark_read(request.user)
+    return JsonResponse({'status': 'success'})
+
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+
+def encode_history_cursor(message):
+    """Opaque keyset cursor pointing at a message: base64("<timestamp>|<id>")."""
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_history_cursor(cursor):
+    """Return (timestamp, id) from a cursor, raise ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, message_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError("Invalid cursor.")
+
+
+@login_required
+@require_http_methods(["GET"])
+def message_history(request, room_id):
+    """
+    Return one page of a room's messages as JSON, newest page first.
+
+    Pages are keyed on (timestamp, id) so each page is a single index range
+    scan on Message(room, timestamp, id), no matter how old the page is.
+    Pass the returned `next_cursor` as `?before=` to fetch older messages.
+    """
+    room = get_object_or_404(ChatRoom, id=room_id)
+    if not room.is_member(request.user):
+        raise Http404
+
+    try:
+        limit = min(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        limit = HISTORY_PAGE_SIZE
+    if limit < 1:
+        limit = HISTORY_PAGE_SIZE
+
+    messages_qs = Message.objects.filter(room=room).select_related('sender')
+
+    before = request.GET.get('before')
+    if before:
+        try:
+            before_timestamp, before_id = decode_history_cursor(before)
+        except ValueError:
+            logger.error("message_history: invalid cursor '%s' from user '%s'.", before, request.user.username)
+            return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+        messages_qs = messages_qs.filter(
+            Q(timestamp__lt=before_timestamp) |
+            Q(timestamp=before_timestamp, id__lt=before_id)
+        )
+
+    # نجلب عنصراً إضافياً لمعرفة ما إذا كانت هناك صفحة أقدم
+    page = list(messages_qs.order_by('-timestamp', '-id')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    return JsonResponse({
+        'messages': [message.as_dict() for message in reversed(page)],  # الأقدم أولاً للعرض
+        'has_more': has_more,
+        'next_cursor': encode_history_cursor(page[-1]) if has_more else None,
+    })
+
+SEARCH_PAGE_SIZE = 20
+
+
+@login_required
+@require_http_methods(["GET"])
+def message_search(request):
+    """
+    Search messages in the rooms the user belongs to: ?q=...&room=<id>&page=<n>.
+    Results are ranked best match first; `highlight` is an escaped snippet
+    with the matched words wrapped in <mark>.
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'Search query is required.'}, status=400)
+
+    try:
+        room_id = int(request.GET['room']) if request.GET.get('room') else None
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid room or page.'}, status=400)
+
+    results, has_more = search_messages(
+        request.user, query, room_id=room_id,
+        limit=SEARCH_PAGE_SIZE, offset=(page - 1) * SEARCH_PAGE_SIZE,
+    )
+    terms = search_terms(query)
+    logger.info("Message search by user '%s': %d results on page %d.", request.user.username, len(results), page)
+
+    return JsonResponse({
+        'results': [
+            dict(
+                message.as_dict(),
+                room_name=message.room.name,
+                highlight=highlight(message.file_name if message.content_type == Message.ContentTypes.FILE else message.content, terms),
+                rank=float(rank),
+            )
+            for message, rank in results
+        ],
+        'page': page,
+        'has_more': has_more,
+    })
+
 @login_required
 def start_private_chat(request, user_id):
     # جلب المستخدم الهدف
@@ -118,69 +255,177 @@ def upload_file(request):
             logger.error("File upload error: file size exceeds limit for file '%s'.", uploaded_file.name)
             return JsonResponse({'error': 'File size exceeds limit'}, status=400)
 
-        # Save the file to the uploads directory
-        upload_dir = os.path.join(settings.MEDIA_ROOT, 'uploads')
-        os.makedirs(upload_dir, exist_ok=True)
-        file_path = os.path.join(upload_dir, uploaded_file.name)
-        with open(file_path, 'wb+') as destination:
-            for chunk in uploaded_file.chunks():
-                destination.write(chunk)
+        # Save the file by its content: same-named uploads no longer overwrite each other
+        # (الرابط محفوظ في نص الرسالة، لذلك يبقى مرجعه دون حذف)
+        name = blob_storage.save(uploaded_file.name, uploaded_file)
 
         # Generate the file URL
-        file_url = request.build_absolute_uri(settings.MEDIA_URL + 'uploads/' + uploaded_file.name)
+        file_url = request.build_absolute_uri(blob_storage.url(name))
         logger.info("File '%s' uploaded successfully by user '%s'.", uploaded_file.name, request.user.username)
         return JsonResponse({'url': file_url})
 
     logger.error("Invalid file upload request by user '%s'.", request.user.username)
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
+MAX_MESSAGES_PER_BATCH = 500
+
+
+def get_room_for_sender(user, room_name):
+    """
+    Return the room `user` may post to, resolving the room and the membership
+    in one query. A private room named `private_<id>_<id>` that does not exist
+    yet is created for its two users. Returns None if the user cannot post.
+    """
+    if not room_name:
+        return None
+    room = ChatRoom.objects.filter(name=room_name, members=user).first()
+    if room:
+        return room
+
+    match = re.fullmatch(r'private_(\d+)_(\d+)', room_name)
+    if not match or str(user.id) not in match.groups():
+        return None
+    if ChatRoom.objects.filter(name=room_name).exists():
+        return None  # الغرفة موجودة لكن المستخدم ليس عضواً فيها
+
+    member_ids = {int(user_id) for user_id in match.groups()}
+    members = list(User.objects.filter(id__in=member_ids))
+    if len(members) != len(member_ids):
+        return None
+
+    try:
+        with transaction.atomic():
+            room, created = ChatRoom.objects.get_or_create(name=room_name, defaults={'type': 'private'})
+            if created:
+                room.members.add(*members)
+    except IntegrityError:
+        # أول رسالتين في نفس اللحظة: الطلب الآخر أنشأ الغرفة
+        return ChatRoom.objects.filter(name=room_name, members=user).first()
+    if not created:
+        return room if room.is_member(user) else None
+    logger.info("Chat room '%s' created during send_message.", room_name)
+    return room
+
+
+def uploaded_blob_name(request, file_url):
+    """
+    The blob behind a URL returned by `upload_file`, or None for any other URL
+    (another site, a javascript: link, a file that was never uploaded).
+    """
+    parts = urlsplit(file_url)
+    if parts.scheme not in ('', 'http', 'https') or (parts.netloc and parts.netloc != request.get_host()):
+        return None
+    prefix = urlsplit(blob_storage.base_url).path
+    path = unquote(parts.path)
+    if not path.startswith(prefix):
+        return None
+    name = path[len(prefix):]
+    if not blob_digest(name) or not Blob.objects.filter(name=name).exists():
+        return None
+    return name
+
+
+def clean_message_data(request, data):
+    """
+    Validate one submitted message (form fields or one JSON object) and
+    return the values accepted by `ChatRoom.send_messages`.
+    """
+    content = (data.get('content') or '').strip()
+    file_url = (data.get('file_url') or '').strip()
+
+    if file_url:
+        name = uploaded_blob_name(request, file_url)
+        if name is None:
+            raise ValidationError("file_url must be a URL returned by the chat upload endpoint.")
+        try:
+            file_size = int(data['file_size']) if data.get('file_size') not in (None, '') else None
+        except (TypeError, ValueError):
+            raise ValidationError("file_size must be a whole number of bytes.")
+        if file_size is not None and file_size < 0:
+            raise ValidationError("file_size must be a whole number of bytes.")
+        return {
+            'content': blob_storage.url(name),  # الرابط يبنيه الخادم، لا يُخزن ما أرسله العميل
+            'content_type': Message.ContentTypes.FILE,
+            'file_name': (data.get('file_name') or os.path.basename(name))[:255],
+            'file_size': file_size,
+        }
+
+    if not content:
+        raise ValidationError("Message content cannot be empty.")
+    return {'content': content, 'content_type': Message.ContentTypes.TEXT}
+
+
 @login_required
+@require_http_methods(["POST"])
 def send_message(request):
     """
-    Handle sending a message and create the chat room if it doesn't exist.
+    Send one message (form POST with room_name, content and optional
+    file_url, file_name, file_size).
     """
-    if request.method == 'POST':
-        room_name = request.POST.get('room_name')
-        content = request.POST.get('content')
-        file_url = request.POST.get('file_url', None)
-        file_name = request.POST.get('file_name', None)
-        file_size = request.POST.get('file_size', None)
-
-        # Get or create the chat room
-        room, created = ChatRoom.objects.get_or_create(
-            name=room_name,
-            defaults={'type': 'private'}
-        )
+    room_name = request.POST.get('room_name')
+    room = get_room_for_sender(request.user, room_name)
+    if room is None:
+        logger.error("send_message: user '%s' cannot post to room '%s'.", request.user.username, room_name)
+        return JsonResponse({'error': 'Chat room not found.'}, status=404)
+
+    try:
+        message_data = clean_message_data(request, request.POST)
+    except ValidationError as e:
+        logger.error("send_message: invalid message from user '%s': %s", request.user.username, e)
+        return JsonResponse({'error': e.messages[0]}, status=400)
+
+    message, = room.send_messages(request.user, [message_data])
+    logger.info("Message (ID: %s) sent by user '%s' in room '%s'.", message.id, request.user.username, room_name)
+
+    return JsonResponse({
+        'status': 'success',
+        'message': 'Message sent successfully',
+        'message_id': message.id,
+    })
 
-        # Add the current user and the other user to the chat room
-        if created:
-            user_ids = room_name.replace('private_', '').split('_')
-            user1 = User.objects.get(id=int(user_ids[0]))
-            user2 = User.objects.get(id=int(user_ids[1]))
-            room.members.add(user1, user2)
-            logger.info("Chat room '%s' created during send_message.", room_name)
-
-
-        # Create the message
-        message = Message.objects.create(
-            room=room,
-            sender=request.user,
-            content=content,
-            content_type='file' if file_url else 'text',
-            file_name=file_name,
-            file_size=file_size,
-        )
-        logger.info("Message (ID: %s) sent by user '%s' in room '%s'.", message.id, request.user.username, room_name)
-        
-        # Return a success response
-        return JsonResponse({
-            'status': 'success',
-            'message': 'Message sent successfully',
-            'message_id': message.id,
-        })
 
-    logger.error("Invalid send_message request by user '%s'.", request.user.username)
-    return JsonResponse({'error': 'Invalid request'}, status=400)
+@login_required
+@require_http_methods(["POST"])
+def send_messages(request):
+    """
+    Send a batch of messages to one room, e.g. messages queued by a client
+    while it was offline. JSON body: {"room_name": "...", "messages": [{...}, ...]}
+    where every item has the same fields as `send_message`.
+    The whole batch is validated first and then written in one transaction.
+    """
+    try:
+        payload = json.loads(request.body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+
+    items = payload.get('messages')
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'error': 'messages must be a non-empty list.'}, status=400)
+    if len(items) > MAX_MESSAGES_PER_BATCH:
+        return JsonResponse({'error': f'A batch can contain at most {MAX_MESSAGES_PER_BATCH} messages.'}, status=400)
+
+    room_name = payload.get('room_name')
+    room = get_room_for_sender(request.user, room_name)
+    if room is None:
+        logger.error("send_messages: user '%s' cannot post to room '%s'.", request.user.username, room_name)
+        return JsonResponse({'error': 'Chat room not found.'}, status=404)
+
+    messages_data = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            return JsonResponse({'error': f'Message {index} must be an object.'}, status=400)
+        try:
+            messages_data.append(clean_message_data(request, item))
+        except ValidationError as e:
+            return JsonResponse({'error': f'Message {index}: {e.messages[0]}'}, status=400)
+
+    created = room.send_messages(request.user, messages_data)
+    return JsonResponse({
+        'status': 'success',
+        'message_ids': [message.id for message in created],
+    })
 
 
 
@@ -271,38 +516,25 @@ def manage_group(request, group_id):
                 logger.error("Add member failed: no student_ids provided by user '%s'.", request.user.username)
 
             else:
-                added_count = 0
-                for student_id in student_ids:
-                    try:
-                        student = User.objects.get(
-                            id=student_id,
-                            role='STUDENT',
-                            is_active=True
-                        )
-                        
-                        # التحقق من التوافق الجنسي
-                        if (group.is_male_only and student.gender != 'M') or \
-                            (group.is_female_only and student.gender != 'F'):
-                            messages.warning(request, f' Cann\'t add this {student.first_name} {student.last_name} student')
-                            logger.warning("Add member: Gender mismatch for student '%s' in group '%s'.", student.username, group.name)
-                            continue
-                            
-                        # التحقق من عدم وجود العضو مسبقًا
-                        if group.members.filter(id=student.id).exists():
-                            messages.warning(request, f'Student {student.first_name} {student.last_name} alredy exist')
-                            logger.warning("Add member: Student '%s' already exists in group '%s'.", student.username, group.name)
-                            continue
-                            
-                        group.members.add(student)
-                        added_count += 1
-                        logger.info("Student '%s' added to group '%s' by user '%s'.", student.username, group.name, request.user.username)
-
-                    except User.DoesNotExist:
-                        messages.error(request, 'This data is not true')
-                        logger.error("Add member failed: Student with id '%s' does not exist.", student_id)
-
+                # تحميل الطلاب والتحقق من الجنس والعضوية دفعة واحدة بدلاً من استعلامين لكل طالب
+                report = group.add_members(
+                    student_ids,
+                    candidates=User.objects.filter(role='STUDENT', is_active=True),
+                )
+                for student in report['gender_mismatch']:
+                    messages.warning(request, f' Cann\'t add this {student.first_name} {student.last_name} student')
+                    logger.warning("Add member: Gender mismatch for student '%s' in group '%s'.", student.username, group.name)
+                for student in report['already_member']:
+                    messages.warning(request, f'Student {student.first_name} {student.last_name} alredy exist')
+                    logger.warning("Add member: Student '%s' already exists in group '%s'.", student.username, group.name)
+                if report['not_found']:
+                    messages.error(request, 'This data is not true')
+                    logger.error("Add member failed: Students with ids %s do not exist.", report['not_found'])
+
+                added_count = len(report['added'])
                 if added_count > 0:
                     messages.success(request, f'Added successfully  {added_count} members ')
+                    logger.info("%d students added to group '%s' by user '%s'.", added_count, group.name, request.user.username)
             
         elif action == 'remove_member':
             student_id = request.POST.get('student_id')
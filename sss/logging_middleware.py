@@ -1,16 +1,23 @@
 import logging
 
+from .logstore import request_context
+
 class AppLoggingMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        # سيتم استدعاء process_view لاحقًا، في حالة وجوده
-        response = self.get_response(request)
-        # بعد معالجة الطلب، يمكن تسجيل معلومات الاستجابة
-        # هنا نستخدم logger الافتراضي إذا لم نتمكن من تحديد التطبيق
-        default_logger = logging.getLogger('default')
-        default_logger.info("Response sent: status=%s", response.status_code)
+        # سياق الطلب الذي يقرؤه RequestContextFilter، ويُكمل المستخدم في process_view
+        token = request_context.set({'user': None, 'path': request.path})
+        try:
+            # سيتم استدعاء process_view لاحقًا، في حالة وجوده
+            response = self.get_response(request)
+            # بعد معالجة الطلب، يمكن تسجيل معلومات الاستجابة
+            # هنا نستخدم logger الافتراضي إذا لم نتمكن من تحديد التطبيق
+            default_logger = logging.getLogger('default')
+            default_logger.info("Response sent: status=%s", response.status_code)
+        finally:
+            request_context.reset(token)
         return response
 
     def process_view(self, request, view_func, view_args, view_kwargs):
@@ -25,6 +32,9 @@ class AppLoggingMiddleware:
             logger = logging.getLogger('default')
 
         user_info = request.user.username if hasattr(request, 'user') and request.user.is_authenticated else "Anonymous"
+        context = request_context.get()
+        if context is not None:
+            context['user'] = user_info
 
         # تسجيل تفاصيل الطلب مع معلومات المستخدم
         logger.info("Request received: method=%s, path=%s, user=%s", request.method, request.get_full_path(), user_info)
@@ -0,0 +1,85 @@
+"""
+Non-blocking logging: request threads only put records on a queue.
+
+configure_logging() is Django's LOGGING_CONFIG. It applies settings.LOGGING
+with dictConfig as usual, then takes the handlers off every logger listed
+there, gives each logger a RoutedQueueHandler instead, and starts one
+RoutingQueueListener thread that owns all the file and store handlers and
+passes each record to the handlers of the logger it came from. The user
+and path of the request are copied onto the record before it is queued,
+since the writer thread cannot see the request's contextvars.
+
+Every process (each Daphne worker, run_jobs, run_previews) has its own
+listener. The processes share the log files through WatchedFileHandler,
+and the files are rotated outside Python (see settings.LOGGING).
+"""
+import atexit
+import logging
+import logging.config
+import logging.handlers
+import queue
+
+from .logstore import RequestContextFilter
+
+_listener = None
+
+
+class RoutedQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records, tagged with the logger whose handlers should write them."""
+
+    def __init__(self, queue, route):
+        super().__init__(queue)
+        self.route = route
+        # سياق الطلب محفوظ في contextvar لا يصل إلى خيط الكتابة، لذلك يُنسخ إلى السجل هنا
+        self.addFilter(RequestContextFilter())
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.route = self.route
+        return record
+
+
+class RoutingQueueListener(logging.handlers.QueueListener):
+    """A QueueListener that sends each record only to the handlers of its route."""
+
+    def __init__(self, queue, routes):
+        handlers = {handler for route_handlers in routes.values() for handler in route_handlers}
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.routes = routes
+
+    def handle(self, record):
+        record = self.prepare(record)
+        for handler in self.routes.get(getattr(record, 'route', None), ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def configure_logging(config):
+    global _listener
+    stop_listener()
+    logging.config.dictConfig(config)
+
+    records = queue.SimpleQueue()
+    routes = {}
+    for name in config.get('loggers', {}):
+        logger = logging.getLogger(name)
+        if not logger.handlers:
+            continue
+        routes[name] = list(logger.handlers)
+        for handler in routes[name]:
+            logger.removeHandler(handler)
+        logger.addHandler(RoutedQueueHandler(records, name))
+
+    _listener = RoutingQueueListener(records, routes)
+    _listener.start()
+
+
+def stop_listener():
+    """Write out whatever is still queued and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_listener)
@@ -0,0 +1,233 @@
+"""
+Structured log store behind the log viewer's query mode.
+
+Besides the text files, every record is written to a small SQLite database
+with its time, level, logger, user and request path as separate columns. The
+store keeps one database per day (records-YYYY-MM-DD.sqlite3) in
+settings.LOG_STORE_DIR: a new segment is started at midnight and segments
+older than `retention_days` are deleted, so nothing is ever renamed under a
+process that is still writing. Each segment is indexed on time, level+time
+and user+time, and queries walk the segments newest first.
+"""
+import contextvars
+import logging
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from django.utils import timezone
+
+SEGMENT_PREFIX = 'records-'
+SEGMENT_SUFFIX = '.sqlite3'
+QUERY_PAGE_SIZE = 200
+
+# {'user': ..., 'path': ...} للطلب الحالي، يضبطه AppLoggingMiddleware
+request_context = contextvars.ContextVar('log_request_context', default=None)
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS records (
+        id INTEGER PRIMARY KEY,
+        created INTEGER NOT NULL,
+        level INTEGER NOT NULL,
+        logger TEXT NOT NULL,
+        user TEXT,
+        path TEXT,
+        message TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS records_created_idx ON records (created)",
+    "CREATE INDEX IF NOT EXISTS records_level_idx ON records (level, created)",
+    "CREATE INDEX IF NOT EXISTS records_user_idx ON records (user, created)",
+]
+
+
+def segment_path(directory, day):
+    return os.path.join(directory, f"{SEGMENT_PREFIX}{day.isoformat()}{SEGMENT_SUFFIX}")
+
+
+def list_segments(directory):
+    """[(day, path)] of the segments in `directory`, newest first."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    segments = []
+    for name in names:
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+            try:
+                day = date.fromisoformat(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            except ValueError:
+                continue
+            segments.append((day, os.path.join(directory, name)))
+    return sorted(segments, reverse=True)
+
+
+def to_millis(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def local_date(moment):
+    """Day of the segment that holds `moment`: segments are named in local time."""
+    if timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    return moment.date()
+
+
+class RequestContextFilter(logging.Filter):
+    """Copy the user and path of the current request onto the record."""
+
+    def filter(self, record):
+        context = request_context.get() or {}
+        if not hasattr(record, 'user'):
+            record.user = context.get('user')
+        if not hasattr(record, 'path'):
+            record.path = context.get('path')
+        return True
+
+
+class StructuredLogHandler(logging.Handler):
+    """Append records to the segment of their day in `directory`."""
+
+    def __init__(self, directory, retention_days=30, level=logging.NOTSET):
+        super().__init__(level)
+        self.directory = directory
+        self.retention_days = retention_days
+        self.connection = None
+        self.day = None
+        os.makedirs(directory, exist_ok=True)
+
+    def open_segment(self, day):
+        if self.connection is not None:
+            self.connection.close()
+        # autocommit: كل سجل معاملة مستقلة، وWAL يسمح للعارض بالقراءة أثناء الكتابة
+        self.connection = sqlite3.connect(segment_path(self.directory, day), isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA busy_timeout=5000")
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.day = day
+        self.remove_expired_segments(day)
+
+    def remove_expired_segments(self, today):
+        oldest = today - timedelta(days=self.retention_days)
+        for day, path in list_segments(self.directory):
+            if day < oldest:
+                for suffix in ('', '-wal', '-shm'):
+                    try:
+                        os.remove(path + suffix)
+                    except FileNotFoundError:
+                        pass
+
+    def emit(self, record):
+        try:
+            day = date.fromtimestamp(record.created)
+            if day != self.day:
+                self.open_segment(day)
+            self.connection.execute(
+                "INSERT INTO records (created, level, logger, user, path, message) VALUES (?, ?, ?, ?, ?, ?)",
+                (int(record.created * 1000), record.levelno, record.name,
+                 getattr(record, 'user', None), getattr(record, 'path', None), self.format(record)),
+            )
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+                self.day = None
+        finally:
+            self.release()
+        super().close()
+
+
+def query_records(directory, level=None, logger=None, user=None, path=None, text=None,
+                  since=None, until=None, before=None, limit=QUERY_PAGE_SIZE):
+    """
+    Return (records newest first, cursor) of up to `limit` records matching
+    every given filter: minimum `level`, `logger` and its children, exact
+    `user`, `path` prefix, `text` in the message and the [since, until]
+    datetime range. `before` is the cursor returned by the previous page.
+    """
+    conditions, params = [], []
+    if level:
+        conditions.append("level >= ?")
+        params.append(level)
+    if logger:
+        conditions.append("(logger = ? OR logger LIKE ? ESCAPE '\\')")
+        params += [logger, like_escape(logger) + '.%']
+    if user:
+        conditions.append("user = ?")
+        params.append(user)
+    if path:
+        conditions.append("path LIKE ? ESCAPE '\\'")
+        params.append(like_escape(path) + '%')
+    if text:
+        conditions.append("message LIKE ? ESCAPE '\\'")
+        params.append('%' + like_escape(text) + '%')
+    if since:
+        conditions.append("created >= ?")
+        params.append(to_millis(since))
+    if until:
+        conditions.append("created <= ?")
+        params.append(to_millis(until))
+
+    cursor_day, cursor_created, cursor_id = parse_cursor(before)
+    records = []
+    for day, segment in list_segments(directory):
+        if (since and day < local_date(since)) or (until and day > local_date(until)):
+            continue
+        if cursor_day and day > cursor_day:
+            continue
+        segment_conditions, segment_params = list(conditions), list(params)
+        if cursor_day == day:
+            segment_conditions.append("(created < ? OR (created = ? AND id < ?))")
+            segment_params += [cursor_created, cursor_created, cursor_id]
+        where = f"WHERE {' AND '.join(segment_conditions)}" if segment_conditions else ''
+        connection = sqlite3.connect(f"file:{segment}?mode=ro", uri=True)
+        try:
+            rows = connection.execute(
+                f"SELECT id, created, level, logger, user, path, message FROM records {where} "
+                f"ORDER BY created DESC, id DESC LIMIT ?",
+                segment_params + [limit + 1 - len(records)],
+            ).fetchall()
+        except sqlite3.DatabaseError:
+            continue  # مقطع تالف أو لم يكتمل إنشاؤه بعد
+        finally:
+            connection.close()
+        records += [(day, row) for row in rows]
+        if len(records) > limit:
+            break
+
+    cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        day, row = records[-1]
+        cursor = f"{day.isoformat()}:{row[1]}:{row[0]}"
+    return [
+        {
+            'created': datetime.fromtimestamp(row[1] / 1000),
+            'level': logging.getLevelName(row[2]),
+            'logger': row[3],
+            'user': row[4],
+            'path': row[5],
+            'message': row[6],
+        }
+        for day, row in records
+    ], cursor
+
+
+def like_escape(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def parse_cursor(cursor):
+    try:
+        day, created, record_id = cursor.split(':')
+        return date.fromisoformat(day), int(created), int(record_id)
+    except (AttributeError, ValueError):
+        return None, None, None
@@ -0,0 +1,161 @@
+"""
+Per-request cost: wall time, DB queries and DB time, template render time
+and response size.
+
+RequestMetricsMiddleware measures every request, sends the numbers back in
+a Server-Timing header (only with DEBUG on or to staff users) and adds them
+to an in-memory sample of the last SAMPLE_SIZE requests of each view, from
+which the admin metrics page (admin_app.views.metrics_view) computes
+percentiles. The samples are per process and start empty after a restart. Streaming responses are measured
+until the response is returned, so rows streamed afterwards are not counted.
+"""
+import contextvars
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+
+SAMPLE_SIZE = 1000
+METRIC_FIELDS = ('total', 'db', 'queries', 'template', 'size')
+
+# مقاييس الطلب الحالي، يقرؤها غلاف الاستعلامات وغلاف القوالب
+current_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0  # قالب داخل قالب (render_to_string داخل قالب) لا يُحسب مرتين
+        self.view = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # غلاف connection.execute_wrapper: يحسب عدد الاستعلامات ووقتها
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+class ViewMetrics:
+    """The last SAMPLE_SIZE measurements of every view, shared by the threads of this process."""
+
+    def __init__(self, sample_size=SAMPLE_SIZE):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=sample_size))
+        self.counts = defaultdict(int)
+
+    def add(self, view, sample):
+        with self.lock:
+            self.samples[view].append(sample)
+            self.counts[view] += 1
+
+    def summary(self):
+        """[{'view', 'requests', '<field>': {'p50', 'p95', 'p99', 'max'}}] for every view seen."""
+        with self.lock:
+            samples = {view: list(rows) for view, rows in self.samples.items()}
+            counts = dict(self.counts)
+        summary = []
+        for view, rows in samples.items():
+            row = {'view': view, 'requests': counts[view], 'sampled': len(rows)}
+            for index, field in enumerate(METRIC_FIELDS):
+                values = sorted(sample[index] for sample in rows if sample[index] is not None)
+                row[field] = {
+                    'p50': percentile(values, 50),
+                    'p95': percentile(values, 95),
+                    'p99': percentile(values, 99),
+                    'max': values[-1] if values else None,
+                }
+            summary.append(row)
+        return summary
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+            self.counts.clear()
+
+
+view_metrics = ViewMetrics()
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted `values`."""
+    if not values:
+        return None
+    rank = max(0, -(-len(values) * percent // 100) - 1)
+    return values[int(rank)]
+
+
+def instrument_templates():
+    """Time the top-level renders of Django templates (render, render_to_string)."""
+    original = DjangoTemplate.render
+    if getattr(original, 'instrumented', False):
+        return
+
+    def render(self, context=None, request=None):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return original(self, context, request)
+        metrics.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - start
+
+    render.instrumented = True
+    DjangoTemplate.render = render
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_templates()
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        total = time.perf_counter() - start
+
+        if response.streaming:
+            # حجم الاستجابة المتدفقة غير معروف قبل إرسالها، إلا إذا حُدد Content-Length
+            size = int(response['Content-Length']) if response.has_header('Content-Length') else None
+        else:
+            size = len(response.content)
+
+        # التوقيتات تكشف تفاصيل الخادم، فلا تُرسل إلا للموظفين أو أثناء التطوير
+        user = getattr(request, 'user', None)
+        if settings.DEBUG or (user is not None and user.is_staff):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f'tpl;dur={metrics.template_time * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ])
+        if metrics.view:
+            view_metrics.add(metrics.view, (
+                total * 1000, metrics.db_time * 1000, metrics.queries, metrics.template_time * 1000, size,
+            ))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.view = f"{view_func.__module__}.{getattr(view_func, '__name__', type(view_func).__name__)}"
+        return None
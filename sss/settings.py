@@ -32,6 +32,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',  # يجب أن يكون أولاً ليعمل runserver عبر ASGI (WebSockets)
     # 'jazzmin',
     # 'admin_app.apps.AdminAppConfig',
     'admin_app',
@@ -43,9 +44,11 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'import_export',
+    'channels',
 ]
 
 MIDDLEWARE = [
+    'sss.request_metrics.RequestMetricsMiddleware',  # أول middleware حتى يشمل الوقت المقاس كل ما بعده
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,6 +83,27 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'sss.wsgi.application'
+ASGI_APPLICATION = 'sss.asgi.application'
+
+# Channel layer used to fan chat messages out to connected WebSockets.
+# The in-memory layer only works inside a single process; for several workers
+# swap it for a broker-backed layer, e.g.
+# {'BACKEND': 'channels_redis.core.RedisChannelLayer', 'CONFIG': {'hosts': [('127.0.0.1', 6379)]}}
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+# Cache for the library search index version and the library filter facets.
+# The local-memory cache is per process; with several workers use a shared
+# backend so a new upload invalidates every worker, e.g.
+# {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379/1'}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
 
 
 
@@ -144,6 +168,15 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'sss/static')]
 MEDIA_URL = '/media/' # هو الرابط الذي سيُستخدم للوصول إلى الملفات عبر المتصفح.
 MEDIA_ROOT = os.path.join(BASE_DIR, 'sss/media') # هو المسار الفعلي الذي سيتم تخزين الملفات فيه على الخادم.
 
+# ملفات مهام الاستيراد والتصدير (admin_app.jobs): خارج MEDIA_ROOT لأنها تحتوي بيانات شخصية، وتُنزّل من لوحة الإدارة فقط
+JOB_FILES_ROOT = os.path.join(BASE_DIR, 'sss/jobs')
+
+# تنزيل ملفات المكتبة (admin_app.downloads): Django يتحقق من الصلاحية ثم يسلّم إرسال الملف للخادم الأمامي.
+# None: يرسله Django بنفسه، 'X-Accel-Redirect': nginx، 'X-Sendfile': Apache (mod_xsendfile) أو lighttpd
+LIBRARY_DOWNLOAD_OFFLOAD = None
+# مسار location الداخلي (internal) في nginx الذي يشير إلى MEDIA_ROOT
+LIBRARY_DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -169,6 +202,12 @@ LOGIN_URL = 'login'  # اسم URL لصفحة تسجيل الدخول
 
 #loggers
 
+# يطبّق LOGGING ثم يستبدل معالجات الـ loggers بطابور، وخيط واحد يكتب في الملفات
+LOGGING_CONFIG = 'sss.logqueue.configure_logging'
+
+# قاعدة بيانات السجلات المنظمة (ملف لكل يوم) التي يستعلم عنها log_viewer
+LOG_STORE_DIR = os.path.join(BASE_DIR, 'sss/logs', 'records')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,  # نحتفظ بالـ loggers الافتراضية أيضاً
@@ -178,45 +217,65 @@ LOGGING = {
             'datefmt': "%d/%b/%Y %H:%M:%S",
         },
     },
+    'filters': {
+        # يضيف المستخدم ومسار الطلب الحالي إلى كل سجل
+        'request_context': {
+            '()': 'sss.logstore.RequestContextFilter',
+        },
+    },
     'handlers': {
-        # معالج لتطبيق admin_app يُسجل في ملف admin_app.log
+        # كل عمليات Daphne و run_jobs تكتب في نفس الملفات، فالتدوير لا يتم من داخل Python
+        # (RotatingFileHandler يعيد تسمية ملف ما زالت عملية أخرى تكتب فيه). التدوير خارجي،
+        # و WatchedFileHandler يعيد فتح الملف في كل عملية عندما يتغير. مثال logrotate:
+        #   /path/to/sss/logs/*.log {
+        #       size 10M
+        #       rotate 10
+        #       missingok
+        #       notifempty
+        #       create
+        #   }
+        # (create وليس copytruncate، حتى لا تضيع السطور المكتوبة أثناء النسخ)
+        # معالج لتطبيقي admin_app و chat_app يُسجل في ملف admin_app.log (معالج واحد لكل ملف)
         'admin_app_file': {
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(BASE_DIR, 'sss/logs', 'admin_app.log'),
-            'formatter': 'verbose',
-            'level': 'DEBUG',
-        },
-        # معالج لتطبيق chat_app يُسجل في ملف admin_app.log
-        'chat_app_file': {
-            'class': 'logging.FileHandler',
+            'class': 'logging.handlers.WatchedFileHandler',
             'filename': os.path.join(BASE_DIR, 'sss/logs', 'admin_app.log'),
+            'encoding': 'utf-8',
             'formatter': 'verbose',
             'level': 'DEBUG',
         },
         # معالج افتراضي لأي طلب لا ينتمي لتطبيق محدد
         'default_file': {
-            'class': 'logging.FileHandler',
+            'class': 'logging.handlers.WatchedFileHandler',
             'filename': os.path.join(BASE_DIR, 'sss/logs', 'default.log'),
+            'encoding': 'utf-8',
             'formatter': 'verbose',
             'level': 'DEBUG',
         },
+        # نسخة منظمة من كل السجلات (الوقت، المستوى، الـ logger، المستخدم، المسار)
+        'structured_store': {
+            'class': 'sss.logstore.StructuredLogHandler',
+            'directory': LOG_STORE_DIR,
+            'retention_days': 30,
+            'filters': ['request_context'],
+            'level': 'DEBUG',
+        },
     },
     'loggers': {
         # logger خاص بتطبيق admin_app
         'admin_app': {
-            'handlers': ['admin_app_file'],
+            'handlers': ['admin_app_file', 'structured_store'],
             'level': 'DEBUG',
             'propagate': False,  # عدم تمرير الرسائل إلى loggers الأب
         },
         # logger خاص بتطبيق chat_app
         'chat_app': {
-            'handlers': ['chat_app_file'],
+            'handlers': ['admin_app_file', 'structured_store'],
             'level': 'DEBUG',
             'propagate': False,
         },
         # logger افتراضي للمطالب التي لا تتبع لتطبيق محدد
         'default': {
-            'handlers': ['default_file'],
+            'handlers': ['default_file', 'structured_store'],
             'level': 'DEBUG',
             'propagate': False,
         },
@@ -0,0 +1,167 @@
+// Chat room messages: history pages from chat_app.views.message_history and
+// live messages pushed over a WebSocket (chat_app.consumers.ChatRoomConsumer)
+document.addEventListener("DOMContentLoaded", function () {
+    const chatBox = document.getElementById("chat-box");
+    if (!chatBox || !chatBox.dataset.roomId) {
+        return;
+    }
+
+    const roomId = chatBox.dataset.roomId;
+    const currentUserId = chatBox.dataset.userId;
+    const scheme = window.location.protocol === "https:" ? "wss" : "ws";
+    let retryDelay = 1000;
+
+    function escapeHtml(text) {
+        const div = document.createElement("div");
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    // روابط الملفات يبنيها الخادم؛ أي رابط آخر (مثل javascript:) لا يُعرض كرابط
+    function safeFileUrl(url) {
+        try {
+            const parsed = new URL(url, window.location.href);
+            return parsed.origin === window.location.origin ? parsed.href : "#";
+        } catch (error) {
+            return "#";
+        }
+    }
+
+    // إنشاء عنصر الرسالة القادمة من الخادم
+    function buildMessageElement(message) {
+        const isOwnMessage = String(message.sender_id) === String(currentUserId);
+        const messageElement = document.createElement("div");
+        messageElement.className = `mb-4 flex relative ${isOwnMessage ? "justify-end" : "justify-start"}`;
+        messageElement.dataset.serverMessageId = message.id;
+        messageElement.innerHTML = `
+            <div class="max-w-xs p-3 rounded-lg ${isOwnMessage ? "bg-background text-white dark:text-gray-200" : "bg-gray-200 dark:bg-gray-700 text-gray-800 dark:text-gray-200"}">
+                <div class="text-sm font-bold mb-1">${escapeHtml(message.sender)}</div>
+                <div class="break-words whitespace-normal">${message.content_type === "file" ? `
+                    <a href="${escapeHtml(safeFileUrl(message.content))}" download class="flex items-center underline">
+                        <i class="fas fa-file mr-2"></i>
+                        <span>${escapeHtml(message.file_name || "Unnamed File")}</span>
+                        ${message.file_size !== null ? `<span class="ml-2 text-xs">${(message.file_size / 1024).toFixed(2)} KB</span>` : ""}
+                    </a>
+                ` : escapeHtml(message.content)}</div>
+                <div class="text-xs ${isOwnMessage ? "text-gray-300" : "text-gray-500"} dark:text-gray-400 mt-1">
+                    ${new Date(message.timestamp).toLocaleTimeString([], { hour: "2-digit", minute: "2-digit" })}
+                </div>
+            </div>
+        `;
+        return messageElement;
+    }
+
+    // إبلاغ الخادم بأن الرسائل الجديدة قُرئت (مرة واحدة كل ثانيتين كحد أقصى)
+    const readUrl = chatBox.dataset.readUrl;
+    let markReadTimer = null;
+
+    function getCsrfToken() {
+        const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : "";
+    }
+
+    function scheduleMarkRead() {
+        if (!readUrl || markReadTimer || document.hidden) {
+            return;
+        }
+        markReadTimer = setTimeout(function () {
+            markReadTimer = null;
+            fetch(readUrl, { method: "POST", headers: { "X-CSRFToken": getCsrfToken() } })
+                .catch(error => console.error("Error marking room as read:", error));
+        }, 2000);
+    }
+
+    document.addEventListener("visibilitychange", function () {
+        if (!document.hidden) {
+            scheduleMarkRead();
+        }
+    });
+
+    function appendMessage(message) {
+        // تجاهل الرسائل المكررة (مثلاً بعد إعادة الاتصال)
+        if (chatBox.querySelector(`[data-server-message-id="${message.id}"]`)) {
+            return;
+        }
+        const isAtBottom = chatBox.scrollHeight - chatBox.scrollTop - chatBox.clientHeight < 50;
+        chatBox.appendChild(buildMessageElement(message));
+        if (isAtBottom) {
+            chatBox.scrollTo({ top: chatBox.scrollHeight, behavior: "smooth" });
+        }
+        chatBox.dispatchEvent(new CustomEvent("chat:message", { detail: message }));
+    }
+
+    // تحميل سجل الرسائل صفحة بصفحة (الأحدث أولاً ثم الأقدم عند التمرير للأعلى)
+    const historyUrl = chatBox.dataset.historyUrl;
+    let nextCursor = null;
+    let hasMore = true;
+    let loadingHistory = false;
+
+    function loadHistory() {
+        if (!historyUrl || loadingHistory || !hasMore) {
+            return Promise.resolve();
+        }
+        loadingHistory = true;
+        const url = nextCursor ? `${historyUrl}?before=${encodeURIComponent(nextCursor)}` : historyUrl;
+        const isFirstPage = nextCursor === null;
+
+        return fetch(url, { headers: { "X-Requested-With": "XMLHttpRequest" } })
+            .then(response => response.json())
+            .then(data => {
+                const previousHeight = chatBox.scrollHeight;
+                const fragment = document.createDocumentFragment();
+                data.messages.forEach(message => {
+                    if (!chatBox.querySelector(`[data-server-message-id="${message.id}"]`)) {
+                        fragment.appendChild(buildMessageElement(message));
+                    }
+                });
+                chatBox.insertBefore(fragment, chatBox.firstChild);
+
+                if (isFirstPage) {
+                    chatBox.scrollTop = chatBox.scrollHeight;
+                } else {
+                    // الحفاظ على موضع القراءة بعد إضافة الرسائل الأقدم في الأعلى
+                    chatBox.scrollTop += chatBox.scrollHeight - previousHeight;
+                }
+                hasMore = data.has_more;
+                nextCursor = data.next_cursor;
+            })
+            .catch(error => console.error("Error loading chat history:", error))
+            .finally(() => {
+                loadingHistory = false;
+            });
+    }
+
+    chatBox.addEventListener("scroll", function () {
+        if (chatBox.scrollTop < 50) {
+            loadHistory();
+        }
+    });
+
+    function connect() {
+        const socket = new WebSocket(`${scheme}://${window.location.host}/ws/chat/${roomId}/`);
+
+        socket.addEventListener("open", function () {
+            retryDelay = 1000;
+        });
+
+        socket.addEventListener("message", function (event) {
+            const data = JSON.parse(event.data);
+            if (data.type === "message") {
+                appendMessage(data.message);
+                scheduleMarkRead();
+            }
+        });
+
+        socket.addEventListener("close", function (event) {
+            // 4401/4403: غير مسجل أو ليس عضواً في الغرفة، لا داعي لإعادة المحاولة
+            if (event.code === 4401 || event.code === 4403) {
+                return;
+            }
+            setTimeout(connect, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, 30000);
+        });
+    }
+
+    window.chatServerMessages = { buildMessageElement, appendMessage, loadHistory };
+    loadHistory().then(connect);
+});
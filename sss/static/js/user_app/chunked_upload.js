@@ -0,0 +1,132 @@
+// رفع ملفات المكتبة على دفعات: إذا انقطع الاتصال يكمل الرفع من آخر بايت وصل للخادم
+// المتصفحات التي لا تدعم fetch أو crypto.subtle تستخدم الرفع العادي للنموذج
+document.addEventListener('DOMContentLoaded', function () {
+    const form = document.getElementById('upload-form');
+    if (!form || !window.fetch || !window.crypto || !window.crypto.subtle || !Blob.prototype.slice) {
+        return;
+    }
+    const csrfToken = form.querySelector('[name=csrfmiddlewaretoken]').value;
+    const progress = document.getElementById('upload-progress');
+    const progressBar = document.getElementById('upload-progress-bar');
+    const submitButton = form.querySelector('button[type=submit]');
+    const MAX_RETRIES = 8;
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    function showProgress(offset, size) {
+        progress.classList.remove('hidden');
+        progressBar.style.width = (size ? Math.floor(offset * 100 / size) : 0) + '%';
+    }
+
+    async function sha256(file) {
+        const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function request(url, options) {
+        options.headers = Object.assign({'X-CSRFToken': csrfToken}, options.headers || {});
+        options.credentials = 'same-origin';
+        const response = await fetch(url, options);
+        const data = await response.json().catch(() => ({}));
+        return {status: response.status, data: data};
+    }
+
+    // جلسة رفع سابقة لنفس الملف (بعد إعادة تحميل الصفحة مثلاً)
+    async function resumeSession(key) {
+        const saved = JSON.parse(localStorage.getItem(key) || 'null');
+        if (!saved) {
+            return null;
+        }
+        const result = await request(saved.chunk_url, {method: 'GET'}).catch(() => null);
+        if (!result || result.status !== 200) {
+            localStorage.removeItem(key);
+            return null;
+        }
+        saved.offset = result.data.offset;
+        return saved;
+    }
+
+    async function startSession(file) {
+        const body = new FormData();
+        body.append('csrfmiddlewaretoken', csrfToken);
+        body.append('filename', file.name);
+        body.append('size', file.size);
+        body.append('checksum', await sha256(file));
+        body.append('description', form.description.value);
+        body.append('course', form.course.value);
+        const result = await request(form.dataset.chunkedUrl, {method: 'POST', body: body});
+        if (result.status !== 201) {
+            throw new Error(Object.values(result.data.errors || {}).join('\n') || 'The upload could not be started.');
+        }
+        return result.data;
+    }
+
+    async function sendChunks(file, session) {
+        let offset = session.offset;
+        let retries = 0;
+        while (offset < file.size) {
+            const chunk = file.slice(offset, offset + session.chunk_size);
+            let result = null;
+            try {
+                result = await request(session.chunk_url, {
+                    method: 'PUT',
+                    headers: {'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream'},
+                    body: chunk,
+                });
+            } catch (error) {
+                result = null;  // انقطع الاتصال
+            }
+            if (result && result.status === 200) {
+                offset = result.data.offset;
+                retries = 0;
+                showProgress(offset, file.size);
+                continue;
+            }
+            if (result && result.status === 409 || result && result.status === 400 && 'offset' in result.data) {
+                offset = result.data.offset;  // الخادم يحدد من أين نكمل
+                continue;
+            }
+            if (result && result.status < 500) {
+                throw new Error(result.data.error || 'The upload was rejected.');
+            }
+            if (++retries > MAX_RETRIES) {
+                throw new Error('The connection was lost. Submit the form again to resume the upload.');
+            }
+            await sleep(Math.min(1000 * 2 ** retries, 30000));
+            const status = await request(session.chunk_url, {method: 'GET'}).catch(() => null);
+            if (status && status.status === 200) {
+                offset = status.data.offset;
+            }
+        }
+    }
+
+    form.addEventListener('submit', async function (event) {
+        const file = form.file.files[0];
+        if (!file) {
+            return;  // الخادم يعرض رسالة "File is required."
+        }
+        event.preventDefault();
+        submitButton.disabled = true;
+        const key = ['upload', file.name, file.size, file.lastModified].join(':');
+        try {
+            const session = await resumeSession(key) || await startSession(file);
+            localStorage.setItem(key, JSON.stringify(session));
+            showProgress(session.offset, file.size);
+            await sendChunks(file, session);
+            const result = await request(session.finish_url, {method: 'POST'});
+            if (result.status !== 201) {
+                if (result.data.offset === 0) {
+                    localStorage.removeItem(key);  // فشل التحقق من المجموع: يجب الرفع من جديد
+                }
+                throw new Error(result.data.error || 'The upload could not be completed.');
+            }
+            localStorage.removeItem(key);
+            window.location.href = result.data.redirect;
+        } catch (error) {
+            submitButton.disabled = false;
+            Swal.fire({title: 'Upload failed', text: error.message, icon: 'error'});
+        }
+    });
+});